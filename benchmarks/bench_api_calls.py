@@ -0,0 +1,173 @@
+"""Число вызовов Bot API на одну заявку.
+
+Настоящие обработчики бота работают с подменённой сессией, которая отвечает
+мгновенно и считает вызовы по методам — отдельно в чате пользователя и в чатах
+администраторов (--admins). Сценарии (каждый — новый пользователь):
+
+  straight  — анкета целиком и «✅ Подтвердить»;
+  review    — после анкеты дважды «❌ Изменить» → «⬅️ Назад», затем подтверждение;
+  edit      — «❌ Изменить» → «📞 Контактные данные», раздел заново, подтверждение;
+  resubmit  — тот же пользователь отправляет анкету повторно.
+
+Для 3 администраторов результат сравнивается с замером до того, как экран
+подтверждения, меню «Изменить» и сообщения администраторам стали редактироваться
+на месте, а сообщение после шага анкеты — уходить вместе со следующим вопросом
+(BEFORE): вызовов и сообщений в чате не должно стать больше.
+
+«Сообщений в чате» — сколько sendMessage осталось в чате пользователя.
+Кнопки нажимаются на последнем сообщении с инлайн-клавиатурой, как в клиенте.
+
+Пример:
+    python benchmarks/bench_api_calls.py --admins 3
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ["LEADS_PATH"] = os.path.join(_tmp, "leads.sqlite3")
+os.environ["OUTBOX_PATH"] = os.path.join(_tmp, "outbox.sqlite3")
+os.environ["SOS_OUTBOX_PATH"] = os.path.join(_tmp, "sos.sqlite3")
+os.environ["BROADCASTS_PATH"] = os.path.join(_tmp, "broadcasts.sqlite3")
+os.environ["FUNNEL_PATH"] = os.path.join(_tmp, "funnel.log")
+os.environ["REMINDERS_PATH"] = os.path.join(_tmp, "reminders.sqlite3")
+os.environ["NOTIFY_PER_CHAT_RATE"] = "1000"
+os.environ["FLOOD_RATE"] = "1000"
+os.environ["FLOOD_BURST"] = "1000"
+ADMINS = [1001, 1002, 1003]
+if "--admins" in sys.argv:
+    ADMINS = list(range(1001, 1001 + int(sys.argv[sys.argv.index("--admins") + 1])))
+os.environ["ADMIN_IDS"] = ",".join(map(str, ADMINS))
+
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, InlineKeyboardMarkup, Message, Update, User  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+
+ANSWERS = [
+    "/start", "Аренда", "Частично доволен", "Квартира", "В центре города", "5-10 млн ₽", "Готов(а) к сделке",
+    "Да, уже одобрена", "В ближайший месяц", "Иван", "Telegram", "В любое время", "+7 999 123-45-67",
+]
+CONTACTS = ["Пётр", "Телефон", "Вечер (18:00-21:00)", "8 (912) 345-67-89"]
+SCENARIOS = {
+    "straight": ANSWERS + ["✅ Подтвердить"],
+    "review": ANSWERS + ["❌ Изменить", "⬅️ Назад", "❌ Изменить", "⬅️ Назад", "✅ Подтвердить"],
+    "edit": ANSWERS + ["❌ Изменить", "📞 Контактные данные", *CONTACTS, "✅ Подтвердить"],
+}
+# Вызовы и сообщения в чате пользователя до редактирования сообщений на месте (3 администратора)
+BEFORE = {"straight": (19, 15), "review": (27, 19), "edit": (27, 21), "resubmit": (19, 15)}
+BUTTONS = {"✅ Подтвердить", "❌ Изменить", "⬅️ Назад", "📞 Контактные данные"}
+
+
+# Сессия Bot API: отвечает мгновенно, считает вызовы и помнит последнее сообщение с инлайн-кнопками
+class CountingSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.calls = defaultdict(Counter)
+        self.message_ids = 0
+        self.keyboards = {}
+        # Время последнего редактирования сообщения (приходит в нажатии кнопки, как в Telegram)
+        self.edit_dates = {}
+        # Чат, в котором нажата кнопка (answerCallbackQuery не содержит chat_id)
+        self.chat_id = None
+
+    async def make_request(self, bot, method, timeout=None):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None:
+            self.calls[int(chat_id)][method.__api_method__] += 1
+        if method.__api_method__ == "answerCallbackQuery":
+            self.calls[self.chat_id][method.__api_method__] += 1
+            return True
+        if method.__api_method__ not in ("sendMessage", "editMessageText"):
+            return True
+        if method.__api_method__ == "sendMessage":
+            self.message_ids += 1
+            message_id = self.message_ids
+        else:
+            message_id = method.message_id
+            self.edit_dates[message_id] = self.edit_dates.get(message_id, int(time.time())) + 1
+        if isinstance(method.reply_markup, InlineKeyboardMarkup):
+            self.keyboards[int(chat_id)] = message_id
+        return Message(message_id=message_id, date=datetime.now(), chat=Chat(id=int(chat_id), type="private"),
+                       text=method.text)
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+async def play(session, user_id, inputs, update_id):
+    bot, dp = bot_module.bot, bot_module.dp
+    user = User(id=user_id, is_bot=False, first_name="Иван")
+    chat = Chat(id=user_id, type="private")
+    for text in inputs:
+        update_id += 1
+        if text == ANSWERS[-1]:
+            # У каждого пользователя свой телефон, иначе заявки объединятся как повторные
+            text = f"+7 999 {user_id:03d}-45-67"
+        if text in BUTTONS:
+            session.chat_id = user_id
+            message_id = session.keyboards[user_id]
+            message = Message(message_id=message_id, date=datetime.now(), chat=chat, text="…",
+                              edit_date=session.edit_dates.get(message_id))
+            update = Update(update_id=update_id, callback_query=CallbackQuery(
+                id=str(update_id), from_user=user, chat_instance="1", data=text, message=message))
+        else:
+            update = Update(update_id=update_id, message=Message(
+                message_id=update_id, date=datetime.now(), chat=chat, from_user=user, text=text))
+        await dp.feed_update(bot, update)
+    await bot_module.outbox.drain_once()
+    return update_id
+
+
+def report(name, session, user_id):
+    user = session.calls.pop(user_id, Counter())
+    admins = Counter()
+    for admin_id in ADMINS:
+        admins.update(session.calls.pop(admin_id, Counter()))
+    session.calls.clear()
+    total = sum(user.values()) + sum(admins.values())
+    methods = ", ".join(f"{method}={count}" for method, count in sorted((user + admins).items()))
+    before = "{:>2} → {:>2} / {:>2} → {:>2}".format(*sum(zip(BEFORE[name], (total, user["sendMessage"])), ()))
+    print(f"{name:<9} {total:>5} {sum(user.values()):>5} {sum(admins.values()):>6} {user['sendMessage']:>9}   "
+          f"{before if len(ADMINS) == 3 else '':<17}   {methods}")
+    return total, user["sendMessage"]
+
+
+async def main(args):
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    session = CountingSession()
+    bot_module.bot.session = session
+    await bot_module.duplicates.load()
+
+    print(f"admins: {len(ADMINS)}")
+    print(f"{'scenario':<9} {'calls':>5} {'user':>5} {'admins':>6} {'messages':>9}   {'before → after':<17}   by method")
+    totals = {}
+    for user_id, (name, inputs) in enumerate(SCENARIOS.items(), start=1):
+        await play(session, user_id, inputs, user_id * 1000)
+        totals[name] = report(name, session, user_id)
+    await play(session, 1, SCENARIOS["straight"], 9000)
+    totals["resubmit"] = report("resubmit", session, 1)
+    if len(ADMINS) == 3:
+        for name, (calls, messages) in totals.items():
+            assert calls <= BEFORE[name][0] and messages <= BEFORE[name][1], (name, calls, messages)
+        assert totals["review"][1] == totals["straight"][1], "«Изменить» → «Назад» не должны добавлять сообщений"
+
+    await bot_module.outbox.close()
+    await bot_module.lead_store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--admins", type=int, default=3, help="администраторов, получающих заявки")
+    asyncio.run(main(parser.parse_args()))
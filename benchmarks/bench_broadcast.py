@@ -0,0 +1,251 @@
+"""Рассылка /broadcast по архиву заявок: выбор получателей, скорость, память и продолжение после сбоя.
+
+Архив заполняется --leads заявками (как в bench_leads.py, у каждой свой клиент), ещё
+--repeats клиентов отправили заявку повторно — рассылку они должны получить один раз.
+
+1. Выбор получателей: время создания рассылки (INSERT ... SELECT из архива в базу
+   рассылок) для всех клиентов, по типу и по типу с бюджетом — с составным индексом
+   leads_type_budget и без него.
+2. Отправка всем клиентам: заглушка Bot API в отдельном процессе отвечает через
+   --latency секунд, доля --blocked чатов отвечает 403 (бот заблокирован), сообщения
+   считаются по чатам. Рассылка идёт в отдельном процессе с лимитом --rate сообщений
+   в секунду; после доли --kill-at сообщений процесс убивается SIGKILL, и второй процесс
+   продолжает рассылку с контрольной точки. Для обоих выводятся время, сообщений в
+   секунду и пиковый RSS. Проверяется, что сообщение получил каждый клиент, повторно —
+   не больше BROADCAST_BATCH_SIZE человек, а счётчики рассылки совпадают с заглушкой.
+
+Пример:
+    python benchmarks/bench_broadcast.py --leads 500000
+    python benchmarks/bench_broadcast.py --leads 100000 --rate 1000 --kill-at 0.3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiohttp import ClientSession, web  # noqa: E402
+
+TEXT = "🏠 Новый ЖК у метро: квартиры от 4,2 млн ₽"
+ADMIN = 42
+
+
+# Заглушка Bot API: sendMessage с задержкой, 403 для заблокированных чатов, число
+# сообщений по чатам (клиенты — чаты 0..leads-1). GET /stats — сводка по чатам
+class FakeTelegram:
+    def __init__(self, leads, latency, blocked):
+        self.latency = latency
+        self.blocked_share = int(blocked * 100)
+        self.received = bytearray(leads)
+        self.blocked_total = sum(1 for chat_id in range(leads) if self.blocked(chat_id))
+
+    def blocked(self, chat_id):
+        return chat_id % 100 < self.blocked_share
+
+    async def stats(self, request: web.Request) -> web.Response:
+        received = self.received
+        reached = len(received) - received.count(0)
+        return web.json_response({
+            "messages": sum(received),
+            "reached": reached,
+            "repeated": sum(received) - reached,
+            "blocked": self.blocked_total,
+        })
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "fake"}})
+        chat_id = int(data["chat_id"])
+        if chat_id < len(self.received):
+            self.received[chat_id] = min(self.received[chat_id] + 1, 255)
+        if self.blocked(chat_id):
+            return web.json_response({"ok": False, "error_code": 403,
+                                      "description": "Forbidden: bot was blocked by the user"}, status=403)
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": data["text"],
+        }})
+
+
+def serve(port, leads, latency, blocked):
+    # Запросы, оборванные убитым процессом рассылки, — не ошибка замера
+    logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)
+    fake = FakeTelegram(leads, latency, blocked)
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", fake.handle)
+    app.router.add_get("/stats", fake.stats)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None, backlog=1024)
+
+
+def rss_peak_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def seed_archive(path, leads, repeats):
+    from bench_leads import seed
+    from leads import LEAD_FIELDS
+
+    seed(path, leads)
+    db = sqlite3.connect(path)
+    columns = ", ".join(("created_at", "user_id", "username", *LEAD_FIELDS))
+    with db:
+        db.execute(f"INSERT INTO leads ({columns}) SELECT {columns} FROM leads ORDER BY id DESC LIMIT ?", (repeats,))
+    db.close()
+
+
+# Время создания рассылки по фильтрам; рассылка сразу отменяется
+async def select_recipients(args, tmp):
+    from broadcast import Broadcaster
+
+    broadcaster = Broadcaster(None, path=os.path.join(tmp, "select.sqlite3"), leads_path=args.path)
+    db = sqlite3.connect(args.path)
+    print(f"{'filters':<34} {'index':<10} {'recipients':>10} {'ms':>8}")
+    for composite in (True, False):
+        if not composite:
+            db.execute("DROP INDEX leads_type_budget")
+        for description, filters in (
+            ("все клиенты", {}),
+            ("type=Квартира", {"property_type": "Квартира"}),
+            ("type=Квартира; budget=3-5 млн ₽", {"property_type": "Квартира", "budget": "3-5 млн ₽"}),
+        ):
+            started = time.perf_counter()
+            broadcast = await broadcaster.create(ADMIN, TEXT, filters, description)
+            elapsed = time.perf_counter() - started
+            await broadcaster.cancel(broadcast["id"])
+            print(f"{description:<34} {'composite' if composite else 'single':<10} {broadcast['total']:>10} {elapsed * 1000:>8.0f}")
+            if not filters:
+                assert broadcast["total"] == args.leads, "клиент с несколькими заявками должен попасть в рассылку один раз"
+    db.close()
+    # Индекс возвращает LeadStore
+    from leads import LeadStore
+    await LeadStore(args.path).close()
+    await broadcaster.close()
+
+
+# Процесс рассылки: создаёт рассылку всем клиентам (или продолжает начатую) и ждёт её конца
+async def send(args):
+    from aiogram import Bot
+
+    from broadcast import RUNNING, Broadcaster
+    from session import create_bot_session
+
+    finished = asyncio.Event()
+    result = {}
+
+    async def on_finish(broadcast):
+        result.update(broadcast)
+        finished.set()
+
+    bot = Bot(os.environ["BOT_TOKEN"], session=create_bot_session())
+    broadcaster = Broadcaster(bot, path=args.broadcasts, leads_path=args.path, rate=args.rate, on_finish=on_finish)
+    started = time.perf_counter()
+    running = [broadcast for broadcast in await broadcaster.recent(1) if broadcast["status"] == RUNNING]
+    if not running:
+        broadcast = await broadcaster.create(ADMIN, TEXT, {}, "")
+        print(json.dumps({"created": time.perf_counter() - started, "total": broadcast["total"]}), flush=True)
+    broadcaster.start()
+    await finished.wait()
+    elapsed = time.perf_counter() - started
+    await broadcaster.close()
+    await bot.session.close()
+    print(json.dumps({"elapsed": elapsed, "rss": rss_peak_mb(), "broadcast": result}), flush=True)
+
+
+def start_sender(args, env):
+    command = [sys.executable, __file__, "--role", "send", "--path", args.path, "--broadcasts", args.broadcasts,
+               "--rate", str(args.rate), "--leads", str(args.leads)]
+    return subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True)
+
+
+def sender_output(process):
+    output, _ = process.communicate()
+    return process.returncode, [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+
+async def stats(port):
+    async with ClientSession() as http:
+        async with http.get(f"http://127.0.0.1:{port}/stats") as response:
+            return await response.json()
+
+
+def main(args):
+    tmp = tempfile.mkdtemp()
+    args.path = args.path or os.path.join(tmp, "leads.sqlite3")
+    args.broadcasts = os.path.join(tmp, "broadcasts.sqlite3")
+    seed_archive(args.path, args.leads, args.repeats)
+    print(f"leads={args.leads} (+{args.repeats} repeated) rate={args.rate:.0f}/s latency={args.latency * 1000:.0f} ms "
+          f"blocked={args.blocked:.0%}")
+    asyncio.run(select_recipients(args, tmp))
+
+    server = multiprocessing.Process(target=serve, args=(args.api_port, args.leads, args.latency, args.blocked), daemon=True)
+    server.start()
+    time.sleep(1)
+    env = dict(os.environ, TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}")
+    try:
+        # Первый процесс убивается посреди рассылки, когда заглушка получила долю --kill-at сообщений
+        process = start_sender(args, env)
+        while process.poll() is None and asyncio.run(stats(args.api_port))["messages"] < args.leads * args.kill_at:
+            time.sleep(0.05)
+        process.send_signal(signal.SIGKILL)
+        code, lines = sender_output(process)
+        before = asyncio.run(stats(args.api_port))
+        print(f"sender 1: created {lines[0]['total']} recipients in {lines[0]['created']:.1f} s, "
+              f"killed (exit {code}) after {before['messages']} messages")
+        assert code == -signal.SIGKILL, "рассылка закончилась раньше, чем процесс был убит"
+
+        code, lines = sender_output(start_sender(args, env))
+        after = asyncio.run(stats(args.api_port))
+        result = lines[-1]
+        broadcast = result["broadcast"]
+        sent = after["messages"] - before["messages"]
+        print(f"sender 2: resumed and sent {sent} messages in {result['elapsed']:.1f} s "
+              f"({sent / result['elapsed']:,.0f}/s), peak RSS {result['rss']:.0f} MB")
+        print(f"broadcast: total {broadcast['total']}, delivered {broadcast['delivered']}, "
+              f"blocked {broadcast['blocked']}, failed {broadcast['failed']}")
+        print(f"fake API: reached {after['reached']} of {args.leads} chats, {after['repeated']} repeated after the crash")
+        hours = args.leads / 20 / 3600
+        print(f"at the default BROADCAST_RATE=20 the same broadcast takes {hours:.1f} h")
+    finally:
+        server.terminate()
+
+    from config import BROADCAST_BATCH_SIZE
+    assert code == 0
+    assert after["reached"] == args.leads, "сообщение должен получить каждый клиент"
+    assert after["repeated"] <= BROADCAST_BATCH_SIZE, "после сбоя повторяется не больше одной пачки"
+    assert broadcast["blocked"] == after["blocked"]
+    assert broadcast["delivered"] + broadcast["blocked"] + broadcast["failed"] == broadcast["total"] == args.leads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=500_000, help="клиентов в архиве")
+    parser.add_argument("--repeats", type=int, default=10_000, help="клиентов с повторной заявкой")
+    parser.add_argument("--path", help="архив заявок (по умолчанию — во временном каталоге; дополняется до --leads)")
+    parser.add_argument("--rate", type=float, default=100_000, help="сообщений в секунду (BROADCAST_RATE)")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответов заглушки, секунды")
+    parser.add_argument("--blocked", type=float, default=0.05, help="доля клиентов, заблокировавших бота")
+    parser.add_argument("--kill-at", type=float, default=0.5, help="после какой доли отправленных сообщений убить первый процесс рассылки")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--role", choices=["send"], help=argparse.SUPPRESS)
+    parser.add_argument("--broadcasts", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.role == "send":
+        asyncio.run(send(args))
+    else:
+        main(args)
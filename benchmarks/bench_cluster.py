@@ -0,0 +1,234 @@
+"""Нагрузочный тест кластера (cluster.py): масштабирование от 1 до N процессов.
+
+1. Кольцо консистентного хеширования: равномерность распределения чатов,
+   при падении процесса переезжают только его чаты, после возвращения —
+   прежнее распределение.
+2. Для каждого значения --workers запускается cluster.py с заглушкой Bot API
+   (из loadgen.py); --users пользователей параллельно проходят анкету целиком
+   через webhook супервизора. Выводятся пропускная способность и ускорение
+   относительно одного процесса.
+3. Падение процесса: один рабочий процесс убивается SIGKILL, и сразу после
+   этого новые пользователи проходят анкету — все должны дойти до подтверждения,
+   а упавший процесс — перезапуститься.
+
+Близкое к линейному ускорение видно только на машине, где ядер больше, чем
+рабочих процессов (супервизору и генератору нагрузки нужны свои ядра).
+
+Пример:
+    python benchmarks/bench_cluster.py --workers 1 2 4 --users 300
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from aiohttp import ClientSession, web
+
+from loadgen import ROOT, SECRET, TOKEN, FakeTelegram
+
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", TOKEN)
+
+from cluster import HashRing, shard_key  # noqa: E402
+
+ANSWERS = [
+    "/start", "Аренда", "Частично доволен", "Квартира", "В центре города", "5-10 млн ₽", "Готов(а) к сделке",
+    "Да, уже одобрена", "В ближайший месяц", "Иван", "Telegram", "В любое время", "+7 999 123-45-67",
+]
+CONFIRM_TEXT = "Всё верно?"
+
+
+# Заглушка Bot API, которая отмечает чаты, дошедшие до подтверждения анкеты
+class QuestionnaireTelegram(FakeTelegram):
+    def __init__(self):
+        super().__init__()
+        self.confirmed = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if request.match_info["method"] != "sendMessage":
+            return await super().handle(request)
+        data = await request.post()
+        chat_id = int(data["chat_id"])
+        if CONFIRM_TEXT in data.get("text", ""):
+            self.confirmed.add(chat_id)
+            if len(self.confirmed) >= self.expected:
+                self.done.set()
+        return self.ok({"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}})
+
+
+def message_update(update_id, chat_id, text):
+    update = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+    if text.startswith("/"):
+        update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return update
+
+
+def check_ring(workers):
+    keys = range(1_000_000, 1_100_000)
+    ring = HashRing(range(workers))
+    owners = {key: ring.get(key) for key in keys}
+    shares = Counter(owners.values())
+    imbalance = max(shares.values()) / (len(keys) / workers)
+    print(f"ring: {workers} workers, max share {imbalance:.2f}x of ideal")
+    assert imbalance < 1.35
+
+    ring.remove(0)
+    moved = [key for key in keys if ring.get(key) != owners[key]]
+    assert all(owners[key] == 0 for key in moved) and len(moved) == shares[0]
+    ring.add(0)
+    assert all(ring.get(key) == owners[key] for key in keys)
+
+    callback = {"update_id": 1, "callback_query": {"id": "1", "from": {"id": 5}, "message": {"chat": {"id": 7}}}}
+    assert shard_key(message_update(1, 42, "hi")) == 42 and shard_key(callback) == 7
+    print(f"ring: worker death moves only its {len(moved)} of {len(keys)} chats")
+
+
+def worker_pids(pid):
+    pids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as children:
+            pids.extend(int(child) for child in children.read().split())
+    return pids
+
+
+class Cluster:
+    def __init__(self, workers, args, tmp):
+        self.workers = workers
+        self.args = args
+        self.env = dict(
+            os.environ,
+            BOT_TOKEN=TOKEN,
+            BOT_WORKERS=str(workers),
+            TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+            WEBHOOK_URL=f"http://127.0.0.1:{args.webhook_port}",
+            WEBHOOK_PORT=str(args.webhook_port),
+            WEBHOOK_SECRET=SECRET,
+            CLUSTER_BASE_PORT=str(args.cluster_base_port),
+            METRICS_PORT="0",
+            ADMIN_IDS="",
+            FSM_STORAGE="memory",
+            # Пользователи отвечают мгновенно: защита от флуда не должна их отбрасывать
+            FLOOD_RATE="1000",
+            FLOOD_BURST="1000",
+            LEADS_PATH=os.path.join(tmp, f"leads{workers}.sqlite3"),
+            OUTBOX_PATH=os.path.join(tmp, f"outbox{workers}.sqlite3"),
+            SOS_OUTBOX_PATH=os.path.join(tmp, f"sos{workers}.sqlite3"),
+            BROADCASTS_PATH=os.path.join(tmp, f"broadcasts{workers}.sqlite3"),
+            FUNNEL_PATH=os.path.join(tmp, f"funnel{workers}.log"),
+            REMINDERS_PATH=os.path.join(tmp, f"reminders{workers}.sqlite3"),
+        )
+        self.process = None
+
+    async def __aenter__(self):
+        self.fake = QuestionnaireTelegram()
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.fake.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.args.api_port).start()
+        self.process = subprocess.Popen([sys.executable, "cluster.py"], cwd=ROOT, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        await asyncio.wait_for(self.fake.ready.wait(), timeout=60)
+        # setWebhook вызывается при старте приложения, порт открывается сразу после него
+        while True:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.args.webhook_port)
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+        writer.close()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.process.terminate()
+        self.process.wait()
+        await self.runner.cleanup()
+
+    # Все пользователи параллельно, ответы каждого — по очереди; возвращает число обновлений в секунду
+    async def walk(self, users, first_chat):
+        self.fake.done.clear()
+        self.fake.confirmed.clear()
+        self.fake.expected = users
+        url = f"http://127.0.0.1:{self.args.webhook_port}/"
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async with ClientSession() as http:
+            async def user(chat_id):
+                async with semaphore:
+                    for index, text in enumerate(ANSWERS):
+                        update = message_update(chat_id * 100 + index, chat_id, text)
+                        async with http.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                            response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user(first_chat + chat) for chat in range(users)))
+            await asyncio.wait_for(self.fake.done.wait(), timeout=self.args.timeout)
+            return users * len(ANSWERS) / (time.perf_counter() - started)
+
+
+async def check_failover(args, tmp):
+    workers = max(max(args.workers), 2)
+    async with Cluster(workers, args, tmp) as cluster:
+        await cluster.walk(args.users // 4 or 1, 10_000_000)
+        pids = worker_pids(cluster.process.pid)
+        assert len(pids) == workers, pids
+        os.kill(pids[0], signal.SIGKILL)
+        await cluster.walk(args.users, 20_000_000)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline and len(set(worker_pids(cluster.process.pid)) - {pids[0]}) < workers:
+            await asyncio.sleep(0.2)
+        restarted = set(worker_pids(cluster.process.pid)) - set(pids)
+        print(f"failover: killed pid {pids[0]}, {args.users} users confirmed on survivors, restarted as {sorted(restarted)}")
+        assert restarted
+
+
+async def main(args):
+    for workers in sorted({workers for workers in args.workers if workers > 1} | {2, 4}):
+        check_ring(workers)
+
+    tmp = tempfile.mkdtemp()
+    print(f"cpu cores: {os.cpu_count()}")
+    print(f"{'workers':>7} {'updates/s':>10} {'speedup':>8} {'efficiency':>10}")
+    baseline = None
+    for workers in args.workers:
+        async with Cluster(workers, args, tmp) as cluster:
+            await cluster.walk(args.users // 10 or 1, 1_000_000)
+            rate = await cluster.walk(args.users, 2_000_000)
+        baseline = baseline or rate / workers
+        speedup = rate / baseline
+        print(f"{workers:>7} {rate:>10.0f} {speedup:>7.2f}x {speedup / workers:>9.0%}")
+
+    if args.kill:
+        await check_failover(args, tmp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=300, help="пользователей, проходящих анкету")
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременно отвечающих пользователей")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8090)
+    parser.add_argument("--cluster-base-port", type=int, default=8100,
+                        help="порт первого рабочего процесса (CLUSTER_BASE_PORT), следующие — по порядку")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--no-kill", dest="kill", action="store_false", help="не проверять падение процесса")
+    args = parser.parse_args()
+    workers = range(args.cluster_base_port, args.cluster_base_port + max(args.workers))
+    if args.api_port in workers or args.webhook_port in workers:
+        parser.error(f"порты рабочих процессов {workers.start}-{workers.stop - 1} пересекаются с --api-port или --webhook-port")
+    asyncio.run(main(args))
@@ -0,0 +1,180 @@
+"""Бенчмарк индекса повторных заявок (dedup.py).
+
+1. Архив заполняется --leads синтетическими заявками за год (как в bench_leads.py),
+   индекс строится по заявкам из окна --window: замеряются время построения и память.
+2. Поиск для --lookups новых клиентов (фильтр Блума отвечает «нет» без запроса
+   к базе), для повторных клиентов из окна и для новых клиентов без фильтра —
+   только запрос к индексам SQLite. Доля ложных срабатываний фильтра должна
+   быть не выше расчётной с запасом.
+3. Повторная отправка анкеты через настоящие обработчики бота: администратор
+   получает одно сообщение (sendMessage), а повторная заявка того же клиента —
+   и с того же аккаунта, и с другого аккаунта с тем же телефоном — редактирует
+   его (editMessageText). В архиве остаётся одна заявка с числом отправок 3.
+
+Пример:
+    python benchmarks/bench_dedup.py --leads 1000000 --lookups 20000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ["LEADS_PATH"] = os.path.join(_tmp, "leads.sqlite3")
+os.environ["OUTBOX_PATH"] = os.path.join(_tmp, "outbox.sqlite3")
+os.environ["SOS_OUTBOX_PATH"] = os.path.join(_tmp, "sos.sqlite3")
+os.environ["BROADCASTS_PATH"] = os.path.join(_tmp, "broadcasts.sqlite3")
+os.environ["FUNNEL_PATH"] = os.path.join(_tmp, "funnel.log")
+os.environ["REMINDERS_PATH"] = os.path.join(_tmp, "reminders.sqlite3")
+os.environ["ADMIN_IDS"] = "1001"
+os.environ["NOTIFY_PER_CHAT_RATE"] = "1000"
+os.environ["FLOOD_RATE"] = "1000"
+os.environ["FLOOD_BURST"] = "1000"
+
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import EditMessageText, SendMessage  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+from bench_leads import seed  # noqa: E402
+from dedup import DuplicateIndex  # noqa: E402
+from leads import LeadStore  # noqa: E402
+
+ANSWERS = [
+    "/start", "Аренда", "Частично доволен", "Квартира", "В центре города", "5-10 млн ₽", "Готов(а) к сделке",
+    "Да, уже одобрена", "В ближайший месяц", "Иван", "Telegram", "В любое время", "+7 999 123-45-67",
+]
+ADMIN_ID = 1001
+
+
+# Сессия Bot API, которая отвечает мгновенно и считает вызовы по (методу, чату)
+class CountingSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.calls = Counter()
+        self.message_ids = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, (SendMessage, EditMessageText)):
+            chat_id = int(method.chat_id)
+            self.calls[type(method).__name__, chat_id] += 1
+            if isinstance(method, SendMessage):
+                self.message_ids += 1
+                message_id = self.message_ids
+            else:
+                message_id = method.message_id
+            return Message(message_id=message_id, date=datetime.now(), chat=Chat(id=chat_id, type="private"),
+                           text=method.text)
+        return True
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+async def timed(name, func, cases):
+    started = time.perf_counter()
+    results = [await func(*case) for case in cases]
+    elapsed = time.perf_counter() - started
+    print(f"{name:<28} {elapsed / len(cases) * 1e6:8.1f} us/lookup")
+    return results, elapsed
+
+
+async def check_index(args):
+    path = os.path.join(_tmp, "seed.sqlite3")
+    seed(path, args.leads)
+    since = int(time.time()) - args.window
+    with sqlite3.connect(path) as db:
+        recent = db.execute(
+            "SELECT phone, user_id FROM leads WHERE created_at >= ? ORDER BY random() LIMIT ?", (since, args.lookups)
+        ).fetchall()
+
+    store = LeadStore(path)
+    index = DuplicateIndex(store, window=args.window)
+    started = time.perf_counter()
+    await index.load()
+    print(f"load: {index._filter.count} keys from {await store.count_recent(since)} leads in window "
+          f"in {time.perf_counter() - started:.2f} s, {index.nbytes / 2 ** 20:.2f} MB")
+
+    rng = random.Random(1)
+    new = [(f"79{rng.randrange(10 ** 9):09d}", args.leads + 1 + number) for number in range(args.lookups)]
+    found, bloom_time = await timed("new client (bloom)", index.find, new)
+    false_positives = index.lookups
+    found_db, db_time = await timed("new client (sqlite only)", lambda phone, user_id: store.find_recent(phone, user_id, since), new)
+    repeat, _ = await timed("repeat client", index.find, recent)
+    await store.close()
+
+    rate = false_positives / len(new)
+    print(f"false positives: {false_positives} of {len(new)} ({rate:.2%}), "
+          f"bloom skips the query {db_time / bloom_time:.1f}x faster")
+    # Номера случайные: редкие совпадения с архивом — настоящие повторы, а не ложные срабатывания
+    assert found == found_db
+    assert all(lead_id is not None for lead_id in repeat)
+    assert rate <= index.error_rate * 3, rate
+    assert bloom_time < db_time
+
+
+def message_update(update_id, user_id, text):
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Иван"), text=text))
+
+
+async def submit(user_id, update_id):
+    bot, dp = bot_module.bot, bot_module.dp
+    for text in ANSWERS:
+        update_id += 1
+        await dp.feed_update(bot, message_update(update_id, user_id, text))
+    update_id += 1
+    chat = Chat(id=user_id, type="private")
+    call = CallbackQuery(id=str(update_id), from_user=User(id=user_id, is_bot=False, first_name="Иван"),
+                         chat_instance="1", data="✅ Подтвердить",
+                         message=Message(message_id=update_id, date=datetime.now(), chat=chat, text="Всё верно?"))
+    await dp.feed_update(bot, Update(update_id=update_id, callback_query=call))
+    await bot_module.outbox.drain_once()
+    return update_id
+
+
+async def check_resubmission():
+    session = CountingSession()
+    bot_module.bot.session = session
+    await bot_module.duplicates.load()
+
+    await submit(501, 0)
+    assert session.calls["SendMessage", ADMIN_ID] == 1 and session.calls["EditMessageText", ADMIN_ID] == 0
+    # Тот же аккаунт, затем другой аккаунт с тем же телефоном
+    await submit(501, 1000)
+    await submit(502, 2000)
+    sent, edited = session.calls["SendMessage", ADMIN_ID], session.calls["EditMessageText", ADMIN_ID]
+    leads = await bot_module.lead_store.search(limit=10)
+    print(f"resubmission: admin got {sent} sendMessage + {edited} editMessageText for 3 submissions, "
+          f"{len(leads)} lead(s) with {leads[0]['submissions']} submissions")
+    assert (sent, edited) == (1, 2)
+    assert len(leads) == 1 and leads[0]["submissions"] == 3
+    await bot_module.outbox.close()
+    await bot_module.lead_store.close()
+
+
+async def main(args):
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    await check_index(args)
+    await check_resubmission()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1_000_000, help="заявок в архиве")
+    parser.add_argument("--window", type=int, default=30 * 86400, help="окно поиска повторов, с")
+    parser.add_argument("--lookups", type=int, default=20_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,304 @@
+"""Сквозной нагрузочный тест: виртуальные пользователи проходят анкету в настоящем bot.py.
+
+bot.py (или cluster.py при --mode cluster) запускается отдельным процессом и
+обращается к заглушке Bot API из fake_telegram.py. Каждый виртуальный пользователь
+проходит анкету целиком по случайному сценарию: иногда выбирает «Другое» и пишет
+ответ текстом, нажимает «⬅️ Назад», отвечает не из вариантов, отправляет телефон
+контактом, а на экране подтверждения нажимает «❌ Изменить» и возвращается назад или
+заново заполняет контактные данные. После каждого действия пользователь ждёт ответ
+бота и проверяет, что это ожидаемый вопрос.
+
+Выводятся пропускная способность (действий и заявок в секунду), процентили задержки
+по шагам (от доставки обновления до ответа бота), ошибки (нет ответа за --step-timeout
+или ответ не тот), вызовы Bot API и доставка заявок администраторам. Без --p429 ошибок
+быть не должно; с --p429 ответы пользователю, получившие 429, теряются (aiogram их
+не повторяет), а уведомления администраторам досылаются с повторами.
+
+Пример:
+    python benchmarks/bench_e2e.py --mode polling --users 1000 --concurrency 100
+    python benchmarks/bench_e2e.py --mode webhook --users 5000 --concurrency 500 --latency 0.05 --p429 0.01
+    python benchmarks/bench_e2e.py --mode cluster --workers 4 --users 5000 --concurrency 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from fake_telegram import FakeBotAPI, callback_update, contact_update, inline_buttons, text_update
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TOKEN = "123456:E2E"
+SECRET = "e2e-secret"
+ADMINS = [9_000_001, 9_000_002]
+FIRST_CHAT = 1_000_000
+
+os.environ.setdefault("BOT_TOKEN", TOKEN)
+
+from keyboards import BACK_BUTTON, REPLY_LAYOUTS  # noqa: E402
+from questionnaire import EDIT_SECTIONS, FIRST_STEP, STEPS  # noqa: E402
+
+CONFIRM_TEXT = "Всё верно?"
+EDIT_TEXT = "Какие данные вы хотели бы изменить?"
+DONE_TEXT = "Спасибо!"
+CONTACTS_SECTION = "📞 Контактные данные"
+# Ответы текстом для шагов без вариантов и после «Другое»
+FREE_TEXT = {
+    "residence": "Общежитие",
+    "location": "Рядом с метро",
+    "name": "Иван",
+    "contact_method": "Viber",
+    "contact_time": "После 19:00",
+}
+
+
+class ScenarioError(Exception):
+    pass
+
+
+# Результаты прогона: задержки по шагам и ошибки
+class Stats:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.timeouts = Counter()
+        self.unexpected = Counter()
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def actions(self) -> int:
+        return sum(len(values) for values in self.latency.values()) + self.errors
+
+    @property
+    def errors(self) -> int:
+        return sum(self.timeouts.values()) + sum(self.unexpected.values())
+
+
+class VirtualUser:
+    def __init__(self, api: FakeBotAPI, chat_id: int, rng: random.Random, stats: Stats, args):
+        self.api = api
+        self.chat_id = chat_id
+        self.rng = rng
+        self.stats = stats
+        self.args = args
+        self.inbox = api.subscribe(chat_id)
+        self.screen = None  # последнее сообщение бота с инлайн-кнопками
+
+    # Действие пользователя и ожидание ответа бота, в котором должен быть текст expect
+    async def act(self, label: str, update: dict, expect: str):
+        if self.args.think:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think))
+        started = time.perf_counter()
+        await self.api.deliver(update)
+        try:
+            reply = await asyncio.wait_for(self.inbox.get(), timeout=self.args.step_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts[label] += 1
+            raise ScenarioError(f"{label}: нет ответа")
+        self.stats.latency[label].append(time.perf_counter() - started)
+        if inline_buttons(reply):
+            self.screen = reply
+        if expect not in reply["text"]:
+            self.stats.unexpected[label] += 1
+            raise ScenarioError(f"{label}: ожидали «{expect}», получили «{reply['text'][:80]}»")
+
+    async def say(self, label: str, text: str, expect: str):
+        await self.act(label, text_update(self.api.next_update_id(), self.chat_id, text), expect)
+
+    async def press(self, label: str, button: str, expect: str):
+        if self.screen is None or button not in inline_buttons(self.screen):
+            self.stats.unexpected[label] += 1
+            raise ScenarioError(f"{label}: нет кнопки «{button}»")
+        await self.act(label, callback_update(self.api.next_update_id(), self.chat_id, self.screen, button), expect)
+
+    # Ответ на шаг анкеты; expect — вопрос следующего шага (или экран подтверждения)
+    async def answer(self, step, expect: str):
+        if step.name == "phone":
+            phone = f"9{self.chat_id % 1_000_000_000:09d}"
+            if self.rng.random() < 0.5:
+                await self.act("phone:contact", contact_update(self.api.next_update_id(), self.chat_id, f"7{phone}"), expect)
+            else:
+                await self.say("phone", f"+7 {phone[:3]} {phone[3:6]}-{phone[6:8]}-{phone[8:]}", expect)
+            return
+        if step.other is not None and self.rng.random() < 0.3:
+            await self.say(f"{step.name}:other", step.other, step.other_prompt)
+            await self.say(step.name, FREE_TEXT[step.name], expect)
+            return
+        options = [option for option in REPLY_LAYOUTS.get(step.name, ([], 1))[0] if option != step.other]
+        await self.say(step.name, self.rng.choice(options) if options else FREE_TEXT[step.name], expect)
+
+    # Шаги анкеты от step до конца раздела (до экрана подтверждения)
+    async def walk(self, step):
+        while step is not None:
+            following = STEPS[step.next] if step.next else None
+            expect = following.prompt if following else CONFIRM_TEXT
+            if step.previous is not None and self.rng.random() < 0.1:
+                previous = STEPS[step.previous]
+                await self.say("back", BACK_BUTTON, previous.prompt)
+                await self.answer(previous, step.prompt)
+            if not step.free_text and self.rng.random() < 0.05:
+                await self.say("invalid", "что-то своё", step.error_text)
+            await self.answer(step, expect)
+            step = following
+
+    async def run(self):
+        try:
+            await self.say("start", "/start", FIRST_STEP.prompt)
+            await self.walk(FIRST_STEP)
+            if self.rng.random() < 0.3:
+                await self.press("edit", "❌ Изменить", EDIT_TEXT)
+                if self.rng.random() < 0.5:
+                    await self.press("edit:back", BACK_BUTTON, CONFIRM_TEXT)
+                else:
+                    section = EDIT_SECTIONS[CONTACTS_SECTION]
+                    await self.press("edit:section", CONTACTS_SECTION, section.prompt)
+                    await self.walk(section)
+            await self.press("confirm", "✅ Подтвердить", DONE_TEXT)
+            self.stats.completed += 1
+        except ScenarioError:
+            self.stats.failed += 1
+        finally:
+            self.api.unsubscribe(self.chat_id)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# Запуск бота отдельным процессом, направленного на заглушку
+def start_bot(args, tmp):
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_MODE="polling" if args.mode == "polling" else "webhook",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        WEBHOOK_URL=f"http://127.0.0.1:{args.webhook_port}",
+        WEBHOOK_PORT=str(args.webhook_port),
+        WEBHOOK_SECRET=SECRET,
+        BOT_WORKERS=str(args.workers),
+        CLUSTER_BASE_PORT=str(args.cluster_base_port),
+        METRICS_PORT="0",
+        ADMIN_IDS=",".join(map(str, ADMINS)),
+        FSM_STORAGE="memory",
+        # Виртуальные пользователи отвечают без пауз: защита от флуда не должна их отбрасывать
+        FLOOD_RATE="1000",
+        FLOOD_BURST="1000",
+        # Уведомления администраторам ограничены только заглушкой
+        NOTIFY_GLOBAL_RATE="100000",
+        NOTIFY_PER_CHAT_RATE="100000",
+        OUTBOX_BASE_DELAY="0.5",
+        LEADS_PATH=os.path.join(tmp, "leads.sqlite3"),
+        OUTBOX_PATH=os.path.join(tmp, "outbox.sqlite3"),
+        SOS_OUTBOX_PATH=os.path.join(tmp, "sos.sqlite3"),
+        BROADCASTS_PATH=os.path.join(tmp, "broadcasts.sqlite3"),
+        FUNNEL_PATH=os.path.join(tmp, "funnel.log"),
+        REMINDERS_PATH=os.path.join(tmp, "reminders.sqlite3"),
+    )
+    script = "cluster.py" if args.mode == "cluster" else "bot.py"
+    log = open(os.path.join(tmp, "bot.log"), "w")
+    return subprocess.Popen([sys.executable, script], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(api, args):
+    if args.mode == "polling":
+        await asyncio.wait_for(api.polling.wait(), timeout=60)
+        return
+    await asyncio.wait_for(api.webhook_set.wait(), timeout=60)
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", args.webhook_port)
+            break
+        except OSError:
+            await asyncio.sleep(0.05)
+    writer.close()
+
+
+def report(args, api, stats, elapsed, delivered, delivery_time):
+    print(f"mode={args.mode} users={args.users} concurrency={args.concurrency} "
+          f"latency={args.latency * 1000:.0f} ms p429={args.p429}")
+    print(f"applications: {stats.completed} completed, {stats.failed} failed, "
+          f"{stats.completed / elapsed:.1f}/s")
+    print(f"actions: {stats.actions}, {stats.actions / elapsed:.0f}/s, "
+          f"errors {stats.errors} ({stats.errors / max(stats.actions, 1):.2%}): "
+          f"timeouts {dict(stats.timeouts)}, unexpected {dict(stats.unexpected)}")
+    print(f"{'step':<22} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    order = ["start", *(step.name for step in STEPS.values()), "phone:contact", "invalid", "back"]
+    labels = sorted(stats.latency, key=lambda label: (order.index(label.split(":")[0]) if label.split(":")[0] in order else len(order), label))
+    for label in labels:
+        values = stats.latency[label]
+        print(f"{label:<22} {len(values):>7} {percentile(values, 0.5) * 1000:>8.1f} "
+              f"{percentile(values, 0.95) * 1000:>8.1f} {percentile(values, 0.99) * 1000:>8.1f}")
+    print("api calls: " + ", ".join(f"{method}={count}" for method, count in sorted(api.calls.items())))
+    if api.limited:
+        print("429 injected: " + ", ".join(f"{method}={count}" for method, count in sorted(api.limited.items())))
+    # Заявка сохраняется и до того, как пользователь получил «Спасибо», поэтому при 429
+    # уведомлений может быть больше, чем завершённых анкет
+    print(f"admin notifications: {delivered} delivered for {stats.completed} completed applications "
+          f"x {len(ADMINS)} admins, {delivery_time:.1f} s after the last user")
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    api = FakeBotAPI(latency=args.latency, p429=args.p429, seed=args.seed)
+    await api.start("127.0.0.1", args.api_port)
+    process = start_bot(args, tmp)
+    try:
+        await wait_ready(api, args)
+        rng = random.Random(args.seed)
+        stats = Stats()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def user(chat_id, seed):
+            async with semaphore:
+                await VirtualUser(api, chat_id, random.Random(seed), stats, args).run()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(FIRST_CHAT + index, rng.random()) for index in range(args.users)))
+        elapsed = time.perf_counter() - started
+
+        # Заявки уходят администраторам из очереди outbox в фоне
+        expected = stats.completed * len(ADMINS)
+        finished = time.perf_counter()
+        deadline = finished + args.step_timeout * 3
+        while time.perf_counter() < deadline:
+            delivered = sum(len(api.messages[admin]) for admin in ADMINS)
+            if delivered >= expected:
+                break
+            await asyncio.sleep(0.1)
+        report(args, api, stats, elapsed, delivered, time.perf_counter() - finished)
+    finally:
+        process.terminate()
+        process.wait()
+        await api.close()
+        print(f"bot log: {os.path.join(tmp, 'bot.log')}")
+
+    if not args.p429:
+        assert stats.errors == 0 and delivered == expected, "без 429 все анкеты и уведомления должны пройти"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["polling", "webhook", "cluster"], default="polling")
+    parser.add_argument("--workers", type=int, default=2, help="рабочих процессов для --mode cluster")
+    parser.add_argument("--users", type=int, default=1000, help="виртуальных пользователей")
+    parser.add_argument("--concurrency", type=int, default=100, help="пользователей одновременно")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответов заглушки, секунды")
+    parser.add_argument("--p429", type=float, default=0.0, help="доля ответов 429 на sendMessage/editMessageText")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза пользователя перед действием, секунды")
+    parser.add_argument("--step-timeout", type=float, default=10.0, help="сколько ждать ответа бота, секунды")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8080)
+    parser.add_argument("--cluster-base-port", type=int, default=8100,
+                        help="порт первого рабочего процесса --mode cluster (CLUSTER_BASE_PORT), следующие — по порядку")
+    args = parser.parse_args()
+    workers = range(args.cluster_base_port, args.cluster_base_port + args.workers)
+    if args.mode == "cluster" and (args.api_port in workers or args.webhook_port in workers):
+        parser.error(f"порты рабочих процессов {workers.start}-{workers.stop - 1} пересекаются с --api-port или --webhook-port")
+    asyncio.run(main(args))
@@ -0,0 +1,178 @@
+"""Выгрузка архива заявок: скорость и память потоковой выгрузки против выгрузки целиком.
+
+Архив заполняется --leads синтетическими заявками (как в bench_leads.py). Сравниваются:
+
+  naive  — все заявки одним запросом (fetchall) и весь CSV в памяти, затем в файл;
+  stream — export.py: пачки по EXPORT_BATCH_SIZE заявок по ключу, каждая кодируется
+           и сразу пишется в файл (части по EXPORT_PART_SIZE байт).
+
+Для 10%, 50% и 100% архива (фильтр по дате) выводится пиковая память Python во время
+выгрузки (tracemalloc): у потоковой выгрузки она не зависит от числа заявок. Затем
+без tracemalloc замеряются заявок в секунду и размер файлов для CSV и JSON Lines.
+
+В конце bot.py запускается с заглушкой Bot API (fake_telegram.py), администратор
+отправляет /export, и проверяется, что части пришли документами и вместе содержат
+все заявки ровно по одному разу.
+
+Пример:
+    python benchmarks/bench_export.py --leads 1000000
+    python benchmarks/bench_export.py --leads 200000 --path /tmp/leads.sqlite3 --no-bot
+"""
+import argparse
+import asyncio
+import csv
+import gc
+import io
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from bench_leads import seed  # noqa: E402
+from config import EXPORT_BATCH_SIZE, EXPORT_PART_SIZE  # noqa: E402
+from export import FORMATS, encode_batches, write_parts  # noqa: E402
+from fake_telegram import FakeBotAPI, text_update  # noqa: E402
+from leads import EXPORT_COLUMNS, iter_leads  # noqa: E402
+
+TOKEN = "123456:EXPORT"
+ADMIN = 42
+
+
+# Выгрузка «как проще»: все заявки в память, затем CSV целиком
+def naive(path, output, date_from):
+    db = sqlite3.connect(path)
+    rows = db.execute(
+        f"SELECT {', '.join(EXPORT_COLUMNS)} FROM leads WHERE created_at >= ? ORDER BY created_at, id", (date_from,)
+    ).fetchall()
+    db.close()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(rows)
+    with open(output, "w", encoding="utf-8") as file:
+        file.write(buffer.getvalue())
+    return len(rows), [output]
+
+
+def stream(path, output, date_from, fmt="csv"):
+    batches = iter_leads(path, EXPORT_BATCH_SIZE, date_from=date_from)
+    return write_parts(encode_batches(batches, fmt), fmt, output, EXPORT_PART_SIZE)
+
+
+def peak_memory(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        total, _ = func(*args)
+        return total, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def size_mb(paths):
+    return sum(os.path.getsize(path) for path in paths) / 2 ** 20
+
+
+# /export через бота: части приходят документами, вместе — все заявки по разу
+async def export_via_bot(args, tmp, expected):
+    api = FakeBotAPI()
+    await api.start("127.0.0.1", args.api_port)
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_MODE="polling",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        METRICS_PORT="0",
+        ADMIN_IDS=str(ADMIN),
+        FSM_STORAGE="memory",
+        LEADS_PATH=args.path,
+        OUTBOX_PATH=os.path.join(tmp, "outbox.sqlite3"),
+        SOS_OUTBOX_PATH=os.path.join(tmp, "sos.sqlite3"),
+        BROADCASTS_PATH=os.path.join(tmp, "broadcasts.sqlite3"),
+        FUNNEL_PATH=os.path.join(tmp, "funnel.log"),
+        REMINDERS_PATH=os.path.join(tmp, "reminders.sqlite3"),
+    )
+    log = open(os.path.join(tmp, "bot.log"), "w")
+    process = subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        await asyncio.wait_for(api.polling.wait(), timeout=60)
+        inbox = api.subscribe(ADMIN)
+        for fmt in ("csv", "jsonl"):
+            started = time.perf_counter()
+            await api.deliver(text_update(api.next_update_id(), ADMIN, f"/export {fmt}"))
+            documents = []
+            while True:
+                message = await asyncio.wait_for(inbox.get(), timeout=600)
+                assert "document" in message, message.get("text")
+                documents.append(message)
+                if "часть" not in message["caption"] or message["caption"].endswith(f"из {len(documents)}"):
+                    break
+            elapsed = time.perf_counter() - started
+            ids = set()
+            rows = 0
+            for message in documents:
+                lines = api.documents[message["document"]["file_id"]].decode("utf-8-sig").splitlines()
+                if fmt == "csv":
+                    records = list(csv.reader(lines))[1:]
+                    ids.update(int(record[0]) for record in records)
+                else:
+                    records = lines
+                    ids.update(int(line[len('{"id": '):line.index(",")]) for line in lines)
+                rows += len(records)
+            print(f"/export {fmt:<5}: {len(documents)} documents, {rows} leads in {elapsed:.1f} s")
+            assert rows == len(ids) == expected, "каждая заявка должна попасть в выгрузку ровно один раз"
+    finally:
+        process.terminate()
+        process.wait()
+        await api.close()
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    args.path = args.path or os.path.join(tmp, "leads.sqlite3")
+    seed(args.path, args.leads)
+    db = sqlite3.connect(args.path)
+    first, last = db.execute("SELECT MIN(created_at), MAX(created_at) FROM leads").fetchone()
+    db.close()
+
+    print(f"leads={args.leads} batch={EXPORT_BATCH_SIZE} part={EXPORT_PART_SIZE / 2 ** 20:.0f} MB")
+    print(f"{'share':>6} {'rows':>9} {'naive MB':>10} {'stream MB':>10}")
+    for share in (0.1, 0.5, 1.0):
+        date_from = int(last - (last - first) * share)
+        rows, naive_peak = peak_memory(naive, args.path, os.path.join(tmp, "naive.csv"), date_from)
+        streamed, stream_peak = peak_memory(stream, args.path, os.path.join(tmp, "stream"), date_from)
+        assert rows == streamed
+        print(f"{share:>6.0%} {rows:>9} {naive_peak / 2 ** 20:>10.1f} {stream_peak / 2 ** 20:>10.1f}")
+
+    print(f"{'':<13} {'rows/s':>10} {'MB':>8} {'parts':>6}")
+    started = time.perf_counter()
+    rows, paths = naive(args.path, os.path.join(tmp, "naive.csv"), first)
+    print(f"{'naive csv':<13} {rows / (time.perf_counter() - started):>10,.0f} {size_mb(paths):>8.0f} {len(paths):>6}")
+    for fmt in FORMATS:
+        started = time.perf_counter()
+        rows, paths = stream(args.path, os.path.join(tmp, "stream"), first, fmt)
+        elapsed = time.perf_counter() - started
+        assert rows == args.leads
+        assert all(os.path.getsize(path) <= EXPORT_PART_SIZE for path in paths), "часть больше EXPORT_PART_SIZE"
+        print(f"{'stream ' + fmt:<13} {rows / elapsed:>10,.0f} {size_mb(paths):>8.0f} {len(paths):>6}")
+        for path in paths:
+            os.remove(path)
+
+    if args.bot:
+        await export_via_bot(args, tmp, args.leads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1_000_000, help="заявок в архиве")
+    parser.add_argument("--path", help="архив заявок (по умолчанию — во временном каталоге; дополняется до --leads)")
+    parser.add_argument("--no-bot", dest="bot", action="store_false", help="не проверять /export через bot.py")
+    parser.add_argument("--api-port", type=int, default=8081)
+    asyncio.run(main(parser.parse_args()))
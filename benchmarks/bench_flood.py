@@ -0,0 +1,184 @@
+"""Бенчмарк очереди обновлений по чатам и защиты от флуда (flood.py).
+
+1. Двойное нажатие «✅ Подтвердить»: настоящий confirm_data с изоляцией
+   по умолчанию (DisabledEventIsolation) создаёт две заявки, с очередью по
+   чатам и в bot.dp — одну.
+2. Флуд: один пользователь присылает --flood сообщений разом — обрабатывается
+   не больше FLOOD_BURST, предупреждение отправляется один раз.
+3. Масштабирование: --users пользователей одновременно присылают по --per-user
+   сообщений, обработчик «ходит в API» --latency секунд. Сравнивается пропускная
+   способность без изоляции и с BoundedEventIsolation, проверяется, что в одном
+   чате обработчики не пересекаются, а таблица блокировок после всплеска
+   возвращается к --table записям.
+
+Пример:
+    python benchmarks/bench_flood.py --users 1000 10000 50000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ["ADMIN_IDS"] = "1001,1002"
+os.environ["LEADS_PATH"] = os.path.join(_tmp, "leads.sqlite3")
+os.environ["OUTBOX_PATH"] = os.path.join(_tmp, "outbox.sqlite3")
+os.environ["SOS_OUTBOX_PATH"] = os.path.join(_tmp, "sos.sqlite3")
+os.environ["BROADCASTS_PATH"] = os.path.join(_tmp, "broadcasts.sqlite3")
+os.environ["FUNNEL_PATH"] = os.path.join(_tmp, "funnel.log")
+os.environ["REMINDERS_PATH"] = os.path.join(_tmp, "reminders.sqlite3")
+
+from aiogram import Bot, Dispatcher, F  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import DisabledEventIsolation, MemoryStorage  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+
+from config import FLOOD_BURST  # noqa: E402
+from flood import THROTTLE_TEXT, BoundedEventIsolation, FloodControlMiddleware  # noqa: E402
+
+FORM_DATA = {
+    "residence": "Аренда",
+    "property_type": "Квартира",
+    "budget": "5-10 млн ₽",
+    "name": "Иван",
+    "phone": "79991234567",
+}
+
+
+# Сессия без сети: считает отправленные тексты
+class CountingSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.sent = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        if not isinstance(method, SendMessage):
+            return True
+        self.sent[method.text] += 1
+        return Message(message_id=1, date=datetime.now(), chat=Chat(id=int(method.chat_id), type="private"))
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def message_update(update_id, chat_id, text="привет"):
+    user = User(id=chat_id, is_bot=False, first_name="Иван")
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=chat_id, type="private"), from_user=user, text=text))
+
+
+def callback_update(update_id, chat_id, data):
+    user = User(id=chat_id, is_bot=False, first_name="Иван", username="ivan")
+    message = Message(message_id=7, date=datetime.now(), chat=Chat(id=chat_id, type="private"), text="Всё верно?")
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user, chat_instance="1", data=data, message=message))
+
+
+async def double_tap(dp, bot, lead_store, chat_id):
+    key = StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=chat_id)
+    from questionnaire import Form
+    await dp.storage.set_state(key, Form.confirm)
+    # Свой телефон в каждом чате, иначе заявка объединится с предыдущей как повторная
+    await dp.storage.set_data(key, {**FORM_DATA, "phone": f"7999{chat_id:07d}"})
+    before = await lead_store.count()
+    await asyncio.gather(*(dp.feed_update(bot, callback_update(chat_id * 10 + i, chat_id, "✅ Подтвердить")) for i in range(2)))
+    return await lead_store.count() - before
+
+
+async def check_double_tap():
+    import logging
+    import bot as bot_module
+    from questionnaire import Form
+
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    bot_module.bot.session = CountingSession()
+
+    # Изоляция по умолчанию: оба нажатия читают состояние confirm до того, как первое его очистит
+    unguarded = Dispatcher(storage=MemoryStorage())
+    unguarded.callback_query.register(bot_module.confirm_data, Form.confirm, F.data == "✅ Подтвердить")
+    # Только очередь по чатам, без отбрасывания повторных нажатий
+    isolated = Dispatcher(storage=MemoryStorage(), events_isolation=BoundedEventIsolation())
+    isolated.callback_query.register(bot_module.confirm_data, Form.confirm, F.data == "✅ Подтвердить")
+    created_before = await double_tap(unguarded, bot_module.bot, bot_module.lead_store, 500)
+    created_isolated = await double_tap(isolated, bot_module.bot, bot_module.lead_store, 501)
+    created_after = await double_tap(bot_module.dp, bot_module.bot, bot_module.lead_store, 502)
+    print(f"double tap: leads created before={created_before} isolation only={created_isolated} bot.dp={created_after}")
+    assert created_isolated == 1 and created_after == 1
+
+
+async def check_flood(count):
+    bot = Bot(os.environ["BOT_TOKEN"], session=CountingSession())
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=BoundedEventIsolation())
+    flood = FloodControlMiddleware()
+    dp.update.outer_middleware(flood)
+    handled = 0
+
+    @dp.message()
+    async def echo(message: Message):
+        nonlocal handled
+        handled += 1
+
+    await asyncio.gather(*(dp.feed_update(bot, message_update(i, 77)) for i in range(count)))
+    print(f"flood: {count} messages -> handled={handled} throttled={flood.throttled} "
+          f"warnings={bot.session.sent[THROTTLE_TEXT]}")
+    assert handled <= FLOOD_BURST + 1 and bot.session.sent[THROTTLE_TEXT] == 1
+
+
+async def scale(users, args, isolation):
+    bot = Bot(os.environ["BOT_TOKEN"], session=CountingSession())
+    dp = Dispatcher(storage=MemoryStorage(), events_isolation=isolation)
+    dp.update.outer_middleware(FloodControlMiddleware(max_size=args.table))
+    active = Counter()
+    overlaps = 0
+    peak = 0
+
+    @dp.message()
+    async def slow(message: Message):
+        nonlocal overlaps, peak
+        active[message.chat.id] += 1
+        overlaps += active[message.chat.id] > 1
+        if isinstance(isolation, BoundedEventIsolation):
+            peak = max(peak, isolation.size)
+        await asyncio.sleep(args.latency)
+        active[message.chat.id] -= 1
+
+    updates = [message_update(i, 10_000 + i % users) for i in range(users * args.per_user)]
+    started = time.perf_counter()
+    await asyncio.gather(*(dp.feed_update(bot, update) for update in updates))
+    elapsed = time.perf_counter() - started
+    table = isolation.size if isinstance(isolation, BoundedEventIsolation) else "-"
+    return users * args.per_user / elapsed, overlaps, peak or "-", table
+
+
+async def main(args):
+    await check_double_tap()
+    await check_flood(args.flood)
+
+    print(f"{'users':>6} {'isolation':<9} {'updates/s':>10} {'overlaps':>9} {'peak locks':>11} {'locks after':>12}")
+    for users in args.users:
+        for name, isolation in (("disabled", DisabledEventIsolation()), ("bounded", BoundedEventIsolation(args.table))):
+            rate, overlaps, peak, table = await scale(users, args, isolation)
+            print(f"{users:>6} {name:<9} {rate:>10.0f} {overlaps:>9} {peak!s:>11} {table!s:>12}")
+            if name == "bounded":
+                assert overlaps == 0 and table <= args.table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--per-user", type=int, default=3, help="сообщений от каждого пользователя разом")
+    parser.add_argument("--latency", type=float, default=0.02, help="время обработчика, с")
+    parser.add_argument("--table", type=int, default=10000, help="размер таблиц блокировок и пользователей")
+    parser.add_argument("--flood", type=int, default=50, help="сообщений от одного пользователя разом")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,140 @@
+"""Память процесса под незаконченными анкетами: MemoryStorage против CompactMemoryStorage.
+
+Для каждого хранилища в отдельном процессе моделируется --sessions пользователей,
+бросивших анкету на случайном шаге: состояние шага и ответы на предыдущие шаги (варианты
+с кнопок приходят от Telegram каждый раз новой строкой, как message.text, свободные
+ответы уникальны). Ещё --visitors пользователей только заглянули (например, /help):
+aiogram читает их состояние при каждом обновлении.
+
+Выводится RSS процесса до и после заполнения и байт на анкету. Для CompactMemoryStorage
+затем часы сдвигаются за FSM_TTL и запускается чистка: её длительность, сколько анкет
+удалено, самая долгая пауза event loop во время чистки и RSS после неё (освобождённую
+память Python переиспользует, но не всегда возвращает системе).
+
+Пример:
+    python benchmarks/bench_fsm_memory.py --sessions 1000000
+    python benchmarks/bench_fsm_memory.py --sessions 200000 --storage compact
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+from keyboards import REPLY_LAYOUTS  # noqa: E402
+from messages import DATA_VERSION, new_version  # noqa: E402
+from questionnaire import QUESTIONNAIRE, STEPS  # noqa: E402
+from storage import create_memory_storage  # noqa: E402
+
+BOT_ID = 123456
+FIRST_CHAT = 1_000_000
+STATES = list(STEPS)
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # Не Linux: пиковый RSS (на macOS в байтах, на Linux в килобайтах)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+# Ответы пользователя, дошедшего до шага progress
+def answers(rng: random.Random, index: int, progress: int) -> dict:
+    data = {}
+    for step in QUESTIONNAIRE[:progress]:
+        options, _ = REPLY_LAYOUTS.get(step.name, ([], 1))
+        if options and not step.free_text:
+            # Новый объект строки, как текст из очередного обновления
+            data[step.name] = rng.choice(options).encode().decode()
+        elif step.name == "phone":
+            data[step.name] = f"7999{index:07d}"
+        else:
+            data[step.name] = f"{step.name} {index}"
+        data[DATA_VERSION] = new_version()
+    return data
+
+
+async def fill(storage, args):
+    rng = random.Random(args.seed)
+    for index in range(args.sessions):
+        key = StorageKey(bot_id=BOT_ID, chat_id=FIRST_CHAT + index, user_id=FIRST_CHAT + index)
+        progress = rng.randrange(len(STATES))
+        await storage.set_state(key, STATES[progress])
+        await storage.set_data(key, answers(rng, index, progress))
+    for index in range(args.visitors):
+        chat_id = FIRST_CHAT + args.sessions + index
+        await storage.get_state(StorageKey(bot_id=BOT_ID, chat_id=chat_id, user_id=chat_id))
+
+
+# Самая долгая пауза event loop, пока работает задача
+async def max_stall(task: asyncio.Task) -> float:
+    worst = 0.0
+    last = time.perf_counter()
+    while not task.done():
+        await asyncio.sleep(0)
+        now = time.perf_counter()
+        worst = max(worst, now - last)
+        last = now
+    return worst
+
+
+async def run(args):
+    now = [0.0]
+    if args.storage == "memory":
+        storage = MemoryStorage()
+    else:
+        storage = create_memory_storage(clock=lambda: now[0], sweep_interval=3600)
+    gc.collect()
+    before = rss_mb()
+    await fill(storage, args)
+    gc.collect()
+    after = rss_mb()
+    total = args.sessions + args.visitors
+    print(f"{args.storage:<8} {total:>9} {before:>10.0f} {after:>10.0f} {(after - before) * 2 ** 20 / total:>12.0f}")
+
+    if args.storage == "compact":
+        stored = len(storage)
+        now[0] += storage.ttl + 1
+        started = time.perf_counter()
+        task = asyncio.create_task(storage.sweep())
+        stall = await max_stall(task)
+        removed = task.result()
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        print(f"sweep: removed {removed} of {stored} stored in {elapsed:.2f} s, longest loop stall {stall * 1000:.1f} ms, "
+              f"RSS after {rss_mb():.0f} MB")
+    await storage.close()
+
+
+def main(args):
+    if args.storage:
+        asyncio.run(run(args))
+        return
+    print(f"sessions={args.sessions} visitors={args.visitors}")
+    print(f"{'storage':<8} {'records':>9} {'RSS0 MB':>10} {'RSS MB':>10} {'bytes/user':>12}")
+    sys.stdout.flush()
+    for storage in ("memory", "compact"):
+        subprocess.run([sys.executable, __file__, "--storage", storage, "--sessions", str(args.sessions),
+                        "--visitors", str(args.visitors), "--seed", str(args.seed)], check=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=1_000_000, help="незаконченных анкет")
+    parser.add_argument("--visitors", type=int, default=200_000, help="пользователей без анкеты")
+    parser.add_argument("--storage", choices=["memory", "compact"], help="запустить только одно хранилище")
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
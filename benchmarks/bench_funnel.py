@@ -0,0 +1,211 @@
+"""Воронка анкеты (/stats): стоимость записи переходов, журнал на диске, отчёт и перезапуск.
+
+Синтетические пользователи (--active одновременно) проходят анкету по шагам из
+questionnaire.STEPS: на каждом шаге доля --drop уходит (треть из них — через /cancel,
+остальные просто перестают отвечать и уходят по FUNNEL_IDLE = --idle), на шаге
+телефона доля --reject отвечает с ошибкой, с экрана подтверждения доля --edit
+возвращается к разделу анкеты, остальные отправляют заявку. Переходы идут через
+хранилище FSM, как в боте: CompactMemoryStorage без воронки и FunnelStorage поверх него.
+
+1. История: --history событий записывается без ограничения скорости.
+2. Поток: --rate событий в секунду в течение --duration секунд в обоих вариантах.
+   Выводятся время на событие (set_state и вызовы воронки в обработчике), 99-й
+   процентиль и максимум паузы event loop (насколько позже срабатывает таймер на 1 мс;
+   в ней же запись журнала и снимки сводки) и достигнутая скорость.
+3. Отчёт /stats по сводке в памяти против пересчёта по всему журналу, размер журнала
+   на событие и загрузка после перезапуска (снимок и хвост журнала). Проверяется, что
+   сводка после перезапуска и пересчёт по журналу совпадают с живой сводкой.
+
+Пример:
+    python benchmarks/bench_funnel.py --rate 10000 --duration 10
+    python benchmarks/bench_funnel.py --history 5000000 --active 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+
+from funnel import Funnel, FunnelStats, FunnelStorage, format_report, read_segments  # noqa: E402
+from questionnaire import EDIT_SECTIONS, FIRST_STEP, STEPS, Form  # noqa: E402
+from storage import create_memory_storage  # noqa: E402
+
+ORDER = [*STEPS, Form.confirm.state]
+SECTIONS = [step.state for step in EDIT_SECTIONS.values()]
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+# Пользователи анкеты: каждое событие продвигает одного из них на шаг (или уводит из анкеты)
+class Simulation:
+    def __init__(self, args, storage, funnel):
+        self.args = args
+        self.storage = storage
+        self.funnel = funnel
+        self.rng = random.Random(1)
+        self.next_user = 0
+        # Пользователи на шагах: список для случайного выбора и chat_id -> (место в списке, номер шага в ORDER)
+        self.active = []
+        self.users = {}
+        self.spent = 0.0
+        self.events = 0
+
+    def key(self, chat_id):
+        return StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)
+
+    def move(self, chat_id, index):
+        position = self.users[chat_id][0] if chat_id in self.users else len(self.active)
+        if position == len(self.active):
+            self.active.append(chat_id)
+        self.users[chat_id] = (position, index)
+
+    def leave(self, chat_id):
+        position, _ = self.users.pop(chat_id)
+        last = self.active.pop()
+        if last != chat_id:
+            self.active[position] = last
+            self.users[last] = (position, self.users[last][1])
+
+    async def step(self):
+        args, rng, funnel = self.args, self.rng, self.funnel
+        if len(self.users) < args.active:
+            chat_id = self.next_user
+            self.next_user += 1
+            started = time.perf_counter()
+            await self.storage.set_state(self.key(chat_id), FIRST_STEP.state)
+            self.spent += time.perf_counter() - started
+            self.move(chat_id, 0)
+            self.events += 1
+            return
+        chat_id = self.active[rng.randrange(len(self.active))]
+        index = self.users[chat_id][1]
+        state = ORDER[index]
+        key = self.key(chat_id)
+        started = time.perf_counter()
+        if rng.random() < args.drop:
+            self.leave(chat_id)
+            if rng.random() < 1 / 3:
+                await self.storage.set_state(key, None)
+        elif state == Form.phone.state and rng.random() < args.reject:
+            if funnel is not None:
+                funnel.reject(chat_id, state)
+        elif state == Form.confirm.state:
+            if rng.random() < args.edit:
+                section = rng.choice(SECTIONS)
+                await self.storage.set_state(key, section)
+                self.move(chat_id, ORDER.index(section))
+            else:
+                if funnel is not None:
+                    funnel.submitted(chat_id)
+                await self.storage.set_state(key, None)
+                self.leave(chat_id)
+        else:
+            await self.storage.set_state(key, ORDER[index + 1])
+            self.move(chat_id, index + 1)
+        self.spent += time.perf_counter() - started
+        self.events += 1
+
+
+async def stream(args, simulation):
+    stalls = []
+    done = False
+
+    async def monitor():
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    watcher = asyncio.create_task(monitor())
+    simulation.spent, simulation.events = 0.0, 0
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    while simulation.events < total:
+        due = min(total, int((time.perf_counter() - started) * args.rate))
+        while simulation.events < due:
+            await simulation.step()
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    done = True
+    await watcher
+    return simulation.spent / total, percentile(stalls, 0.99), max(stalls), total / elapsed
+
+
+async def run(args):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "funnel.log")
+    print(f"history={args.history} rate={args.rate:.0f}/s duration={args.duration} s active={args.active} "
+          f"drop={args.drop:.0%} reject={args.reject:.0%} edit={args.edit:.0%} idle={args.idle} s")
+
+    funnel = Funnel(path, flush_interval=1, snapshot_interval=args.snapshot_interval, idle=args.idle)
+    simulation = Simulation(args, FunnelStorage(create_memory_storage(sweep_interval=0), funnel), funnel)
+    started = time.perf_counter()
+    while simulation.events < args.history:
+        await simulation.step()
+    await funnel.flush(snapshot=True)
+    print(f"history: {args.history} events in {time.perf_counter() - started:.1f} s")
+
+    print(f"{'storage':<10} {'us/event':>9} {'p99 ms':>8} {'max ms':>8} {'events/s':>9}")
+    funnel.start()
+    results = {}
+    cost, p99, worst, rate = results["funnel"] = await stream(args, simulation)
+    print(f"{'funnel':<10} {cost * 1e6:>9.1f} {p99 * 1000:>8.1f} {worst * 1000:>8.1f} {rate:>9,.0f}")
+    await funnel.close()
+    # Без воронки: сначала пользователи расходятся по шагам, как в истории
+    plain = Simulation(args, create_memory_storage(sweep_interval=0), None)
+    while plain.events < args.active * 5:
+        await plain.step()
+    cost, p99, worst, rate = results["plain"] = await stream(args, plain)
+    print(f"{'plain':<10} {cost * 1e6:>9.1f} {p99 * 1000:>8.1f} {worst * 1000:>8.1f} {rate:>9,.0f}")
+    live = funnel.stats
+    print(f"overhead: {(results['funnel'][0] - results['plain'][0]) * 1e6:.1f} us per event, "
+          f"{(results['funnel'][0] - results['plain'][0]) * args.rate * 100:.1f}% of one core at {args.rate:.0f} events/s")
+
+    size = os.path.getsize(path)
+    print(f"log: {size / 2 ** 20:.1f} MB, {size / live.events:.1f} bytes per event, {live.events} events")
+
+    started = time.perf_counter()
+    report = format_report(live, args.idle)
+    print(f"/stats from live summary: {(time.perf_counter() - started) * 1000:.2f} ms")
+    started = time.perf_counter()
+    rescan = FunnelStats()
+    for _, columns in read_segments(path):
+        rescan.apply_columns(columns)
+    print(f"/stats by rescanning the log: {(time.perf_counter() - started) * 1000:.0f} ms")
+    started = time.perf_counter()
+    restarted = Funnel(path, idle=args.idle)
+    await restarted.load()
+    print(f"restart (snapshot + tail): {(time.perf_counter() - started) * 1000:.0f} ms, "
+          f"snapshot {os.path.getsize(restarted.snapshot_path) / 2 ** 10:.0f} KB")
+    await restarted.close()
+    print()
+    print(report.replace("<pre>", "").replace("</pre>", "").replace("<b>", "").replace("</b>", ""))
+
+    assert rescan.dump() == live.dump(), "пересчёт по журналу должен совпасть с живой сводкой"
+    assert restarted.stats.dump() == live.dump(), "сводка после перезапуска должна совпасть с живой"
+    assert results["funnel"][3] >= args.rate * 0.95, "воронка не успевает за потоком событий"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=1_000_000, help="событий в журнале до замера")
+    parser.add_argument("--rate", type=float, default=10_000, help="событий в секунду")
+    parser.add_argument("--duration", type=float, default=10, help="секунды")
+    parser.add_argument("--active", type=int, default=20_000, help="пользователей на шагах анкеты одновременно")
+    parser.add_argument("--drop", type=float, default=0.03, help="доля уходящих с каждого шага")
+    parser.add_argument("--reject", type=float, default=0.2, help="доля ответов на шаг телефона с ошибкой")
+    parser.add_argument("--edit", type=float, default=0.1, help="доля возвращающихся с подтверждения к разделу анкеты")
+    parser.add_argument("--idle", type=float, default=30, help="через сколько секунд без переходов пользователь уходит с шага (FUNNEL_IDLE)")
+    parser.add_argument("--snapshot-interval", type=float, default=2, help="как часто сохранять сводку, секунды")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,151 @@
+"""Пропускная способность send_message: сессия aiogram по умолчанию против BotSession.
+
+Поднимает в отдельном процессе локальную заглушку Bot API, которая отвечает на каждый
+запрос с задержкой --latency секунд (как настоящий api.telegram.org за сетью) и считает
+новые TCP-соединения к ней. Затем бот отправляет --messages сообщений, держа --concurrency
+запросов одновременно, через:
+
+  default — AiohttpSession() без настроек (пул 100 соединений, keep-alive 15 с);
+  tuned   — session.BotSession с настройками из config.py (HTTP_POOL_SIZE и др.).
+
+Каждая сессия прогревается и прогоняется --rounds раз подряд с паузой --idle секунд
+между прогонами: если пауза длиннее keep-alive сессии, соединения открываются заново.
+
+Пример:
+    python benchmarks/bench_http.py --messages 5000 --concurrency 50 200 --latency 0.1
+    python benchmarks/bench_http.py --concurrency 20 --rounds 3 --idle 20
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiohttp import ClientSession, web  # noqa: E402
+
+from session import BotSession  # noqa: E402
+
+TOKEN = os.environ["BOT_TOKEN"]
+
+
+# Заглушка Bot API: отвечает на sendMessage после задержки и считает новые соединения
+# (по адресу и порту клиента). GET /stats?reset=1 — сколько открыто с прошлого сброса
+class FakeTelegram:
+    def __init__(self, latency):
+        self.latency = latency
+        self.peers = set()
+        self.opened = 0
+        self.requests = 0
+
+    async def stats(self, request: web.Request) -> web.Response:
+        opened = self.opened
+        if request.query.get("reset"):
+            self.opened = 0
+        return web.json_response({"connections": opened})
+
+    async def handle(self, request: web.Request) -> web.Response:
+        peer = request.transport.get_extra_info("peername")
+        if peer not in self.peers:
+            self.peers.add(peer)
+            self.opened += 1
+        self.requests += 1
+        data = await request.post()
+        await asyncio.sleep(self.latency)
+        return web.Response(content_type="application/json", text=json.dumps({"ok": True, "result": {
+            "message_id": self.requests,
+            "date": int(time.time()),
+            "chat": {"id": int(data["chat_id"]), "type": "private"},
+            "text": data.get("text", ""),
+        }}))
+
+
+def serve(port, latency):
+    fake = FakeTelegram(latency)
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", fake.handle)
+    app.router.add_get("/stats", fake.stats)
+    web.run_app(app, host="127.0.0.1", port=port, access_log=None, backlog=1024, print=None)
+
+
+async def server_connections(port, reset=False):
+    async with ClientSession() as http:
+        async with http.get(f"http://127.0.0.1:{port}/stats", params={"reset": "1"} if reset else {}) as response:
+            return (await response.json())["connections"]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def send_all(bot, messages, concurrency):
+    latencies = []
+    counter = iter(range(messages))
+
+    async def sender():
+        for index in counter:
+            started = time.perf_counter()
+            await bot.send_message(chat_id=1_000_000 + index % 1000, text=f"Заявка #{index}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies
+
+
+async def run(name, session, args, concurrency):
+    bot = Bot(TOKEN, session=session)
+    try:
+        await send_all(bot, min(concurrency, args.messages), concurrency)
+        for round_number in range(args.rounds):
+            if round_number:
+                await asyncio.sleep(args.idle)
+            await server_connections(args.port, reset=True)
+            elapsed, latencies = await send_all(bot, args.messages, concurrency)
+            connections = await server_connections(args.port)
+            print(f"{name:<8} {concurrency:>11} {round_number + 1:>5} {args.messages / elapsed:>9.0f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                  f"{connections:>12}")
+    finally:
+        await session.close()
+
+
+async def main(args):
+    server = multiprocessing.Process(target=serve, args=(args.port, args.latency), daemon=True)
+    server.start()
+    for _ in range(100):
+        try:
+            await server_connections(args.port)
+            break
+        except OSError:
+            await asyncio.sleep(0.1)
+    api = TelegramAPIServer.from_base(f"http://127.0.0.1:{args.port}")
+
+    print(f"messages={args.messages} latency={args.latency * 1000:.0f} ms idle={args.idle} s")
+    print(f"{'session':<8} {'concurrency':>11} {'round':>5} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'new conns':>12}")
+    try:
+        for concurrency in args.concurrency:
+            await run("default", AiohttpSession(api=api), args, concurrency)
+            await run("tuned", BotSession(api=api), args, concurrency)
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000, help="сообщений за прогон")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200], help="одновременных запросов")
+    parser.add_argument("--latency", type=float, default=0.1, help="задержка ответа заглушки, секунды")
+    parser.add_argument("--rounds", type=int, default=2, help="прогонов на сессию")
+    parser.add_argument("--idle", type=float, default=0, help="пауза между прогонами, секунды")
+    parser.add_argument("--port", type=int, default=8082)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""Микробенчмарк клавиатур: CPU на одно обновление до и после реестра keyboards.py.
+
+Для всплеска из --users пользователей, каждый из которых проходит все шаги
+анкеты, замеряется процессорное время на подготовку ответа (создание
+клавиатуры + сборка тела запроса sendMessage):
+  before — клавиатура строится заново и сериализуется при каждой отправке;
+  after  — готовая клавиатура из реестра и заранее сериализованный JSON.
+Заодно проверяется, что тело запроса в обоих случаях совпадает.
+
+Пример:
+    python benchmarks/bench_keyboards.py --users 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+
+from keyboards import (  # noqa: E402
+    INLINE_LAYOUTS,
+    REPLY_LAYOUTS,
+    MarkupCacheSession,
+    get_inline_keyboard,
+    get_reply_keyboard,
+    inline_keyboard,
+    reply_keyboard,
+)
+
+TEXT = "Какой у вас бюджет на покупку недвижимости?"
+
+
+def form_values(form):
+    return [(headers, value) for _, headers, value in form._fields]
+
+
+def before(session, bot, chat_id):
+    for options, row_width in REPLY_LAYOUTS.values():
+        markup = get_reply_keyboard(options, row_width=row_width)
+        session.build_form_data(bot, SendMessage(chat_id=chat_id, text=TEXT, reply_markup=markup))
+    for buttons, row_width in INLINE_LAYOUTS.values():
+        markup = get_inline_keyboard(buttons, row_width=row_width)
+        session.build_form_data(bot, SendMessage(chat_id=chat_id, text=TEXT, reply_markup=markup))
+
+
+def after(session, bot, chat_id):
+    for step in REPLY_LAYOUTS:
+        session.build_form_data(bot, SendMessage(chat_id=chat_id, text=TEXT, reply_markup=reply_keyboard(step)))
+    for name in INLINE_LAYOUTS:
+        session.build_form_data(bot, SendMessage(chat_id=chat_id, text=TEXT, reply_markup=inline_keyboard(name)))
+
+
+def check(bot):
+    old, new = AiohttpSession(), MarkupCacheSession()
+    for step, (options, row_width) in REPLY_LAYOUTS.items():
+        expected = old.build_form_data(bot, SendMessage(
+            chat_id=1, text=TEXT, reply_markup=get_reply_keyboard(options, row_width=row_width)))
+        actual = new.build_form_data(bot, SendMessage(chat_id=1, text=TEXT, reply_markup=reply_keyboard(step)))
+        assert sorted(form_values(expected)) == sorted(form_values(actual)), step
+    for name, (buttons, row_width) in INLINE_LAYOUTS.items():
+        expected = old.build_form_data(bot, SendMessage(
+            chat_id=1, text=TEXT, reply_markup=get_inline_keyboard(buttons, row_width=row_width)))
+        actual = new.build_form_data(bot, SendMessage(chat_id=1, text=TEXT, reply_markup=inline_keyboard(name)))
+        assert sorted(form_values(expected)) == sorted(form_values(actual)), name
+
+
+def main(args):
+    bot = Bot(os.environ["BOT_TOKEN"])
+    check(bot)
+    updates = args.users * (len(REPLY_LAYOUTS) + len(INLINE_LAYOUTS))
+    results = {}
+    for name, func, session in (("before", before, AiohttpSession()), ("after", after, MarkupCacheSession())):
+        started = time.process_time()
+        for chat_id in range(args.users):
+            func(session, bot, chat_id)
+        results[name] = (time.process_time() - started) / updates
+        print(f"{name:<7} {results[name] * 1e6:7.1f} us CPU per update ({updates} updates)")
+    print(f"speedup: {results['before'] / results['after']:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    main(parser.parse_args())
@@ -0,0 +1,107 @@
+"""Заполнение архива заявок синтетическими данными и замер скорости запросов /leads.
+
+Пример:
+    python benchmarks/bench_leads.py --path /tmp/leads.sqlite3 --seed 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leads import LEAD_FIELDS, LeadStore  # noqa: E402
+
+OPTIONS = {
+    "residence": ["Собственная квартира", "Собственный дом", "Аренда", "С родителями/родственниками"],
+    "satisfaction": ["Да, полностью доволен", "Частично доволен", "Нет, не доволен"],
+    "property_type": ["Квартира", "Дом", "Таунхаус", "Участок земли", "Коммерческая недвижимость"],
+    "location": ["В центре города", "В спальном районе", "В пригороде", "За городом"],
+    "budget": ["До 3 млн ₽", "3-5 млн ₽", "5-10 млн ₽", "10-20 млн ₽", "Более 20 млн ₽"],
+    "search_status": ["Только начинаю искать", "Уже смотрел(а) варианты", "Определился(лась) с выбором", "Готов(а) к сделке"],
+    "mortgage": ["Да, уже одобрена", "Да, планирую подать заявку", "Нет, полная оплата", "Еще не решил(а)"],
+    "purchase_time": ["В ближайший месяц", "В течение 3 месяцев", "В течение полугода", "В течение года", "Пока просто интересуюсь"],
+    "contact_method": ["Телефон", "WhatsApp", "Telegram"],
+    "contact_time": ["Утро (9:00-12:00)", "День (12:00-18:00)", "Вечер (18:00-21:00)", "В любое время"],
+}
+YEAR = 365 * 86400
+
+
+def synthetic_lead(number, now):
+    lead = {field: random.choice(values) for field, values in OPTIONS.items()}
+    lead["name"] = f"Клиент {number}"
+    lead["phone"] = f"79{random.randrange(10 ** 9):09d}"
+    # Заявки равномерно за последний год, по возрастанию времени
+    return (int(now - YEAR + YEAR * number / SEED_TOTAL), number, f"user{number}",
+            *(lead[field] for field in LEAD_FIELDS))
+
+
+# Заполнение базы напрямую пачками по 50 000 строк
+def seed(path, total):
+    global SEED_TOTAL
+    SEED_TOTAL = total
+    LeadStore(path)  # создаёт таблицу и индексы
+    db = sqlite3.connect(path)
+    existing = db.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+    now = time.time()
+    started = time.perf_counter()
+    placeholders = ", ".join("?" * (3 + len(LEAD_FIELDS)))
+    for offset in range(existing, total, 50_000):
+        rows = [synthetic_lead(number, now) for number in range(offset, min(offset + 50_000, total))]
+        with db:
+            db.executemany(
+                f"INSERT INTO leads (created_at, user_id, username, {', '.join(LEAD_FIELDS)}) VALUES ({placeholders})",
+                rows,
+            )
+    if total > existing:
+        print(f"seeded {total - existing} leads in {time.perf_counter() - started:.1f} s")
+    db.execute("ANALYZE")
+    db.close()
+
+
+async def measure(name, func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{name:<36} median={timings[len(timings) // 2] * 1000:7.2f} ms  max={timings[-1] * 1000:7.2f} ms")
+
+
+async def main(args):
+    random.seed(1)
+    seed(args.path, args.seed)
+    store = LeadStore(args.path)
+    now = int(time.time())
+    month_ago = now - 30 * 86400
+    sample = (await store.search(limit=1, before=args.seed // 2))[0]
+
+    queries = {
+        "first page": lambda: store.search(limit=10),
+        "type": lambda: store.search(limit=10, property_type="Дом"),
+        "budget + type": lambda: store.search(limit=10, budget="3-5 млн ₽", property_type="Таунхаус"),
+        "phone": lambda: store.search(limit=10, phone=sample["phone"]),
+        "last month": lambda: store.search(limit=10, date_from=month_ago),
+        "old month": lambda: store.search(limit=10, date_from=now - YEAR + 86400, date_to=now - YEAR + 31 * 86400),
+        "type + old month": lambda: store.search(limit=10, property_type="Дом", date_from=now - YEAR + 86400,
+                                                 date_to=now - YEAR + 31 * 86400),
+        "deep page (keyset)": lambda: store.search(limit=10, before=1000, property_type="Дом"),
+        "count type": lambda: store.count(property_type="Дом"),
+        "count last month": lambda: store.count(date_from=month_ago),
+        "insert": lambda: store.add(dict(sample), user_id=1, username="bench"),
+    }
+    for name, query in queries.items():
+        await measure(name, query, args.repeat)
+    await store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default="leads_bench.sqlite3")
+    parser.add_argument("--seed", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,147 @@
+"""Паузы event loop из-за журнала при всплеске обновлений: logging.basicConfig против logs.py.
+
+Каждый вариант запускается в отдельном процессе, его stderr (куда пишет журнал) читает
+--sink: slow — процесс, читающий не быстрее --sink-rate байт в секунду (как драйвер логов
+Docker или journald под нагрузкой; когда буфер канала заполнен, запись в stderr
+блокируется), file — файл на диске. Процесс --duration секунд получает --rate обновлений
+в секунду; на каждое aiogram пишет INFO «Update id=... is handled», а доля --errors
+обновлений — ошибку с трассировкой (как сбой отправки администратору). Варианты:
+
+  basic    — logging.basicConfig: запись в stderr прямо из event loop (как было);
+  queue    — logs.setup_logging без выборки: JSON-записи пишет поток QueueListener;
+  sampled  — logs.setup_logging с LOG_SAMPLE по умолчанию (1% строк aiogram.event).
+
+Выводятся время, проведённое в вызовах logging в потоке event loop, 99-й процентиль и
+максимум паузы event loop (насколько позже срабатывает таймер на 1 мс) и сколько
+обновлений в секунду удалось обработать.
+
+Пример:
+    python benchmarks/bench_logging.py --rate 5000 --duration 5
+    python benchmarks/bench_logging.py --sink file
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+MODES = ("basic", "queue", "sampled")
+# Читатель stderr с ограниченной скоростью
+SLOW_READER = (
+    "import sys, time\n"
+    "rate = float(sys.argv[1])\n"
+    "for chunk in iter(lambda: sys.stdin.buffer.read1(65536), b''):\n"
+    "    time.sleep(len(chunk) / rate)\n"
+)
+
+
+def configure(mode):
+    if mode == "basic":
+        logging.basicConfig(level=logging.INFO)
+        return
+    from logs import setup_logging
+    import logs
+    if mode == "queue":
+        logs.LOG_SAMPLE.clear()
+    setup_logging(level="INFO", fmt="json")
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+def fail():
+    raise ConnectionResetError("Connection reset by peer")
+
+
+async def run(args):
+    configure(args.mode)
+    event_log = logging.getLogger("aiogram.event")
+    rng = random.Random(1)
+    spent = 0.0
+    stalls = []
+    done = False
+
+    async def monitor():
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    async def handle(update_id):
+        nonlocal spent
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        event_log.info("Update id=%s is handled. Duration %d ms by bot id=%d", update_id, rng.randrange(5, 80), 123456)
+        if rng.random() < args.errors:
+            try:
+                fail()
+            except ConnectionResetError as e:
+                logging.exception(f"Не удалось отправить заявку администратору {update_id % 3}: {e}")
+        spent += time.perf_counter() - started
+
+    watcher = asyncio.create_task(monitor())
+    total = int(args.rate * args.duration)
+    # Незавершённые обработчики (gather по всем десяткам тысяч задач сам дал бы паузу)
+    pending = set()
+    started = time.perf_counter()
+    for update_id in range(total):
+        delay = started + update_id / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(handle(update_id))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    while pending:
+        await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - started
+    done = True
+    await watcher
+    print(f"{args.mode:<8} {spent * 1000:>10.0f} {percentile(stalls, 0.99) * 1000:>9.1f} "
+          f"{max(stalls) * 1000:>9.1f} {total / elapsed:>10,.0f}", flush=True)
+
+
+def main(args):
+    print(f"rate={args.rate}/s duration={args.duration} s errors={args.errors:.1%} sink={args.sink}"
+          + (f" ({args.sink_rate / 2 ** 10:.0f} KB/s)" if args.sink == "slow" else ""))
+    print(f"{'mode':<8} {'logging ms':>10} {'p99 ms':>9} {'max ms':>9} {'updates/s':>10}")
+    sys.stdout.flush()
+    tmp = tempfile.mkdtemp()
+    for mode in MODES:
+        command = [sys.executable, __file__, "--mode", mode, "--rate", str(args.rate),
+                   "--duration", str(args.duration), "--errors", str(args.errors)]
+        if args.sink == "file":
+            with open(os.path.join(tmp, f"{mode}.log"), "wb") as sink:
+                subprocess.run(command, stderr=sink, check=True)
+            continue
+        reader = subprocess.Popen([sys.executable, "-c", SLOW_READER, str(args.sink_rate)], stdin=subprocess.PIPE)
+        try:
+            subprocess.run(command, stderr=reader.stdin, check=True)
+        finally:
+            reader.stdin.close()
+            reader.kill()
+            reader.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=5000, help="обновлений в секунду")
+    parser.add_argument("--duration", type=float, default=5, help="секунды")
+    parser.add_argument("--errors", type=float, default=0.005, help="доля обновлений с ошибкой и трассировкой")
+    parser.add_argument("--sink", choices=["slow", "file"], default="slow")
+    parser.add_argument("--sink-rate", type=float, default=256 * 2 ** 10, help="скорость чтения stderr при --sink slow, байт/с")
+    parser.add_argument("--mode", choices=MODES, help="запустить только один вариант (в текущем процессе)")
+    args = parser.parse_args()
+    if args.mode:
+        asyncio.run(run(args))
+    else:
+        main(args)
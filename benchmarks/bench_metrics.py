@@ -0,0 +1,147 @@
+"""Бенчмарк накладных расходов метрик (metrics.py).
+
+Настоящие обработчики анкеты (cmd_start и questionnaire_step) подключаются к двум
+диспетчерам — без метрик и с instrument() + InstrumentedStorage — и каждый из
+--users пользователей проходит анкету целиком. Сессия Bot API подменена и
+отвечает мгновенно, поэтому замеряется только процессорное время на обновление.
+Раунды чередуются, сравнивается лучшее процессорное время; накладные расходы должны быть < 5%.
+В конце /metrics запускается на свободном порту и проверяется его вывод.
+
+Пример:
+    python benchmarks/bench_metrics.py --users 100 --rounds 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ["LEADS_PATH"] = os.path.join(_tmp, "leads.sqlite3")
+os.environ["OUTBOX_PATH"] = os.path.join(_tmp, "outbox.sqlite3")
+os.environ["SOS_OUTBOX_PATH"] = os.path.join(_tmp, "sos.sqlite3")
+os.environ["BROADCASTS_PATH"] = os.path.join(_tmp, "broadcasts.sqlite3")
+os.environ["FUNNEL_PATH"] = os.path.join(_tmp, "funnel.log")
+os.environ["REMINDERS_PATH"] = os.path.join(_tmp, "reminders.sqlite3")
+
+import aiohttp  # noqa: E402
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.filters.command import Command  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from aiogram.types import Chat, Message, Update, User  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+from metrics import HANDLER_LATENCY, STATE_ENTERED, InstrumentedStorage, instrument, start_metrics_server  # noqa: E402
+from questionnaire import STEPS, StepFilter  # noqa: E402
+
+ANSWERS = [
+    "/start", "Аренда", "Частично доволен", "Квартира", "В центре города", "5-10 млн ₽", "Готов(а) к сделке",
+    "Да, уже одобрена", "В ближайший месяц", "Иван", "Telegram", "В любое время", "+7 999 123-45-67",
+]
+
+
+class InstantSession(BaseSession):
+    async def make_request(self, bot, method, timeout=None):
+        if not isinstance(method, SendMessage):
+            return True
+        return Message(message_id=1, date=datetime.now(), chat=Chat(id=int(method.chat_id), type="private"))
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def dispatcher(instrumented):
+    bot = Bot(os.environ["BOT_TOKEN"], session=InstantSession())
+    storage = MemoryStorage()
+    dp = Dispatcher(storage=InstrumentedStorage(storage) if instrumented else storage)
+    if instrumented:
+        instrument(dp, bot)
+    dp.message.register(bot_module.cmd_start, Command("start"))
+    dp.message.register(bot_module.questionnaire_step, StepFilter())
+    return dp, bot
+
+
+def updates_for(users, offset):
+    updates = []
+    for user in range(users):
+        chat_id = offset + user
+        for index, text in enumerate(ANSWERS):
+            updates.append(Update(update_id=chat_id * 100 + index, message=Message(
+                message_id=index, date=datetime.now(), chat=Chat(id=chat_id, type="private"),
+                from_user=User(id=chat_id, is_bot=False, first_name="Иван"), text=text)))
+    return updates
+
+
+async def run(dp, bot, updates):
+    started = time.process_time()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.process_time() - started) / len(updates)
+
+
+async def check_endpoint():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    runner = await start_metrics_server("127.0.0.1", port)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                assert response.status == 200
+                assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                text = await response.text()
+    finally:
+        await runner.cleanup()
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            float(value)
+    for name in ("bot_updates_total", "bot_handler_duration_seconds_bucket", "bot_state_duration_seconds_count",
+                 "bot_api_request_duration_seconds_sum", "bot_storage_duration_seconds_bucket",
+                 "bot_funnel_state_entered_total"):
+        assert name in text, name
+    return len(text.splitlines())
+
+
+async def main(args):
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    plain, instrumented = dispatcher(False), dispatcher(True)
+    await run(*plain, updates_for(20, 1))
+    await run(*instrumented, updates_for(20, 1))
+
+    results = {"plain": [], "metrics": []}
+    for round_number in range(args.rounds):
+        offset = 10_000 * (round_number + 1)
+        # Порядок чередуется, чтобы фоновая нагрузка не доставалась одной стороне
+        order = (("plain", plain), ("metrics", instrumented))
+        for name, (dp, bot) in order if round_number % 2 else reversed(order):
+            results[name].append(await run(dp, bot, updates_for(args.users, offset)))
+
+    # Лучший раунд меньше всего зависит от соседних процессов на машине
+    before, after = min(results["plain"]), min(results["metrics"])
+    overhead = after / before - 1
+    print(f"plain    {before * 1e6:8.1f} us/update")
+    print(f"metrics  {after * 1e6:8.1f} us/update  overhead {overhead * 100:+.1f}%")
+    print(f"confirm screens reached: {STATE_ENTERED.value('Form:confirm'):.0f}, "
+          f"questionnaire_step calls: {HANDLER_LATENCY.count('questionnaire_step')}")
+    assert STATE_ENTERED.value(STEPS["Form:phone"].state) > 0
+    print(f"/metrics: {await check_endpoint()} lines, format ok")
+    assert overhead < 0.05, f"накладные расходы метрик {overhead:.1%} >= 5%"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
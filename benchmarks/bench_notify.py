@@ -0,0 +1,170 @@
+"""Стенд для проверки задержки подтверждения заявки при росте числа администраторов.
+
+Вызывает настоящий обработчик confirm_data с подменённой сессией Bot: каждый
+запрос к API «идёт» --latency секунд, а sendMessage администратору с вероятностью
+--p429 отвечает 429 (RetryAfter). Сравнивается старая последовательная рассылка
+(ответ пользователю только после отправки всем админам) и очередь outbox, как в
+боте: confirm_data ставит заявку в очередь, а Outbox во временном каталоге
+доставляет её через AdminNotifier (повторы после 429 — с задержкой --base-delay).
+
+confirm — когда пользователь получил «✅ Спасибо», fan-out — когда последний из
+--admins администраторов получил заявку (очередь пуста). Проверяется, что заявку
+получил каждый администратор.
+
+Пример:
+    python benchmarks/bench_notify.py --latency 0.05 --p429 0.1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ["LEADS_PATH"] = os.path.join(_tmp, "leads.sqlite3")
+os.environ["OUTBOX_PATH"] = os.path.join(_tmp, "outbox.sqlite3")
+os.environ["SOS_OUTBOX_PATH"] = os.path.join(_tmp, "sos.sqlite3")
+os.environ["BROADCASTS_PATH"] = os.path.join(_tmp, "broadcasts.sqlite3")
+os.environ["FUNNEL_PATH"] = os.path.join(_tmp, "funnel.log")
+os.environ["REMINDERS_PATH"] = os.path.join(_tmp, "reminders.sqlite3")
+# Каждый прогон — новая заявка, а не повторная отправка прежней
+os.environ["LEAD_DEDUP_WINDOW"] = "0"
+
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.methods import EditMessageText, SendMessage  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Message, User  # noqa: E402
+
+import bot as bot_module  # noqa: E402
+from config import OUTBOX_BASE_DELAY  # noqa: E402
+from notify import AdminNotifier  # noqa: E402
+from outbox import Outbox  # noqa: E402
+
+USER_ID = 42
+FORM_DATA = {
+    "residence": "Аренда",
+    "satisfaction": "Частично доволен",
+    "property_type": "Квартира",
+    "location": "В центре города",
+    "budget": "5-10 млн ₽",
+    "search_status": "Готов(а) к сделке",
+    "mortgage": "Да, уже одобрена",
+    "purchase_time": "В ближайший месяц",
+    "name": "Иван",
+    "phone": "79991234567",
+}
+
+
+# Подменная сессия Bot API с задержкой и случайными ответами 429
+class FakeSession(BaseSession):
+    def __init__(self, latency, p429):
+        super().__init__()
+        self.latency = latency
+        self.p429 = p429
+        self.calls = 0
+        self.retry_after = 0
+        self.user_replied_at = None
+        # Администраторы, получившие заявку
+        self.delivered = set()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if not isinstance(method, (SendMessage, EditMessageText)):
+            return True
+        # Благодарность пользователю приходит правкой экрана подтверждения
+        if method.chat_id == USER_ID:
+            self.user_replied_at = time.perf_counter()
+        elif random.random() < self.p429:
+            self.retry_after += 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+        else:
+            self.delivered.add(int(method.chat_id))
+        return Message(
+            message_id=1,
+            date=datetime.now(),
+            chat=Chat(id=int(method.chat_id), type="private"),
+            text=method.text,
+        )
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def make_callback(bot):
+    user = User(id=USER_ID, is_bot=False, first_name="Иван", username="ivan")
+    message = Message(message_id=1, date=datetime.now(), chat=Chat(id=USER_ID, type="private"), text="Всё верно?").as_(bot)
+    return CallbackQuery(
+        id="1", from_user=user, chat_instance="1", data="✅ Подтвердить", message=message
+    ).as_(bot)
+
+
+# Старое поведение: последовательная отправка админам до ответа пользователю
+async def sequential_confirm(call, admin_ids):
+    for admin_id in admin_ids:
+        try:
+            await bot_module.bot.send_message(chat_id=admin_id, text="Новая заявка")
+        except Exception:
+            pass
+    await call.message.answer("✅ Спасибо!")
+
+
+async def run(admins, args, sequential):
+    session = FakeSession(args.latency, args.p429)
+    bot_module.bot.session = session
+    admin_ids = list(range(1000, 1000 + admins))
+    bot_module.ADMIN_IDS = admin_ids
+    bot_module.HOT_LEAD_ADMIN_IDS = []
+    bot_module.notifier = AdminNotifier(bot_module.bot)
+    outbox = bot_module.outbox = Outbox(
+        bot_module.deliver, path=os.path.join(_tmp, f"outbox-{admins}-{int(sequential)}.sqlite3"), base_delay=args.base_delay,
+    )
+    outbox.start()
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=USER_ID, user_id=USER_ID))
+    await state.set_data(FORM_DATA)
+    call = make_callback(bot_module.bot)
+
+    started = time.perf_counter()
+    if sequential:
+        await sequential_confirm(call, admin_ids)
+    else:
+        await bot_module.confirm_data(call, state)
+    confirmed = session.user_replied_at - started
+    while (await outbox.stats())[0]:
+        await asyncio.sleep(0.01)
+    total = time.perf_counter() - started
+    await outbox.close()
+    if not sequential:
+        assert session.delivered == set(admin_ids), f"заявку получили {len(session.delivered)} из {admins} администраторов"
+    return confirmed, total, session.retry_after
+
+
+async def main(args):
+    random.seed(1)
+    print(f"{'admins':>6} {'mode':<10} {'confirm, ms':>12} {'fan-out, ms':>12} {'429s':>5}")
+    for admins in args.admins:
+        for sequential in (True, False):
+            confirmed, total, retries = await run(admins, args, sequential)
+            mode = "sequential" if sequential else "outbox"
+            print(f"{admins:>6} {mode:<10} {confirmed * 1000:>12.1f} {total * 1000:>12.1f} {retries:>5}")
+    print(f"bot data: {_tmp}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--p429", type=float, default=0.1)
+    parser.add_argument("--admins", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    parser.add_argument("--base-delay", type=float, default=OUTBOX_BASE_DELAY, help="задержка первого повтора outbox, с")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,101 @@
+"""Бенчмарк очереди outbox: запись пачки заявок и их отправка.
+
+1. --leads заявок ставятся в очередь всплеском (по --admins получателей на
+   каждую; задачи создаются по --wave за итерацию event loop, как обработчики
+   входящих обновлений, а не все сразу) — замеряется пропускная способность записи
+   и максимальная задержка event loop во время всплеска.
+2. Очередь закрывается без отправки и открывается заново — проверка, что все
+   сообщения пережили «перезапуск».
+3. Очередь отправляется фиктивным отправителем, который отказывает с
+   вероятностью --fail (повторы с задержкой --base-delay).
+
+Пример:
+    python benchmarks/bench_outbox.py --leads 5000 --admins 3
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outbox import Outbox  # noqa: E402
+
+
+# Замер максимальной задержки event loop: тикер раз в 1 мс
+async def loop_lag(stop):
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - started - 0.001)
+    return worst
+
+
+# Всплеск заявок: задачи enqueue создаются волнами по wave штук за итерацию event loop
+async def burst(outbox, admins, leads, wave):
+    tasks = []
+    for i in range(leads):
+        tasks.append(asyncio.create_task(outbox.enqueue(admins, f"Заявка №{i}")))
+        if i % wave == wave - 1:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+
+async def main(args):
+    random.seed(1)
+    delivered = 0
+
+    async def send(chat_id, text, lead_id):
+        nonlocal delivered
+        if random.random() < args.fail:
+            return False
+        delivered += 1
+        return True
+
+    # Как bot.py при запуске: объекты импорта не участвуют в сборке мусора
+    gc.freeze()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "outbox.sqlite3")
+        admins = list(range(1, args.admins + 1))
+
+        outbox = Outbox(send, path=path)
+        stop = asyncio.Event()
+        lag = asyncio.create_task(loop_lag(stop))
+        started = time.perf_counter()
+        await burst(outbox, admins, args.leads, args.wave)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        print(f"enqueue: {args.leads / elapsed:.0f} leads/s ({args.leads * args.admins} messages in {elapsed:.2f} s), "
+              f"max loop lag {await lag * 1000:.1f} ms")
+        await outbox.close()
+
+        outbox = Outbox(send, path=path, base_delay=args.base_delay, batch_size=args.batch_size)
+        pending, _ = await outbox.stats()
+        print(f"after restart: {pending} messages pending")
+
+        started = time.perf_counter()
+        while True:
+            await outbox.drain_once()
+            pending, dead = await outbox.stats()
+            if not pending:
+                break
+            await asyncio.sleep(args.base_delay / 10)
+        elapsed = time.perf_counter() - started
+        print(f"drain: {delivered / elapsed:.0f} messages/s, delivered={delivered} dead={dead}")
+        await outbox.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=5000)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--fail", type=float, default=0.05)
+    parser.add_argument("--base-delay", type=float, default=0.01)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--wave", type=int, default=100, help="задач enqueue за одну итерацию event loop")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+"""Бенчмарк нормализации телефонов (phones.py).
+
+Свойства нормализации (любое написание даёт один номер E.164, невозможные номера
+отклоняются, совместимость со старым путём) проверяет tests/test_phones.py; генераторы
+номеров written и invalid общие для тестов и замера.
+
+На --inputs синтетических строках сравнивается скорость:
+  before   — старый путь из двух регулярных выражений;
+  phones   — normalize_phone без кэша;
+  cached   — normalize_phone с кэшем, строки повторяются (--distinct разных).
+
+Пример:
+    python benchmarks/bench_phones.py --inputs 1000000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from phones import NATIONAL_FIRST_DIGITS, normalize_phone  # noqa: E402
+
+OLD_PATTERN = r'^(\+7|7|8)?[\s\-]?\(?[489][0-9]{2}\)?[\s\-]?[0-9]{3}[\s\-]?[0-9]{2}[\s\-]?[0-9]{2}$'
+
+
+# Старый путь: проверка в get_phone и очистка в process_phone
+def before(text):
+    if not re.match(OLD_PATTERN, text):
+        return None
+    phone = re.sub(r'\D', '', text)
+    if phone.startswith('8'):
+        phone = '7' + phone[1:]
+    return phone
+
+
+def random_national(rng, first_digits="".join(sorted(NATIONAL_FIRST_DIGITS))):
+    return rng.choice(first_digits) + "".join(rng.choice("0123456789") for _ in range(9))
+
+
+# Одно из привычных написаний национального номера
+def written(rng, national):
+    separator = rng.choice(["", " ", "-", ".", " - "])
+    code = national[:3]
+    if rng.random() < 0.3:
+        code = f"({code})"
+    groups = [code, national[3:6], national[6:8], national[8:]]
+    prefix = rng.choice(["+7", "7", "8", ""])
+    prefix_separator = rng.choice(["", " "]) if prefix else ""
+    padding = rng.choice(["", " ", "\t", "\n"])
+    return padding + prefix + prefix_separator + separator.join(groups) + padding.replace("\n", "")
+
+
+def invalid(rng):
+    national = random_national(rng)
+    kind = rng.randrange(7)
+    if kind == 0:
+        return rng.choice("0125") + national[1:]
+    if kind == 1:
+        return national[:rng.randrange(1, 9)]
+    if kind == 2:
+        return "7" + national + rng.choice("0123456789")
+    if kind == 3:
+        position = rng.randrange(1, 10)
+        return national[:position] + rng.choice("abcxO") + national[position:]
+    if kind == 4:
+        # Цифры других систем письма (арабские, полноширинные)
+        return "".join(chr(ord(digit) + rng.choice([0x0630, 0xFEE0])) for digit in national)
+    if kind == 5:
+        return "8 (" + national[:3] + ") " + national[3:] + rng.choice("0123456789")
+    return "+8" + national
+
+
+def inputs(rng, count):
+    nationals = [random_national(rng, "489") for _ in range(count // 10 + 1)]
+    return [written(rng, rng.choice(nationals)) if rng.random() < 0.8 else invalid(rng) for _ in range(count)]
+
+
+def throughput(func, texts):
+    started = time.perf_counter()
+    for text in texts:
+        func(text)
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    texts = inputs(rng, args.inputs)
+    pool = texts[:args.distinct]
+    repeated = [pool[index % len(pool)] for index in range(args.inputs)]
+    normalize_phone.cache_clear()
+    results = {
+        "before": throughput(before, texts),
+        "phones": throughput(normalize_phone.__wrapped__, texts),
+        "cached": throughput(normalize_phone, repeated),
+    }
+    info = normalize_phone.cache_info()
+    for name, rate in results.items():
+        print(f"{name:<7} {rate:>12.0f} inputs/s  ({rate / results['before']:.2f}x)")
+    print(f"cache: {info.hits} hits, {info.misses} misses")
+    assert results["phones"] > results["before"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inputs", type=int, default=1_000_000)
+    parser.add_argument("--distinct", type=int, default=10_000, help="разных строк для замера с кэшем")
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
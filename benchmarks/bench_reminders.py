@@ -0,0 +1,179 @@
+"""Таймеры напоминаний: постановка, перенос и отмена, память на таймер, перезапуск.
+
+Сравниваются:
+
+  call_later — по asyncio.TimerHandle на каждого пользователя (loop.call_later и
+               handle.cancel(); без сохранения на диск);
+  scheduler  — reminders.ReminderScheduler: словарь + куча с ленивой отменой, одна
+               фоновая задача; изменения пишутся в SQLite пакетами.
+
+Для --timers таймеров со случайными сроками измеряются операции в секунду
+(schedule — новый таймер, reschedule — пользователь перешёл на следующий шаг, cancel —
+анкета заполнена), память на таймер (tracemalloc), время записи всех изменений на диск
+(flush) и загрузки таймеров при запуске (load). В конце --fire таймеров со сроком «сейчас»
+срабатывают через фоновую задачу — выводится, сколько напоминаний в секунду она успевает
+передать функции отправки (без лимита REMINDER_RATE).
+
+Пример:
+    python benchmarks/bench_reminders.py --timers 200000
+    python benchmarks/bench_reminders.py --timers 1000000 --fire 50000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from reminders import ReminderScheduler  # noqa: E402
+
+STATE = "Form:budget"
+NEXT_STATE = "Form:search_status"
+FIRST_CHAT = 1_000_000
+
+
+async def no_nudge(chat_id, state, sent):
+    return False
+
+
+def new_scheduler(path, **kwargs):
+    # Запись на диск только явным flush(), чтобы не смешивать её с операциями в памяти
+    return ReminderScheduler(no_nudge, path=path, delays=(1800, 86400), rate=1e9, flush_interval=3600, **kwargs)
+
+
+def rate(count, elapsed):
+    return f"{count / elapsed:>12,.0f}"
+
+
+def bench_call_later(delays):
+    loop = asyncio.get_running_loop()
+    handles = {}
+
+    started = time.perf_counter()
+    for index, delay in enumerate(delays):
+        handles[FIRST_CHAT + index] = loop.call_later(delay, print)
+    schedule = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for index, delay in enumerate(delays):
+        chat_id = FIRST_CHAT + index
+        handles[chat_id].cancel()
+        handles[chat_id] = loop.call_later(delay + 60, print)
+    reschedule = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for handle in handles.values():
+        handle.cancel()
+    handles.clear()
+    cancel = time.perf_counter() - started
+    return schedule, reschedule, cancel
+
+
+def bench_scheduler(scheduler, delays):
+    now = time.time()
+    started = time.perf_counter()
+    for index, delay in enumerate(delays):
+        scheduler.schedule(FIRST_CHAT + index, STATE, now=now - 1800 + delay)
+    schedule = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for index, delay in enumerate(delays):
+        scheduler.schedule(FIRST_CHAT + index, NEXT_STATE, now=now - 1800 + delay + 60)
+    reschedule = time.perf_counter() - started
+    return schedule, reschedule
+
+
+def start_tracing():
+    gc.collect()
+    tracemalloc.start()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def bytes_per_timer(before, count):
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    rng = random.Random(args.seed)
+    delays = [rng.uniform(60, 86400) for _ in range(args.timers)]
+    print(f"timers={args.timers}")
+    print(f"{'':<11} {'schedule/s':>12} {'reschedule/s':>12} {'cancel/s':>12} {'bytes/timer':>12}")
+
+    schedule, reschedule, cancel = bench_call_later(delays)
+    loop = asyncio.get_running_loop()
+    before = start_tracing()
+    handles = {FIRST_CHAT + index: loop.call_later(delay, print) for index, delay in enumerate(delays)}
+    memory = bytes_per_timer(before, args.timers)
+    for handle in handles.values():
+        handle.cancel()
+    print(f"{'call_later':<11} {rate(args.timers, schedule)} {rate(args.timers, reschedule)} "
+          f"{rate(args.timers, cancel)} {memory:>12,.0f}")
+
+    scheduler = new_scheduler(os.path.join(tmp, "reminders.sqlite3"))
+    schedule, reschedule = bench_scheduler(scheduler, delays)
+    started = time.perf_counter()
+    await scheduler.flush()
+    flush = time.perf_counter() - started
+    await scheduler.close()
+
+    scheduler = new_scheduler(os.path.join(tmp, "reminders.sqlite3"))
+    started = time.perf_counter()
+    await scheduler.load()
+    load = time.perf_counter() - started
+    assert len(scheduler) == args.timers
+    started = time.perf_counter()
+    for index in range(args.timers):
+        scheduler.cancel(FIRST_CHAT + index)
+    cancel = time.perf_counter() - started
+    await scheduler.close()
+
+    # Память в установившемся режиме: по таймеру на пользователя, изменения уже на диске
+    scheduler = new_scheduler(os.path.join(tmp, "memory.sqlite3"))
+    before = start_tracing()
+    now = time.time()
+    for index, delay in enumerate(delays):
+        scheduler.schedule(FIRST_CHAT + index, STATE, now=now - 1800 + delay)
+    await scheduler.flush()
+    memory = bytes_per_timer(before, args.timers)
+    await scheduler.close()
+    print(f"{'scheduler':<11} {rate(args.timers, schedule)} {rate(args.timers, reschedule)} "
+          f"{rate(args.timers, cancel)} {memory:>12,.0f}")
+    print(f"scheduler: flush {args.timers} changes {flush:.2f} s, load {args.timers} timers {load:.2f} s")
+
+    # Срабатывание: таймеры со сроком «сейчас» уходят в функцию отправки одной фоновой задачей
+    fired = 0
+    done = asyncio.Event()
+
+    async def count_nudge(chat_id, state, sent):
+        nonlocal fired
+        fired += 1
+        if fired == args.fire:
+            done.set()
+        return False
+
+    scheduler = ReminderScheduler(count_nudge, path=os.path.join(tmp, "fire.sqlite3"), delays=(0,), rate=1e9)
+    for index in range(args.fire):
+        scheduler.schedule(FIRST_CHAT + index, STATE)
+    started = time.perf_counter()
+    scheduler.start()
+    await asyncio.wait_for(done.wait(), 600)
+    elapsed = time.perf_counter() - started
+    await scheduler.close()
+    print(f"scheduler: fired {fired} reminders in {elapsed:.2f} s ({fired / elapsed:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--timers", type=int, default=200_000, help="таймеров (пользователей с незаконченной анкетой)")
+    parser.add_argument("--fire", type=int, default=20_000, help="таймеров в тесте срабатывания")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+"""Бенчмарк сообщений по анкете: сборка через += против шаблона messages.py.
+
+Замеряется число сообщений подтверждения в секунду:
+  before   — старая сборка из ~20 f-строк через += (как в process_phone);
+  template — шаблон, собранный один раз, без кэша;
+  cached   — шаблон с кэшем по (чат, версия данных): повторный показ
+             подтверждения после «Изменить»/«Назад».
+Совпадение текста со старой сборкой и экранирование ввода проверяет tests/test_messages.py.
+
+Пример:
+    python benchmarks/bench_render.py --renders 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from messages import DATA_VERSION, SummaryRenderer, new_version  # noqa: E402
+
+FORM_DATA = {
+    "residence": "Аренда",
+    "satisfaction": "Частично доволен",
+    "property_type": "Квартира",
+    "location": "В центре города",
+    "budget": "5-10 млн ₽",
+    "search_status": "Готов(а) к сделке",
+    "mortgage": "Да, уже одобрена",
+    "purchase_time": "В ближайший месяц",
+    "name": "Иван",
+    "contact_method": "Telegram",
+    "contact_time": "В любое время",
+    "phone": "79991234567",
+}
+
+# Старая сборка подтверждения (до messages.py)
+def before(data):
+    confirm_message = f"📋 <b>Проверьте введенные данные:</b>\n\n"
+    confirm_message += f"<b>Блок 1. Жилищная ситуация</b>\n"
+    confirm_message += f"👤 Имя: {data['name']}\n"
+    confirm_message += f"🏠 Текущее жилье: {data.get('residence', 'Не указано')}\n"
+    confirm_message += f"😊 Довольны условиями: {data.get('satisfaction', 'Не указано')}\n"
+    confirm_message += f"🏢 Тип недвижимости: {data.get('property_type', 'Не указано')}\n"
+    confirm_message += f"📍 Желаемое расположение: {data.get('location', 'Не указано')}\n"
+    confirm_message += f"💰 Бюджет: {data.get('budget', 'Не указано')}\n"
+    confirm_message += f"🔍 Статус поиска: {data.get('search_status', 'Не указано')}\n\n"
+    confirm_message += f"<b>Блок 2. Готовность к покупке</b>\n"
+    confirm_message += f"🏦 Ипотека: {data.get('mortgage', 'Не указано')}\n"
+    confirm_message += f"⏱ Планируемое время покупки: {data.get('purchase_time', 'Не указано')}\n\n"
+    confirm_message += f"<b>Блок 3. Контактные данные</b>\n"
+    confirm_message += f"📞 Предпочтительный способ связи: {data.get('contact_method', 'Не указано')}\n"
+    confirm_message += f"📅 Удобное время для связи: {data.get('contact_time', 'Не указано')}\n"
+    confirm_message += f"📱 Телефон: +{data.get('phone', 'Не указано')}\n\n"
+    confirm_message += "Всё верно?"
+    return confirm_message
+
+
+def throughput(func, renders):
+    started = time.perf_counter()
+    for index in range(renders):
+        func(index)
+    return renders / (time.perf_counter() - started)
+
+
+def main(args):
+    users = [dict(FORM_DATA, name=f"Пользователь {index}", **{DATA_VERSION: new_version()}) for index in range(args.users)]
+    uncached = SummaryRenderer(cache_size=0)
+    cached = SummaryRenderer(cache_size=args.users)
+    results = {
+        "before": throughput(lambda index: before(users[index % args.users]), args.renders),
+        "template": throughput(lambda index: uncached.confirmation(index % args.users, users[index % args.users]), args.renders),
+        "cached": throughput(lambda index: cached.confirmation(index % args.users, users[index % args.users]), args.renders),
+    }
+    for name, rate in results.items():
+        print(f"{name:<9} {rate:>12.0f} renders/s  ({rate / results['before']:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=200000, help="сообщений на вариант")
+    parser.add_argument("--users", type=int, default=1000, help="разных анкет (повторный показ — из кэша)")
+    main(parser.parse_args())
@@ -0,0 +1,236 @@
+"""Перезапуск бота под нагрузкой: сколько обновлений теряется и обрабатывается дважды.
+
+bot.py запускается отдельным процессом и обращается к заглушке Bot API из
+fake_telegram.py (ответ на каждый запрос — через --latency секунд, поэтому в момент
+остановки всегда есть обработчики в процессе). Заглушка шлёт --rate обновлений /help в
+секунду, каждое от нового пользователя, в течение --duration секунд; в середине прогона
+бот перезапускается одним из способов:
+
+  term     — SIGTERM, после выхода процесса запускается новый (как docker restart);
+  kill     — SIGKILL вместо SIGTERM (аварийное завершение, для сравнения);
+  handover — только webhook, как в README: оба экземпляра регистрируют один публичный
+             адрес — прокси на --proxy-port. Новый экземпляр поднимается на
+             --handover-port, прокси переключается на него, новый регистрирует webhook
+             со своей меткой экземпляра, старый замечает это (WEBHOOK_HANDOVER=1) и
+             останавливается сам, дорабатывая начатое.
+
+Как и настоящий Telegram, заглушка повторяет getUpdates до подтверждения offset и
+webhook до ответа 2xx. Каждое обновление должно получить ровно один ответ: без ответа —
+потеряно, больше одного — обработано дважды. --shutdown-timeout 0 отключает ожидание
+обработчиков при остановке (поведение до shutdown.py).
+
+Пример:
+    python benchmarks/bench_restart.py --mode polling --restart term
+    python benchmarks/bench_restart.py --mode webhook --restart handover --rate 200
+    python benchmarks/bench_restart.py --mode polling --restart term --shutdown-timeout 0
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, web
+
+from fake_telegram import FakeBotAPI, text_update
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:RESTART"
+SECRET = "restart-secret"
+FIRST_CHAT = 2_000_000
+
+
+# Прокси перед webhook-экземплярами (как nginx): пересылает POST на текущий порт бота
+# вместе с путём, параметрами запроса и заголовком секрета
+class SwitchProxy:
+    def __init__(self, port):
+        self.port = port
+        self._session = None
+        self._runner = None
+
+    async def start(self, host, port):
+        self._session = ClientSession()
+        app = web.Application()
+        app.router.add_post("/{tail:.*}", self.forward)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def forward(self, request):
+        headers = {name: value for name, value in request.headers.items() if name.lower().startswith("x-telegram")}
+        try:
+            async with self._session.post(f"http://127.0.0.1:{self.port}{request.path_qs}", data=await request.read(),
+                                          headers=headers) as response:
+                return web.Response(status=response.status, body=await response.read())
+        except OSError:
+            return web.Response(status=502)
+
+    async def close(self):
+        await self._runner.cleanup()
+        await self._session.close()
+
+
+# Публичный адрес webhook: при handover — прокси, иначе сам экземпляр
+def public_url(args, port):
+    return f"http://127.0.0.1:{args.proxy_port if args.restart == 'handover' else port}"
+
+
+# Запуск экземпляра бота; webhook-экземпляр слушает port и регистрирует публичный адрес
+def start_bot(args, tmp, name, port):
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_MODE=args.mode,
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        WEBHOOK_URL=public_url(args, port),
+        WEBHOOK_PORT=str(port),
+        WEBHOOK_SECRET=SECRET,
+        WEBHOOK_HANDOVER="1" if args.restart == "handover" else "0",
+        HANDOVER_CHECK_INTERVAL="0.5",
+        SHUTDOWN_TIMEOUT=str(args.shutdown_timeout),
+        METRICS_PORT="0",
+        ADMIN_IDS="",
+        FSM_STORAGE="memory",
+        FLOOD_RATE="1000",
+        FLOOD_BURST="1000",
+        LEADS_PATH=os.path.join(tmp, "leads.sqlite3"),
+        OUTBOX_PATH=os.path.join(tmp, "outbox.sqlite3"),
+        SOS_OUTBOX_PATH=os.path.join(tmp, "sos.sqlite3"),
+        BROADCASTS_PATH=os.path.join(tmp, "broadcasts.sqlite3"),
+        FUNNEL_PATH=os.path.join(tmp, "funnel.log"),
+        REMINDERS_PATH=os.path.join(tmp, "reminders.sqlite3"),
+    )
+    log = open(os.path.join(tmp, f"{name}.log"), "w")
+    return subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+async def wait_ready(api, args, port):
+    if args.mode == "polling":
+        api.polling.clear()
+        await asyncio.wait_for(api.polling.wait(), timeout=60)
+        return
+    url = public_url(args, port)
+    while not (api.webhook_set.is_set() and (api.webhook_url or "").startswith(url)):
+        await asyncio.sleep(0.05)
+
+
+async def wait_listening(port):
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+        except OSError:
+            await asyncio.sleep(0.05)
+            continue
+        writer.close()
+        return
+
+
+async def wait_exit(process):
+    while process.poll() is None:
+        await asyncio.sleep(0.05)
+
+
+async def restart(api, args, tmp, process, proxy):
+    port = args.webhook_port
+    started = time.perf_counter()
+    api.webhook_set.clear()
+    if args.restart == "handover":
+        replacement = start_bot(args, tmp, "new", args.handover_port)
+        # Новый экземпляр сначала начинает слушать порт, затем на него переключается прокси
+        # и только потом регистрируется webhook (адрес тот же, другая метка экземпляра)
+        await wait_listening(args.handover_port)
+        proxy.port = args.handover_port
+        await wait_ready(api, args, args.handover_port)
+        await wait_exit(process)
+        return replacement, time.perf_counter() - started
+    process.send_signal(signal.SIGKILL if args.restart == "kill" else signal.SIGTERM)
+    await wait_exit(process)
+    replacement = start_bot(args, tmp, "new", port)
+    await wait_ready(api, args, port)
+    return replacement, time.perf_counter() - started
+
+
+async def send(api, args):
+    chats = []
+    started = time.perf_counter()
+    deliveries = []
+    for index in range(int(args.rate * args.duration)):
+        delay = started + index / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        chat_id = FIRST_CHAT + index
+        chats.append(chat_id)
+        deliveries.append(asyncio.create_task(api.deliver(text_update(api.next_update_id(), chat_id, "/help"))))
+    await asyncio.gather(*deliveries)
+    return chats
+
+
+# Ожидание, пока ответы перестанут приходить (или все обновления получат ответ)
+async def settle(api, chats, quiet):
+    last, changed = -1, time.perf_counter()
+    while time.perf_counter() - changed < quiet:
+        replied = sum(len(api.messages[chat_id]) for chat_id in chats)
+        if replied != last:
+            last, changed = replied, time.perf_counter()
+        if all(api.messages[chat_id] for chat_id in chats):
+            break
+        await asyncio.sleep(0.1)
+
+
+async def main(args):
+    if args.restart == "handover" and args.mode != "webhook":
+        raise SystemExit("--restart handover работает только с --mode webhook")
+    tmp = tempfile.mkdtemp()
+    api = FakeBotAPI(latency=args.latency)
+    await api.start("127.0.0.1", args.api_port)
+    proxy = None
+    if args.restart == "handover":
+        proxy = SwitchProxy(args.webhook_port)
+        await proxy.start("127.0.0.1", args.proxy_port)
+    processes = [start_bot(args, tmp, "old", args.webhook_port)]
+    try:
+        await wait_ready(api, args, args.webhook_port)
+        sender = asyncio.create_task(send(api, args))
+        await asyncio.sleep(args.duration / 2)
+        replacement, downtime = await restart(api, args, tmp, processes[0], proxy)
+        processes.append(replacement)
+        chats = await sender
+        await settle(api, chats, args.quiet)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+        if proxy is not None:
+            await proxy.close()
+        await api.close()
+
+    replies = [len(api.messages[chat_id]) for chat_id in chats]
+    lost = replies.count(0)
+    duplicated = sum(1 for count in replies if count > 1)
+    print(f"mode={args.mode} restart={args.restart} rate={args.rate}/s latency={args.latency * 1000:.0f} ms "
+          f"shutdown_timeout={args.shutdown_timeout} s")
+    print(f"updates: {len(chats)}, answered once {replies.count(1)}, lost {lost}, duplicated {duplicated}")
+    print(f"restart took {downtime:.1f} s, old instance exit code {processes[0].returncode}")
+    print(f"bot logs: {tmp}")
+    if args.restart != "kill" and args.shutdown_timeout:
+        assert lost == 0 and duplicated == 0, "при корректной остановке обновления не теряются и не дублируются"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--restart", choices=["term", "kill", "handover"], default="term")
+    parser.add_argument("--rate", type=float, default=100, help="обновлений в секунду")
+    parser.add_argument("--duration", type=float, default=10, help="длительность прогона, секунды")
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка ответов заглушки, секунды")
+    parser.add_argument("--shutdown-timeout", type=float, default=20, help="SHUTDOWN_TIMEOUT бота")
+    parser.add_argument("--quiet", type=float, default=5, help="сколько ждать новых ответов в конце, секунды")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8080)
+    parser.add_argument("--handover-port", type=int, default=8082, help="порт нового экземпляра при --restart handover")
+    parser.add_argument("--proxy-port", type=int, default=8083, help="публичный адрес (прокси) при --restart handover")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,219 @@
+"""Бенчмарк маршрутизации: время диспетчеризации одного обновления до и после таблицы шагов.
+
+Оба диспетчера содержат одинаковые команды (/start, /help, /cancel, /leads),
+а обработчики ничего не делают, поэтому замеряется только поиск обработчика:
+  before — отдельный @dp.message(Form.x) на каждый шаг и «Назад» через lambda,
+           aiogram по очереди проверяет фильтры всех обработчиков;
+  after  — один обработчик с StepFilter, шаг ищется в словаре STEPS.
+Время выводится по шагам: в старой схеме оно растёт с номером шага.
+
+Перед замером настоящий bot.dp проходит анкету целиком (вперёд, «Назад»,
+неверный ответ, редактирование) с подменённой сессией, чтобы убедиться, что
+навигация по таблице шагов работает.
+
+Пример:
+    python benchmarks/bench_routing.py --updates 20000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+# Сценарий шлёт ответы без пауз — защита от флуда не должна их отбрасывать
+os.environ.setdefault("FLOOD_RATE", "1000")
+os.environ.setdefault("FLOOD_BURST", "1000")
+
+from aiogram import Bot, Dispatcher, F  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.filters.command import Command  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Contact, Message, Update, User  # noqa: E402
+
+from keyboards import BACK_BUTTON  # noqa: E402
+from questionnaire import QUESTIONNAIRE, STEPS, Form, StepFilter  # noqa: E402
+
+USER_ID = 42
+ANSWERS = {
+    "residence": "Аренда",
+    "satisfaction": "Частично доволен",
+    "property_type": "Квартира",
+    "location": "В центре города",
+    "budget": "5-10 млн ₽",
+    "search_status": "Готов(а) к сделке",
+    "mortgage": "Да, уже одобрена",
+    "purchase_time": "В ближайший месяц",
+    "name": "Иван",
+    "contact_method": "Telegram",
+    "contact_time": "В любое время",
+    "phone": "8 (999) 123-45-67",
+}
+
+
+# Сессия, которая запоминает отправленные сообщения и ничего не отправляет
+class RecordingSession(BaseSession):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def make_request(self, bot, method, timeout=None):
+        if not isinstance(method, SendMessage):
+            return True
+        self.sent.append(method.text)
+        return Message(message_id=len(self.sent), date=datetime.now(), chat=Chat(id=int(method.chat_id), type="private"))
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+
+def message_update(update_id, chat_id, text=None, contact=None):
+    user = User(id=chat_id, is_bot=False, first_name="Иван")
+    message = Message(
+        message_id=update_id, date=datetime.now(), chat=Chat(id=chat_id, type="private"),
+        from_user=user, text=text, contact=contact,
+    )
+    return Update(update_id=update_id, message=message)
+
+
+def callback_update(update_id, chat_id, data):
+    user = User(id=chat_id, is_bot=False, first_name="Иван")
+    message = Message(message_id=update_id, date=datetime.now(), chat=Chat(id=chat_id, type="private"), text="-")
+    return Update(update_id=update_id, callback_query=CallbackQuery(
+        id=str(update_id), from_user=user, chat_instance="1", data=data, message=message))
+
+
+async def noop(*args, **kwargs):
+    pass
+
+
+def add_commands(dp):
+    dp.message(Command("start"))(noop)
+    dp.message(Command("help"))(noop)
+    dp.message(Command("cancel"))(noop)
+    dp.message(Command("leads"), F.from_user.id.in_([1]))(noop)
+
+
+# Старая схема: обработчик на каждое состояние
+def before_dispatcher():
+    dp = Dispatcher(storage=MemoryStorage())
+    add_commands(dp)
+    for step in QUESTIONNAIRE:
+        dp.message(getattr(Form, step.name))(noop)
+    dp.message(lambda message: message.text == BACK_BUTTON)(noop)
+    return dp
+
+
+# Новая схема: один обработчик с поиском шага по таблице
+def after_dispatcher():
+    dp = Dispatcher(storage=MemoryStorage())
+    add_commands(dp)
+    dp.message(StepFilter())(noop)
+    dp.message(F.text == BACK_BUTTON)(noop)
+    return dp
+
+
+async def state_of(dp, bot, chat_id):
+    return await dp.storage.get_state(StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=chat_id))
+
+
+# Проход анкеты настоящим bot.dp
+async def check_navigation():
+    import bot as bot_module
+
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    session = RecordingSession()
+    bot_module.bot.session = session
+    dp, bot = bot_module.dp, bot_module.bot
+    update_id = 0
+
+    async def send(text=None, contact=None, data=None):
+        nonlocal update_id
+        update_id += 1
+        if data is not None:
+            await dp.feed_update(bot, callback_update(update_id, USER_ID, data))
+        else:
+            await dp.feed_update(bot, message_update(update_id, USER_ID, text, contact))
+        return await state_of(dp, bot, USER_ID)
+
+    assert await send("/start") == Form.residence.state
+    for step in STEPS.values():
+        if step.name == "satisfaction":
+            # Ответ не из вариантов — остаёмся на шаге
+            assert await send("что-то своё") == step.state
+            assert session.sent[-1] == step.error_text
+        if step.name == "budget":
+            # «Назад» возвращает на предыдущий шаг, после ответа идём дальше
+            assert await send(BACK_BUTTON) == step.previous
+            await send(ANSWERS["location"])
+        if step.name == "contact_method":
+            assert await send("Другое") == step.state
+            assert await send("Viber") == step.next
+            continue
+        new_state = await send(ANSWERS[step.name])
+        assert new_state == (step.next or Form.confirm.state), (step.name, new_state)
+
+    data = await dp.storage.get_data(StorageKey(bot_id=bot.id, chat_id=USER_ID, user_id=USER_ID))
+    assert data["phone"] == "79991234567" and data["contact_method"] == "Viber", data
+
+    # Редактирование контактов: с имени до подтверждения, телефон — контактом
+    await send(data="❌ Изменить")
+    assert await send(data="📞 Контактные данные") == Form.name.state
+    for name in ("name", "contact_method", "contact_time"):
+        await send(ANSWERS[name])
+    contact = Contact(phone_number="+7 912 000-00-00", first_name="Иван", user_id=USER_ID)
+    assert await send(contact=contact) == Form.confirm.state
+    assert "Проверьте введенные данные" in session.sent[-1]
+
+
+async def measure(dp, bot, updates):
+    per_step = {}
+    chats_per_step = max(updates // len(QUESTIONNAIRE), 1)
+    update_id = 0
+    for index, step in enumerate(QUESTIONNAIRE):
+        # Каждый пользователь стоит на своём шаге
+        chat_ids = range(index * chats_per_step + 1000, (index + 1) * chats_per_step + 1000)
+        for chat_id in chat_ids:
+            await dp.storage.set_state(StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=chat_id), getattr(Form, step.name).state)
+        batch = []
+        for chat_id in chat_ids:
+            update_id += 1
+            batch.append(message_update(update_id, chat_id, ANSWERS[step.name]))
+        started = time.perf_counter()
+        for update in batch:
+            await dp.feed_update(bot, update)
+        per_step[step.name] = (time.perf_counter() - started) / len(batch)
+    return per_step
+
+
+async def main(args):
+    await check_navigation()
+    print("navigation: ok")
+
+    bot = Bot(os.environ["BOT_TOKEN"], session=RecordingSession())
+    results = {}
+    for name, factory in (("before", before_dispatcher), ("after", after_dispatcher)):
+        dp = factory()
+        await measure(dp, bot, len(QUESTIONNAIRE) * 50)  # прогрев
+        results[name] = await measure(dp, bot, args.updates)
+
+    print(f"{'step':<16} {'before, us':>11} {'after, us':>10}")
+    for step in QUESTIONNAIRE:
+        print(f"{step.name:<16} {results['before'][step.name] * 1e6:>11.1f} {results['after'][step.name] * 1e6:>10.1f}")
+    before = sum(results["before"].values()) / len(QUESTIONNAIRE)
+    after = sum(results["after"].values()) / len(QUESTIONNAIRE)
+    print(f"{'mean':<16} {before * 1e6:>11.1f} {after * 1e6:>10.1f}  ({before / after:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000, help="обновлений на схему")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,176 @@
+"""Оценка заявок (scoring.py): одна заявка при подтверждении и пересчёт всего архива.
+
+Архив заполняется --leads синтетическими заявками (как в bench_leads.py).
+
+1. Одна заявка: время LeadScorer.score по ответам анкеты, как в confirm_data.
+2. Пересчёт архива тремя способами, у каждого — время и заявок в секунду:
+   rows    — заявки читаются пачками, оценка считается по строке, UPDATE через executemany;
+   columns — то же, но оценка пачки считается по столбцам (LeadScorer.score_columns);
+   sql     — scoring.rescore_archive (как /rescore): выражение модели вычисляет SQLite пачками
+             через поток LeadStore, строки в Python не передаются.
+   Перед каждым способом оценки сбрасываются; проверяется, что все три дают те же оценки,
+   что и LeadScorer.score по каждой заявке.
+3. Новые заявки во время пересчёта: пока идёт rescore_archive (пачками по --batch-size и
+   одной пачкой на весь архив), LeadStore.add того же архива сохраняет заявку каждые 10 мс.
+   Выводятся медиана и максимум времени сохранения: столько ждал бы ответа клиент на
+   «Подтвердить».
+4. Распределение оценок, доля горячих и время /leads score=LEAD_HOT_SCORE по индексу.
+
+Пример:
+    python benchmarks/bench_scoring.py --leads 1000000
+    python benchmarks/bench_scoring.py --path /tmp/leads.sqlite3 --batch-size 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from operator import itemgetter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from bench_leads import OPTIONS, seed  # noqa: E402
+
+from leads import LeadStore  # noqa: E402
+from scoring import LeadScorer, rescore_archive  # noqa: E402
+
+FETCH_BATCH = 50_000
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+def reset(db):
+    with db:
+        db.execute("UPDATE leads SET score = NULL")
+
+
+def scores(db):
+    return [row[0] for row in db.execute("SELECT score FROM leads ORDER BY id")]
+
+
+# Пересчёт в Python: пачки заявок по id, оценка по строкам или по столбцам, запись executemany.
+# Возвращает время чтения, оценки и записи
+def rescore_python(db, scorer, columnar):
+    fields = ", ".join(scorer.fields)
+    spent = {"read": 0.0, "score": 0.0, "write": 0.0}
+    last = 0
+    while True:
+        started = time.perf_counter()
+        rows = db.execute(f"SELECT id, {fields} FROM leads WHERE id > ? ORDER BY id LIMIT ?", (last, FETCH_BATCH)).fetchall()
+        spent["read"] += time.perf_counter() - started
+        if not rows:
+            return spent
+        last = rows[-1][0]
+        started = time.perf_counter()
+        if columnar:
+            ids = list(map(itemgetter(0), rows))
+            values = scorer.score_columns([list(map(itemgetter(index), rows)) for index in range(1, len(scorer.fields) + 1)])
+        else:
+            ids = [row[0] for row in rows]
+            values = [scorer.score(dict(zip(scorer.fields, row[1:]))) for row in rows]
+        spent["score"] += time.perf_counter() - started
+        started = time.perf_counter()
+        with db:
+            db.executemany("UPDATE leads SET score = ? WHERE id = ?", zip(values, ids))
+        spent["write"] += time.perf_counter() - started
+
+
+# Время сохранения новых заявок, пока rescore_archive обновляет архив пачками по batch_size
+async def inserts_during_rescore(path, scorer, batch_size):
+    store = LeadStore(path)
+    task = asyncio.create_task(rescore_archive(scorer, store, batch_size))
+    data = {field: values[0] for field, values in OPTIONS.items()}
+    latencies = []
+    while not task.done():
+        started = time.perf_counter()
+        await store.add(data, 0, score=scorer.score(data))
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+    total = await task
+    await store.close()
+    return total, latencies
+
+
+async def run(args):
+    tmp = tempfile.mkdtemp()
+    path = args.path or os.path.join(tmp, "leads.sqlite3")
+    random.seed(1)
+    seed(path, args.leads)
+    scorer = LeadScorer()
+    db = sqlite3.connect(path)
+    total = db.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+    print(f"leads={total} batch_size={args.batch_size} hot>={scorer.hot}")
+
+    # 1. Одна заявка
+    samples = [{field: random.choice(values) for field, values in OPTIONS.items()} for _ in range(100_000)]
+    started = time.perf_counter()
+    for data in samples:
+        scorer.score(data)
+    print(f"single lead: {(time.perf_counter() - started) / len(samples) * 1e6:.2f} us per score")
+
+    # Эталон: оценка каждой заявки по строке
+    fields = ", ".join(scorer.fields)
+    reference = [scorer.score(dict(zip(scorer.fields, row))) for row in db.execute(f"SELECT {fields} FROM leads ORDER BY id")]
+
+    # 2. Пересчёт архива
+    print(f"{'method':<8} {'total s':>8} {'leads/s':>10} {'read s':>7} {'score s':>8} {'write s':>8}")
+    results = {}
+    for method in ("rows", "columns", "sql"):
+        reset(db)
+        started = time.perf_counter()
+        if method == "sql":
+            store = LeadStore(path)
+            await rescore_archive(scorer, store, args.batch_size)
+            await store.close()
+        else:
+            spent = rescore_python(db, scorer, columnar=method == "columns")
+        elapsed = results[method] = time.perf_counter() - started
+        parts = "" if method == "sql" else f" {spent['read']:>7.2f} {spent['score']:>8.2f} {spent['write']:>8.2f}"
+        print(f"{method:<8} {elapsed:>8.2f} {total / elapsed:>10,.0f}{parts}")
+        assert scores(db) == reference, f"{method}: оценки расходятся с LeadScorer.score"
+    print(f"sql is {results['rows'] / results['sql']:.1f}x faster than rows, {results['columns'] / results['sql']:.1f}x than columns")
+    db.close()
+
+    # 3. Новые заявки во время пересчёта
+    print(f"{'rescore batch':<14} {'rescore s':>9} {'adds':>5} {'add p50 ms':>11} {'add max ms':>11}")
+    for batch_size in (args.batch_size, total + args.leads):
+        started = time.perf_counter()
+        _, latencies = await inserts_during_rescore(path, scorer, batch_size)
+        elapsed = time.perf_counter() - started
+        label = str(batch_size) if batch_size == args.batch_size else "whole archive"
+        print(f"{label:<14} {elapsed:>9.2f} {len(latencies):>5} {percentile(latencies, 0.5) * 1000:>11.1f} "
+              f"{max(latencies) * 1000:>11.1f}")
+        if batch_size == args.batch_size:
+            batched_max = max(latencies)
+    assert batched_max < 0.5, "новая заявка ждёт пачку пересчёта дольше 0,5 с"
+
+    # 4. Распределение оценок и список горячих заявок
+    db = sqlite3.connect(path)
+    buckets = dict(db.execute("SELECT MIN(score / 10, 9), COUNT(*) FROM leads GROUP BY 1"))
+    db.close()
+    print("scores: " + "  ".join(f"{bucket * 10}-{bucket * 10 + 9 + (bucket == 9)}: {buckets.get(bucket, 0) / sum(buckets.values()):.1%}"
+                                  for bucket in range(10)))
+    store = LeadStore(path)
+    started = time.perf_counter()
+    hot = await store.count(score_min=scorer.hot)
+    page = await store.search(limit=10, score_min=scorer.hot)
+    print(f"hot leads: {hot} ({hot / sum(buckets.values()):.1%}), /leads score={scorer.hot}: "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+    assert all(lead["score"] >= scorer.hot for lead in page)
+    await store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1_000_000, help="заявок в архиве")
+    parser.add_argument("--path", help="архив заявок (по умолчанию — во временном каталоге; дополняется до --leads)")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="заявок в одной транзакции пересчёта (LEAD_SCORE_BATCH_SIZE)")
+    asyncio.run(run(parser.parse_args()))
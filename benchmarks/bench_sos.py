@@ -0,0 +1,196 @@
+"""Задержка SOS при насыщенной обычной рассылке: /sos обгоняет заявки и напоминания.
+
+bot.py запускается с заглушкой Bot API (fake_telegram.py, задержка ответа --latency)
+и стандартными лимитами рассылки (NOTIFY_GLOBAL_RATE, NOTIFY_PER_CHAT_RATE). Перед
+запуском в очередь заявок кладётся --backlog сообщений каждому из --admins
+администраторов, а --idle пользователей начинают анкету и получают напоминания
+каждую секунду (REMINDER_DELAYS=1,1,...): лимит на чат администратора и общий лимит
+бота заняты обычной рассылкой всё время замера.
+
+Затем --sos пользователей по очереди (раз в --interval секунд) отправляют /sos.
+Первый перед этим присылает 30 сообщений подряд: защита от флуда отбрасывает часть
+из них, но /sos проходит. Для каждого запроса замеряется время от доставки обновления
+в бот до ответа пользователю и до получения SOS последним из администраторов; оно
+должно быть не больше --bound секунд. Повторный /sos в пределах SOS_COOLDOWN
+не отправляется администраторам ещё раз.
+
+Для сравнения выводится время доставки из обычной очереди заявок по метрике
+bot_outbox_delivery_seconds: столько ждал бы SOS, если бы шёл общей очередью.
+
+Пример:
+    python benchmarks/bench_sos.py --admins 10 --sos 20
+    python benchmarks/bench_sos.py --idle 5000 --bound 2
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiohttp import ClientSession  # noqa: E402
+
+from fake_telegram import FakeBotAPI, text_update  # noqa: E402
+from flood import SOS_REPEAT_TEXT  # noqa: E402
+from outbox import Outbox  # noqa: E402
+
+TOKEN = "123456:SOS"
+FIRST_ADMIN = 100
+FIRST_SOS_USER = 1_000_000
+FIRST_IDLE_USER = 2_000_000
+SOS_ID = re.compile(r"ID пользователя: (\d+)")
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+# Обычная очередь заявок, накопившаяся к запуску бота
+async def seed_backlog(path, admins, backlog):
+    outbox = Outbox(None, path=path)
+    await asyncio.gather(*(outbox.enqueue(admins, f"📨 Заявка {index}") for index in range(backlog)))
+    await outbox.close()
+
+
+# Сумма и число наблюдений гистограммы по очереди из текста /metrics
+def delivery_stats(text, queue):
+    values = {}
+    for kind in ("sum", "count"):
+        match = re.search(rf'^bot_outbox_delivery_seconds_{kind}{{queue="{queue}"}} (\S+)$', text, re.M)
+        values[kind] = float(match.group(1)) if match else 0.0
+    return values["sum"], int(values["count"])
+
+
+async def run(args, tmp):
+    admins = [FIRST_ADMIN + index for index in range(args.admins)]
+    await seed_backlog(os.path.join(tmp, "outbox.sqlite3"), admins, args.backlog)
+
+    api = FakeBotAPI(latency=args.latency)
+    await api.start("127.0.0.1", args.api_port)
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_MODE="polling",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        METRICS_PORT=str(args.metrics_port),
+        METRICS_HOST="127.0.0.1",
+        ADMIN_IDS=",".join(map(str, admins)),
+        FSM_STORAGE="memory",
+        REMINDER_DELAYS=",".join(["1"] * 600),
+        REMINDER_RATE="1000",
+        LEADS_PATH=os.path.join(tmp, "leads.sqlite3"),
+        OUTBOX_PATH=os.path.join(tmp, "outbox.sqlite3"),
+        SOS_OUTBOX_PATH=os.path.join(tmp, "sos.sqlite3"),
+        BROADCASTS_PATH=os.path.join(tmp, "broadcasts.sqlite3"),
+        FUNNEL_PATH=os.path.join(tmp, "funnel.log"),
+        REMINDERS_PATH=os.path.join(tmp, "reminders.sqlite3"),
+    )
+    log = open(os.path.join(tmp, "bot.log"), "w")
+    process = subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        await asyncio.wait_for(api.polling.wait(), timeout=60)
+        inboxes = {admin: api.subscribe(admin) for admin in admins}
+        for index in range(args.idle):
+            await api.deliver(text_update(api.next_update_id(), FIRST_IDLE_USER + index, "/start"))
+        # Напоминания начинают приходить через секунду после шага
+        await asyncio.sleep(args.warmup)
+
+        received = {}
+
+        async def collect(admin, inbox):
+            while True:
+                message = await inbox.get()
+                match = SOS_ID.search(message.get("text", ""))
+                if match:
+                    received.setdefault(int(match.group(1)), []).append((admin, time.perf_counter()))
+
+        collectors = [asyncio.create_task(collect(admin, inbox)) for admin, inbox in inboxes.items()]
+        calls_before = api.calls["sendMessage"]
+        window_started = time.perf_counter()
+
+        sos_users = [FIRST_SOS_USER + index for index in range(args.sos)]
+        sent_at, replied = {}, {}
+        for index, user_id in enumerate(sos_users):
+            inbox = api.subscribe(user_id)
+            if index == 0:
+                for number in range(30):
+                    await api.deliver(text_update(api.next_update_id(), user_id, f"сообщение {number}"))
+            sent_at[user_id] = time.perf_counter()
+            await api.deliver(text_update(api.next_update_id(), user_id, "/sos"))
+            while True:
+                message = await asyncio.wait_for(inbox.get(), timeout=args.bound * 10)
+                if message.get("text", "").startswith("🆘 Запрос отправлен"):
+                    replied[user_id] = time.perf_counter() - sent_at[user_id]
+                    break
+            api.unsubscribe(user_id)
+            await asyncio.sleep(args.interval)
+
+        # Повторный /sos первого пользователя: ответ есть, администраторам не отправляется
+        repeat = api.subscribe(sos_users[0])
+        await api.deliver(text_update(api.next_update_id(), sos_users[0], "/sos"))
+        repeat_text = (await asyncio.wait_for(repeat.get(), timeout=10)).get("text")
+
+        deadline = time.perf_counter() + args.bound * 10
+        while time.perf_counter() < deadline and any(len(received.get(user, ())) < len(admins) for user in sos_users):
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(1)
+        window = time.perf_counter() - window_started
+        regular_rate = (api.calls["sendMessage"] - calls_before) / window
+        for task in collectors:
+            task.cancel()
+
+        async with ClientSession() as http:
+            async with http.get(f"http://127.0.0.1:{args.metrics_port}/metrics") as response:
+                metrics = await response.text()
+    finally:
+        process.terminate()
+        process.wait()
+        await api.close()
+
+    latencies = []
+    for user_id in sos_users:
+        deliveries = received.get(user_id, [])
+        assert len(deliveries) == len(admins), f"SOS пользователя {user_id} получили {len(deliveries)} из {len(admins)} администраторов"
+        latencies.append(max(at for _, at in deliveries) - sent_at[user_id])
+    replies = list(replied.values())
+
+    print(f"admins={args.admins} backlog={args.backlog} idle={args.idle} sos={args.sos} latency={args.latency * 1000:.0f} ms")
+    print(f"regular traffic during test: {regular_rate:.1f} sendMessage/s")
+    print(f"{'':<16} {'p50 s':>7} {'p99 s':>7} {'max s':>7}")
+    print(f"{'sos reply':<16} {percentile(replies, 0.5):>7.2f} {percentile(replies, 0.99):>7.2f} {max(replies):>7.2f}")
+    print(f"{'sos all admins':<16} {percentile(latencies, 0.5):>7.2f} {percentile(latencies, 0.99):>7.2f} {max(latencies):>7.2f}")
+    for queue in ("sos", "leads"):
+        total, count = delivery_stats(metrics, queue)
+        print(f"outbox {queue:<6}: {count} delivered, mean {total / max(count, 1):.2f} s from enqueue")
+    print(f"repeated /sos: {repeat_text!r}")
+
+    assert repeat_text == SOS_REPEAT_TEXT, "повторный /sos должен получить ответ о уже отправленном запросе"
+    assert max(latencies) <= args.bound, f"SOS доставлен за {max(latencies):.2f} с, больше {args.bound} с"
+
+
+async def main(args):
+    tmp = tempfile.mkdtemp()
+    await run(args, tmp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--admins", type=int, default=10, help="администраторов")
+    parser.add_argument("--backlog", type=int, default=300, help="заявок в очереди каждому администратору к запуску")
+    parser.add_argument("--idle", type=int, default=2000, help="пользователей, получающих напоминания")
+    parser.add_argument("--sos", type=int, default=20, help="запросов /sos от разных пользователей")
+    parser.add_argument("--interval", type=float, default=1.5,
+                        help="пауза между запросами /sos, секунды (не меньше 1 / NOTIFY_PER_CHAT_RATE: лимит чата администратора действует и на SOS)")
+    parser.add_argument("--warmup", type=float, default=5, help="сколько ждать до первого /sos, секунды")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка ответов заглушки, секунды")
+    parser.add_argument("--bound", type=float, default=2.0, help="наибольшая допустимая задержка SOS, секунды")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--metrics-port", type=int, default=9190)
+    asyncio.run(main(parser.parse_args()))
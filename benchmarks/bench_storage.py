@@ -0,0 +1,80 @@
+"""Бенчмарк хранилищ FSM на полном прохождении анкеты Form.
+
+Каждый виртуальный пользователь проходит все состояния Form так же, как это
+делает бот на одно обновление: чтение состояния (фильтр), update_data с ответом
+и переход в следующее состояние. Сравниваются MemoryStorage, SQLiteStorage и
+RedisStorage (на локальном сервере из fake_redis.py).
+
+Пример:
+    python benchmarks/bench_storage.py --users 500
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+from questionnaire import Form  # noqa: E402
+from fake_redis import FakeRedis  # noqa: E402
+from storage import RedisStorage, SQLiteStorage  # noqa: E402
+
+STATES = Form.__all_states__
+
+
+async def walk(storage, user_id, latencies):
+    state = FSMContext(storage=storage, key=StorageKey(bot_id=1, chat_id=user_id, user_id=user_id))
+    for index, form_state in enumerate(STATES):
+        started = time.perf_counter()
+        await state.get_state()
+        await state.update_data({form_state.state.split(":")[1]: f"ответ {index}"})
+        if index + 1 < len(STATES):
+            await state.set_state(STATES[index + 1])
+        else:
+            await state.get_data()
+            await state.clear()
+        latencies.append(time.perf_counter() - started)
+        # Пользователь отвечает не мгновенно — даём другим пройти шаг
+        await asyncio.sleep(0)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def bench(name, storage, users):
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(walk(storage, user_id, latencies) for user_id in range(1, users + 1)))
+    await storage.close()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{name:<8} steps={len(latencies):<7} {len(latencies) / elapsed:>9.0f} steps/s  "
+        f"p50={percentile(latencies, 0.5) * 1e6:>7.0f} us  p99={percentile(latencies, 0.99) * 1e6:>7.0f} us"
+    )
+
+
+async def main(args):
+    await bench("memory", MemoryStorage(), args.users)
+
+    with tempfile.TemporaryDirectory() as directory:
+        await bench("sqlite", SQLiteStorage(os.path.join(directory, "fsm.sqlite3")), args.users)
+
+    fake = FakeRedis()
+    port = await fake.start()
+    await bench("redis", RedisStorage(f"redis://127.0.0.1:{port}/0"), args.users)
+    await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""Минимальный сервер с протоколом Redis (RESP2) для локальных тестов.
+
+Поддерживает HELLO (RESP2/RESP3), GET, SET (с EX/PX), DEL, EXISTS, PING;
+на остальные команды (CLIENT SETINFO, SELECT и т.п.) отвечает +OK.
+"""
+import asyncio
+import time
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.server = None
+        self.connections = {}
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        tasks = list(self.connections.values())
+        for writer in list(self.connections):
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:])
+        args = []
+        for _ in range(count):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    def alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires < time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def execute(self, args, session):
+        command = args[0].upper()
+        if command == b"GET":
+            if not self.alive(args[1]):
+                return b"_\r\n" if session["protocol"] == 3 else b"$-1\r\n"
+            value = self.data[args[1]]
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if command == b"SET":
+            self.data[args[1]] = args[2]
+            self.expires.pop(args[1], None)
+            options = [a.upper() for a in args[3:]]
+            if b"EX" in options:
+                self.expires[args[1]] = time.monotonic() + int(args[3 + options.index(b"EX") + 1])
+            if b"PX" in options:
+                self.expires[args[1]] = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            return b"+OK\r\n"
+        if command == b"DEL":
+            removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % removed
+        if command == b"EXISTS":
+            return b":%d\r\n" % sum(1 for key in args[1:] if self.alive(key))
+        if command == b"HELLO":
+            session["protocol"] = int(args[1]) if len(args) > 1 else 2
+            return b"%%2\r\n$6\r\nserver\r\n$5\r\nredis\r\n$5\r\nproto\r\n:%d\r\n" % session["protocol"]
+        if command == b"PING":
+            return b"+PONG\r\n"
+        return b"+OK\r\n"
+
+    async def handle(self, reader, writer):
+        session = {"protocol": 2}
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                args = await self.read_command(reader)
+                if args is None:
+                    break
+                writer.write(self.execute(args, session))
+                await writer.drain()
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
@@ -0,0 +1,243 @@
+"""Заглушка Telegram Bot API для сквозных нагрузочных тестов bot.py.
+
+Поддерживает getMe, getUpdates (long polling), setWebhook/deleteWebhook/getWebhookInfo,
+sendMessage, editMessageText, sendDocument и answerCallbackQuery; остальные методы отвечают true. Каждый ответ
+задерживается на latency секунд, а sendMessage и editMessageText с вероятностью p429
+отвечают 429 Too Many Requests. Сообщения бота хранятся по чатам и передаются
+подписчикам (виртуальным пользователям), обновления доставляются в бот через
+getUpdates или POST на зарегистрированный webhook.
+
+Как и настоящий Bot API, getUpdates отдаёт обновления, пока бот не подтвердит их
+следующим запросом с offset больше их update_id, а webhook повторяет доставку, пока
+сервер бота не ответит 2xx, — так перезапуск бота можно проверить на потери и дубли.
+
+Используется из bench_e2e.py:
+    api = FakeBotAPI(latency=0.02, p429=0.01)
+    await api.start("127.0.0.1", 8081)
+    inbox = api.subscribe(chat_id)
+    await api.deliver(text_update(api.next_update_id(), chat_id, "/start"))
+    reply = await inbox.get()
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Optional
+
+from aiohttp import ClientError, ClientSession, web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+# Методы, в которых имитируется превышение лимитов Telegram
+LIMITED_METHODS = {"sendMessage", "editMessageText"}
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"}
+
+
+def _message(update_id: int, user_id: int, **fields) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            **fields,
+        },
+    }
+
+
+# Текстовое сообщение пользователя (команды размечаются, как это делает Telegram)
+def text_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    if text.startswith("/"):
+        command = text.split()[0]
+        return _message(update_id, user_id, text=text, entities=[{"type": "bot_command", "offset": 0, "length": len(command)}])
+    return _message(update_id, user_id, text=text)
+
+
+# Контакт, отправленный кнопкой «Отправить контакт»
+def contact_update(update_id: int, user_id: int, phone_number: str) -> Dict[str, Any]:
+    return _message(update_id, user_id, contact={"phone_number": phone_number, "first_name": "User", "user_id": user_id})
+
+
+# Нажатие инлайн-кнопки под сообщением бота message
+def callback_update(update_id: int, user_id: int, message: Dict[str, Any], data: str) -> Dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        },
+    }
+
+
+# Текст кнопок инлайн-клавиатуры сообщения (пустой список, если клавиатуры нет)
+def inline_buttons(message: Dict[str, Any]) -> list:
+    markup = message.get("reply_markup") or {}
+    return [button["text"] for row in markup.get("inline_keyboard", []) for button in row]
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, p429: float = 0.0, retry_after: int = 1, seed: Optional[int] = None):
+        self.latency = latency
+        self.p429 = p429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.limited: Counter = Counter()
+        self.messages: Dict[int, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+        # Содержимое отправленных документов по file_id
+        self.documents: Dict[str, bytes] = {}
+        self.polling = asyncio.Event()
+        self.webhook_set = asyncio.Event()
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._pending: list = []
+        self._arrived = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._subscribers: Dict[int, asyncio.Queue] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self._http: Optional[ClientSession] = None
+
+    async def start(self, host: str, port: int):
+        # Документы принимаются до 50 МБ, как в Bot API
+        app = web.Application(client_max_size=50 * 2 ** 20)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        # Запрос, клиент которого отключился до ответа, не выполняется: как будто он
+        # ещё не дошёл до Telegram, когда бот был остановлен
+        self._runner = web.AppRunner(app, access_log=None, handler_cancellation=True)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port, backlog=1024).start()
+        self._http = ClientSession()
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+    # Очередь сообщений бота в чате: новые и отредактированные сообщения по порядку
+    def subscribe(self, chat_id: int) -> asyncio.Queue:
+        queue = self._subscribers[chat_id] = asyncio.Queue()
+        return queue
+
+    def unsubscribe(self, chat_id: int):
+        self._subscribers.pop(chat_id, None)
+
+    # Доставка обновления в бот: через webhook, если он зарегистрирован, иначе через getUpdates.
+    # Webhook повторяется (каждый раз по текущему адресу), пока бот не ответит 2xx
+    async def deliver(self, update: Dict[str, Any], retry_delay: float = 0.2):
+        while True:
+            if self.webhook_url is None:
+                self._pending.append(update)
+                self._arrived.set()
+                return
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+            try:
+                async with self._http.post(self.webhook_url, json=update, headers=headers) as response:
+                    if response.status < 300:
+                        return
+            except (OSError, ClientError):
+                pass
+            await asyncio.sleep(retry_delay)
+
+    @staticmethod
+    def ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    def too_many_requests(self) -> web.Response:
+        return web.json_response({
+            "ok": False,
+            "error_code": 429,
+            "description": f"Too Many Requests: retry after {self.retry_after}",
+            "parameters": {"retry_after": self.retry_after},
+        }, status=429)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.can_read_body else {}
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return self.ok(await self._get_updates(
+                int(data.get("offset", 0)), int(data.get("limit", 100)), float(data.get("timeout", 0))))
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method in LIMITED_METHODS and self.p429 and self.random.random() < self.p429:
+            self.limited[method] += 1
+            return self.too_many_requests()
+
+        if method == "getMe":
+            return self.ok(BOT_USER)
+        if method == "setWebhook":
+            self.webhook_url = data["url"]
+            self.webhook_secret = data.get("secret_token")
+            self.webhook_set.set()
+            return self.ok(True)
+        if method == "getWebhookInfo":
+            return self.ok({"url": self.webhook_url or "", "has_custom_certificate": False, "pending_update_count": 0})
+        if method == "deleteWebhook":
+            self.webhook_url = None
+            return self.ok(True)
+        if method == "sendMessage":
+            chat_id = int(data["chat_id"])
+            message = {"message_id": next(self._message_ids), "date": int(time.time()), "from": BOT_USER,
+                       "chat": {"id": chat_id, "type": "private"}, "text": data.get("text", "")}
+            return self.ok(self._store(chat_id, message, data))
+        if method == "sendDocument":
+            chat_id = int(data["chat_id"])
+            # aiogram передаёт файл отдельным полем формы: document=attach://<поле>
+            upload = data[data["document"].removeprefix("attach://")]
+            file_id = f"document{len(self.documents) + 1}"
+            self.documents[file_id] = upload.file.read()
+            message = {"message_id": next(self._message_ids), "date": int(time.time()), "from": BOT_USER,
+                       "chat": {"id": chat_id, "type": "private"}, "caption": data.get("caption", ""),
+                       "document": {"file_id": file_id, "file_unique_id": file_id, "file_name": upload.filename,
+                                    "file_size": len(self.documents[file_id])}}
+            return self.ok(self._store(chat_id, message, data))
+        if method == "editMessageText":
+            chat_id = int(data["chat_id"])
+            message = self.messages[chat_id].get(int(data["message_id"]))
+            if message is None:
+                return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: message to edit not found"}, status=400)
+            if message["text"] == data.get("text") and json.loads(data.get("reply_markup", "null")) == message.get("reply_markup"):
+                return web.json_response({"ok": False, "error_code": 400, "description": "Bad Request: message is not modified"}, status=400)
+            message = dict(message, text=data.get("text", ""), edit_date=int(time.time()))
+            message.pop("reply_markup", None)
+            return self.ok(self._store(chat_id, message, data))
+        return self.ok(True)
+
+    # Сохранение сообщения бота (с клавиатурой, если она инлайн) и уведомление подписчика чата
+    def _store(self, chat_id: int, message: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        markup = json.loads(data["reply_markup"]) if data.get("reply_markup") else None
+        if markup and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        self.messages[chat_id][message["message_id"]] = message
+        subscriber = self._subscribers.get(chat_id)
+        if subscriber is not None:
+            subscriber.put_nowait(message)
+        return message
+
+    # Обновления с update_id меньше offset считаются подтверждёнными и удаляются,
+    # остальные отдаются (и остаются в очереди) до следующего подтверждения
+    async def _get_updates(self, offset: int, limit: int, timeout: float) -> list:
+        self.polling.set()
+        if offset:
+            self._pending = [update for update in self._pending if update["update_id"] >= offset]
+        if not self._pending and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._pending[:limit]
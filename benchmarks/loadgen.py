@@ -0,0 +1,174 @@
+"""Нагрузочный генератор для сравнения polling- и webhook-режимов бота.
+
+Поднимает локальную заглушку Bot API, запускает bot.py отдельным процессом
+(BOT_MODE=polling или webhook) и подаёт ему синтетические Update с командой
+/start от разных пользователей. Задержка обработчика считается как время от
+подачи обновления до прихода ответного sendMessage в заглушку.
+
+Пример:
+    python benchmarks/loadgen.py --mode webhook --updates 5000 --concurrency 200
+    python benchmarks/loadgen.py --mode polling --updates 5000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from aiohttp import ClientSession, web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:LOADTEST"
+SECRET = "loadgen-secret"
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.pending = asyncio.Queue()
+        self.sent_at = {}
+        self.answered_at = {}
+        self.done = asyncio.Event()
+        self.expected = 0
+        self.ready = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post()) if request.can_read_body else {}
+
+        if method == "getMe":
+            self.ready.set()
+            return self.ok({"id": 123456, "is_bot": True, "first_name": "loadtest", "username": "loadtest_bot"})
+        if method == "getUpdates":
+            return self.ok(await self.get_updates(float(data.get("timeout", 0))))
+        if method == "sendMessage":
+            chat_id = int(data["chat_id"])
+            if chat_id not in self.answered_at:
+                self.answered_at[chat_id] = time.perf_counter()
+                if len(self.answered_at) >= self.expected:
+                    self.done.set()
+            return self.ok({
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            })
+        if method == "setWebhook":
+            self.ready.set()
+        return self.ok(True)
+
+    async def get_updates(self, timeout):
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.pending.get(), timeout=max(timeout, 0.1)))
+        except asyncio.TimeoutError:
+            return updates
+        while not self.pending.empty() and len(updates) < 100:
+            updates.append(self.pending.get_nowait())
+        return updates
+
+    @staticmethod
+    def ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+
+def make_update(update_id):
+    chat_id = 1_000_000 + update_id
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+async def feed_webhook(fake, url, count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+    async with ClientSession() as http:
+        async def post(update_id):
+            async with semaphore:
+                update = make_update(update_id)
+                fake.sent_at[update["message"]["chat"]["id"]] = time.perf_counter()
+                async with http.post(url, json=update, headers=headers) as response:
+                    response.raise_for_status()
+
+        await asyncio.gather(*(post(i) for i in range(1, count + 1)))
+
+
+async def feed_polling(fake, count):
+    for update_id in range(1, count + 1):
+        update = make_update(update_id)
+        fake.sent_at[update["message"]["chat"]["id"]] = time.perf_counter()
+        fake.pending.put_nowait(update)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(args):
+    fake = FakeTelegram()
+    fake.expected = args.updates
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        BOT_MODE=args.mode,
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.api_port}",
+        WEBHOOK_URL=f"http://127.0.0.1:{args.webhook_port}",
+        WEBHOOK_PORT=str(args.webhook_port),
+        WEBHOOK_SECRET=SECRET,
+        ADMIN_IDS="",
+    )
+    process = subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.wait_for(fake.ready.wait(), timeout=30)
+        await asyncio.sleep(0.5)
+
+        started = time.perf_counter()
+        if args.mode == "webhook":
+            await feed_webhook(fake, f"http://127.0.0.1:{args.webhook_port}/", args.updates, args.concurrency)
+        else:
+            await feed_polling(fake, args.updates)
+        await asyncio.wait_for(fake.done.wait(), timeout=args.timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+        await runner.cleanup()
+
+    latencies = [(fake.answered_at[c] - fake.sent_at[c]) * 1000 for c in fake.answered_at]
+    print(f"mode={args.mode} updates={args.updates}")
+    print(f"throughput: {args.updates / elapsed:.0f} updates/s")
+    print(f"latency p50: {percentile(latencies, 0.50):.1f} ms")
+    print(f"latency p99: {percentile(latencies, 0.99):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="webhook")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8080)
+    parser.add_argument("--timeout", type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
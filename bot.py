@@ -1,124 +1,192 @@
+import asyncio
+import gc
 import logging
-import re
-import os
+import tempfile
+import time
 from datetime import datetime
+from typing import Any, Dict, Optional
+from html import escape
 
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters.command import Command
+from aiogram import Bot, types, F
+from aiogram.filters.command import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, ReplyKeyboardRemove, KeyboardButton, ReplyKeyboardMarkup
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.types import FSInputFile, Message
 from aiogram.client.default import DefaultBotProperties
-from dotenv import load_dotenv
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from broadcast import Broadcaster
+from config import (
+    ADMIN_IDS,
+    BOT_MODE,
+    BOT_TOKEN,
+    EXPORT_UPLOAD_TIMEOUT,
+    HOT_LEAD_ADMIN_IDS,
+    HOT_LEAD_HEAD_START,
+    LEADS_PAGE_SIZE,
+    SOS_OUTBOX_PATH,
+    WORKER_PORT,
+)
+from dedup import DuplicateIndex
+from export import export_leads, parse_export_args
+from flood import BoundedEventIsolation, FloodControlMiddleware
+from funnel import Funnel, FunnelStorage, format_report
+from keyboards import BACK_BUTTON, REMOVE_KEYBOARD, inline_keyboard, reply_keyboard
+from leads import LeadStore, parse_filters
+from logs import LogContextMiddleware, setup_logging
+from metrics import LEADS_CONFIRMED, LEADS_HOT, LEADS_MERGED, InstrumentedStorage, instrument, start_metrics_server
+from messages import DATA_VERSION, REMINDER_CONFIRM, REMINDER_STEP, SummaryRenderer, new_version
+from notify import AdminNotifier
+from outbox import Outbox
+from questionnaire import EDIT_SECTIONS, FIRST_STEP, STEPS, Form, Step, StepFilter, ask
+from reminders import ReminderScheduler, ReminderStorage
+from scoring import LeadScorer, rescore_archive
+from session import create_bot_session
+from shutdown import GracefulDispatcher
+from storage import create_storage
+
+# Настройка логирования: JSON-записи пишет отдельный поток, event loop только ставит их в очередь
+setup_logging()
+
+# Единственная HTTP-сессия процесса для Bot API и исходящих интеграций (см. session.py);
+# клавиатуры из реестра отправляются готовым JSON
+session = create_bot_session()
+
+# Напоминание пользователю, который остановился на шаге анкеты: вопрос шага (или сводка
+# на подтверждении) отправляется заново. Если пользователь уже не на этом шаге (например,
+# MemoryStorage потеряло анкету при перезапуске), заблокировал бота или удалил чат —
+# не отправляется; при сбое сети планировщик повторит попытку позже.
+# Напоминания расходуют общий лимит бота вместе с уведомлениями администраторов и
+# пропускают вперёд SOS
+async def nudge(chat_id: int, state_name: str, sent: int) -> bool:
+    context = dp.fsm.get_context(bot, chat_id=chat_id, user_id=chat_id)
+    if await context.get_state() != state_name:
+        return False
+    await notifier.global_bucket.acquire()
+    try:
+        if state_name == Form.confirm.state:
+            text = renderer.confirmation(chat_id, await context.get_data())
+            await bot.send_message(chat_id, REMINDER_CONFIRM.format(text), reply_markup=inline_keyboard("confirm"))
+        else:
+            step = STEPS[state_name]
+            await bot.send_message(chat_id, REMINDER_STEP.format(step.prompt), reply_markup=step.keyboard)
+    except (TelegramForbiddenError, TelegramBadRequest) as e:
+        logging.info(f"Напоминание в чат {chat_id} не отправлено: {e.message}")
+        return False
+    return True
+
+# Таймеры напоминаний (SQLite, переживают перезапуск)
+reminders = ReminderScheduler(nudge)
+# Журнал и сводка переходов по анкете для /stats
+funnel = Funnel()
 
-# Загрузка переменных окружения из файла .env
-load_dotenv()
+# Инициализация бота и диспетчера
+bot = Bot(token=BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode="HTML"))
+# Обновления одного чата обрабатываются по очереди, от флуда защищает отдельный middleware;
+# при остановке диспетчер дожидается начатых обработчиков (см. shutdown.py).
+# Переход на шаг анкеты ставит напоминание, уход из анкеты его отменяет; переходы пишутся в воронку
+dp = GracefulDispatcher(
+    storage=InstrumentedStorage(FunnelStorage(
+        ReminderStorage(create_storage(), reminders, frozenset(STEPS) | {Form.confirm.state}), funnel,
+    )),
+    events_isolation=BoundedEventIsolation(),
+)
+# Контекст обновления для журнала подключается первым, чтобы попасть во все записи
+dp.update.outer_middleware(LogContextMiddleware())
+# Метрики подключаются до защиты от флуда, чтобы учитывались и отброшенные обновления
+instrument(dp, bot)
+dp.update.outer_middleware(FloodControlMiddleware())
+# HTTP-сервер /metrics (запускается при старте бота)
+metrics_runner = None
+
+# Рассылка уведомлений администраторам
+notifier = AdminNotifier(bot)
+# Архив подтверждённых заявок и индекс повторных заявок того же клиента
+# (рабочие процессы кластера ищут повторные заявки в общем архиве, без фильтра в памяти)
+lead_store = LeadStore()
+duplicates = DuplicateIndex(lead_store, bloom=BOT_MODE != "worker")
+# Оценка заявок по ответам анкеты (модель из LEAD_SCORE_MODEL)
+scorer = LeadScorer()
+
+# Доставка сообщения из очереди outbox. Сообщение о заявке, которое администратор
+# уже получил, редактируется, а не отправляется заново. Отправка — одна попытка:
+# повторы после временных ошибок выполняет сама очередь
+async def deliver(chat_id: int, text: str, lead_id: Optional[int]) -> bool:
+    if lead_id is not None:
+        message_id = await lead_store.admin_message(lead_id, chat_id)
+        if message_id is not None and await notifier.edit(chat_id, message_id, text, retry=False):
+            return True
+    message_id = await notifier.send_message(chat_id, text, retry=False)
+    if message_id is None:
+        return False
+    if lead_id is not None:
+        await lead_store.save_admin_message(lead_id, chat_id, message_id)
+    return True
+
+# Надёжная очередь заявок для администраторов: сначала запись на диск, потом отправка
+outbox = Outbox(deliver)
+
+# Заявка в очередь администраторам. Горячая обгоняет накопившиеся заявки и сначала уходит
+# администраторам из HOT_LEAD_ADMIN_IDS, остальным — через HOT_LEAD_HEAD_START секунд
+async def enqueue_lead(text: str, lead_id: int, hot: bool):
+    if not hot:
+        await outbox.enqueue(ADMIN_IDS, text, lead_id=lead_id)
+        return
+    first = HOT_LEAD_ADMIN_IDS or ADMIN_IDS
+    rest = [admin_id for admin_id in ADMIN_IDS if admin_id not in first]
+    # Одновременные вызовы outbox записываются одной транзакцией
+    await asyncio.gather(
+        outbox.enqueue(first, text, lead_id=lead_id, priority=1),
+        outbox.enqueue(rest, text, lead_id=lead_id, priority=1, delay=HOT_LEAD_HEAD_START),
+    )
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Доставка срочного запроса: лимиты рассылки выдают ему токены раньше заявок и напоминаний
+async def deliver_sos(chat_id: int, text: str, lead_id: Optional[int]) -> bool:
+    return await notifier.send(chat_id, text, urgent=True, retry=False)
+
+# Очередь SOS: своя база и свой обработчик, поэтому запрос не ждёт ни записи, ни отправки
+# накопившихся заявок; повтор после сбоя — через секунду, а не через OUTBOX_BASE_DELAY
+sos_outbox = Outbox(deliver_sos, path=SOS_OUTBOX_PATH, base_delay=1, name="sos")
+# Тексты подтверждения и заявок по данным анкеты
+renderer = SummaryRenderer()
+
+BROADCAST_STATUSES = {"running": "⏳ идёт", "done": "✅ завершена", "cancelled": "⛔ отменена"}
+BROADCAST_USAGE = (
+    "Первая строка — фильтры как у /leads (type, budget, from, to; пусто — всем клиентам), "
+    "со второй — текст сообщения. Например:\n"
+    "<code>/broadcast type=Квартира; budget=3-5 млн ₽\nНовый ЖК у метро: квартиры от 4,2 млн ₽</code>\n\n"
+    "<code>/broadcast</code> — последние рассылки, <code>/broadcast cancel 7</code> — отменить рассылку №7"
+)
+
+# Состояние рассылки для администратора
+def describe_broadcast(broadcast: Dict[str, Any]) -> str:
+    processed = broadcast["delivered"] + broadcast["blocked"] + broadcast["failed"]
+    return (
+        f"📬 <b>Рассылка #{broadcast['id']}</b> — {BROADCAST_STATUSES[broadcast['status']]}\n"
+        f"Фильтры: {escape(broadcast['filters']) or 'все клиенты'}\n"
+        f"Получателей: {broadcast['total']}, обработано: {processed}\n"
+        f"✅ Доставлено: {broadcast['delivered']} • 🚫 Заблокировали бота: {broadcast['blocked']} • "
+        f"❌ Ошибок: {broadcast['failed']}"
+    )
 
-# Инициализация бота и диспетчера
-bot = Bot(token=os.getenv("BOT_TOKEN"), default=DefaultBotProperties(parse_mode="HTML"))
-dp = Dispatcher()
-
-# Определение состояний формы
-class Form(StatesGroup):
-    start = State()            # Начальное состояние
-    residence = State()        # Текущее жилье
-    satisfaction = State()     # Довольны ли текущими условиями
-    property_type = State()    # Тип недвижимости
-    location = State()         # Желаемое расположение
-    budget = State()           # Бюджет
-    search_status = State()    # Статус поиска
-    mortgage = State()         # Ипотека
-    purchase_time = State()    # Планируемое время покупки
-    name = State()             # Имя
-    contact_method = State()   # Способ связи
-    contact_method_text = State()  # Текстовый ввод способа связи
-    contact_time = State()     # Удобное время для связи
-    phone = State()            # Телефон
-    confirm = State()          # Подтверждение данных
-
-# Словарь для навигации назад (текущее состояние -> предыдущее состояние)
-PREVIOUS_STATES = {
-    Form.satisfaction: Form.residence,
-    Form.property_type: Form.satisfaction,
-    Form.location: Form.property_type,
-    Form.budget: Form.location,
-    Form.search_status: Form.budget,
-    Form.mortgage: Form.search_status,
-    Form.purchase_time: Form.mortgage,
-    Form.name: Form.purchase_time,
-    Form.contact_method: Form.name,
-    Form.contact_method_text: Form.name,
-    Form.contact_time: Form.contact_method,
-    Form.phone: Form.contact_time,
-}
-
-# Функция для создания инлайн-клавиатуры
-def get_inline_keyboard(buttons, row_width=1, add_back_button=False):
-    builder = InlineKeyboardBuilder()
-    for button in buttons:
-        builder.button(text=button, callback_data=button)
-    
-    # Добавляем кнопку "Назад" если требуется
-    if add_back_button:
-        builder.button(text="⬅️ Назад", callback_data="⬅️ Назад")
-    
-    builder.adjust(row_width)
-    return builder.as_markup()
-
-# Функция для создания клавиатуры только с кнопкой "Назад"
-def get_back_keyboard():
-    keyboard = [[KeyboardButton(text="⬅️ Назад")]]
-    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
-
-# Функция для создания обычной клавиатуры
-def get_reply_keyboard(buttons, row_width=1, one_time_keyboard=True, resize_keyboard=True, add_back_button=True):
-    keyboard = []
-    row = []
-    for i, button in enumerate(buttons):
-        row.append(KeyboardButton(text=button))
-        if (i + 1) % row_width == 0 or i == len(buttons) - 1:
-            keyboard.append(row)
-            row = []
-    
-    # Добавляем кнопку "Назад" в последний ряд, если требуется
-    if add_back_button:
-        back_button = KeyboardButton(text="⬅️ Назад")
-        if keyboard and len(keyboard[-1]) < row_width:
-            keyboard[-1].append(back_button)
-        else:
-            keyboard.append([back_button])
-    
-    return ReplyKeyboardMarkup(keyboard=keyboard, one_time_keyboard=one_time_keyboard, resize_keyboard=resize_keyboard)
+# Итог рассылки — администратору, который её запустил
+async def report_broadcast(broadcast: Dict[str, Any]):
+    await notifier.send(broadcast["admin_id"], describe_broadcast(broadcast))
 
-# Функция для создания клавиатуры с кнопкой отправки контакта
-def get_contact_keyboard():
-    keyboard = [
-        [KeyboardButton(text="Отправить контакт", request_contact=True)],
-        [KeyboardButton(text="Отправить мой номер телефона")]
-    ]
-    return ReplyKeyboardMarkup(keyboard=keyboard, one_time_keyboard=True, resize_keyboard=True)
+# Рассылки клиентам из архива заявок: общий лимит бота они делят с заявками и напоминаниями
+broadcaster = Broadcaster(bot, shared=notifier.global_bucket, on_finish=report_broadcast)
 
 # Обработчик команды /start
 @dp.message(Command("start"))
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
-    await message.answer(
+    await ask(
+        message,
+        state,
+        FIRST_STEP,
         "Здравствуйте! Я бот для подбора недвижимости. Я помогу вам найти идеальное жилье, соответствующее вашим потребностям и бюджету.\n\n"
         "Для начала, давайте узнаем немного о вашей текущей жилищной ситуации.\n\n"
-        "Где вы сейчас проживаете?",
-        reply_markup=get_reply_keyboard([
-            "Собственная квартира",
-            "Собственный дом",
-            "Аренда",
-            "С родителями/родственниками",
-            "Другое"
-        ], row_width=1, add_back_button=False)
+        f"{FIRST_STEP.prompt}",
     )
-    await state.set_state(Form.residence)
 
 # Обработчик команды /help
 @dp.message(Command("help"))
@@ -129,7 +197,8 @@ async def cmd_help(message: Message):
         "2. Подобрать варианты по вашему бюджету\n"
         "3. Учесть ваши предпочтения по расположению\n"
         "4. Дать информацию об ипотечных программах\n\n"
-        "Чтобы начать заново, отправьте команду /start"
+        "Чтобы начать заново, отправьте команду /start\n"
+        "Срочная связь со специалистом — команда /sos"
     )
 
 # Обработчик команды /cancel
@@ -142,338 +211,213 @@ async def cmd_cancel(message: Message, state: FSMContext):
     await state.clear()
     await message.answer(
         "Действие отменено. Чтобы начать заново, отправьте команду /start",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=REMOVE_KEYBOARD
     )
 
-# Обработчик для состояния Form.residence
-@dp.message(Form.residence)
-async def get_residence(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
-        return
-    
-    if message.text == "Другое":
+# Обработчик команды /sos: срочный запрос специалисту с любого шага (анкета не сбрасывается).
+# Имя берётся из анкеты, если пользователь его уже указал, иначе — из Telegram. Запрос
+# записывается в очередь SOS до ответа пользователю; повторный /sos и флуд отсекает
+# FloodControlMiddleware, ограничение частоты сообщений к /sos не применяется
+@dp.message(Command("sos"))
+async def cmd_sos(message: Message, state: FSMContext):
+    data = await state.get_data()
+    if not data.get("name"):
+        data = {**data, "name": message.from_user.full_name}
+    await sos_outbox.enqueue(ADMIN_IDS, renderer.sos(message.from_user.id, data))
+    await message.answer("🆘 Запрос отправлен! Наш специалист свяжется с вами в ближайшее время.")
+
+# Обработчик команды /leads (только для администраторов)
+# Пример: /leads budget=3-5 млн ₽; type=Квартира; from=01.03.2024; to=31.03.2024; phone=79991234567
+@dp.message(Command("leads"), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_leads(message: Message, command: CommandObject):
+    try:
+        filters = parse_filters(command.args)
+    except ValueError as e:
         await message.answer(
-            "Пожалуйста, опишите вашу текущую жилищную ситуацию:",
-            reply_markup=get_reply_keyboard([], add_back_button=True, row_width=1)
+            f"❌ {escape(str(e))}\n\n"
+            "Фильтры указываются через «;»: budget, type, phone, from, to (ДД.ММ.ГГГГ), before (номер заявки), "
+            "score (оценка не ниже).\n"
+            "Например: <code>/leads type=Квартира; from=01.03.2024</code> или <code>/leads score=70</code>"
         )
-        # Остаемся в том же состоянии, чтобы получить текстовый ответ
-        return
-    
-    await state.update_data(residence=message.text)
-    
-    await message.answer(
-        "Довольны ли вы своими текущими жилищными условиями?",
-        reply_markup=get_reply_keyboard([
-            "Да, полностью доволен",
-            "Частично доволен",
-            "Нет, не доволен"
-        ])
-    )
-    await state.set_state(Form.satisfaction)
-
-# Обработчик для состояния Form.satisfaction
-@dp.message(Form.satisfaction)
-async def get_satisfaction(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
-        return
-    
-    await state.update_data(satisfaction=message.text)
-    
-    await message.answer(
-        "Какой тип недвижимости вас интересует?",
-        reply_markup=get_reply_keyboard([
-            "Квартира",
-            "Дом",
-            "Таунхаус",
-            "Участок земли",
-            "Коммерческая недвижимость"
-        ], row_width=2)
-    )
-    await state.set_state(Form.property_type)
-
-# Обработчик для состояния Form.property_type
-@dp.message(Form.property_type)
-async def get_property_type(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
         return
     
-    await state.update_data(property_type=message.text)
-    
-    await message.answer(
-        "В каком районе или городе вы хотели бы приобрести недвижимость?",
-        reply_markup=get_reply_keyboard([
-            "В центре города",
-            "В спальном районе",
-            "В пригороде",
-            "За городом",
-            "Другое (напишите свой вариант)"
-        ], row_width=1)
-    )
-    await state.set_state(Form.location)
-
-# Обработчик для состояния Form.location
-@dp.message(Form.location)
-async def get_location(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+    leads = await lead_store.search(limit=LEADS_PAGE_SIZE, **filters)
+    total = await lead_store.count(**filters)
+    if not leads:
+        await message.answer("📂 Заявок не найдено.")
         return
     
-    if message.text == "Другое (напишите свой вариант)":
+    text = f"📂 <b>Заявки</b> (найдено: {total})\n\n"
+    for lead in leads:
+        text += f"<b>#{lead['id']}</b> • {datetime.fromtimestamp(lead['created_at']).strftime('%d.%m.%Y %H:%M')}\n"
+        text += f"👤 {escape(lead['name'] or 'Не указано')} • 📱 +{escape(lead['phone'] or '')}\n"
+        text += f"🏢 {escape(lead['property_type'] or 'Не указано')} • 💰 {escape(lead['budget'] or 'Не указано')}"
+        if lead["score"] is not None:
+            text += f" • {'🔥' if scorer.is_hot(lead['score']) else '🎯'} {lead['score']}"
+        text += "\n\n"
+    
+    # Ссылка на следующую страницу: те же фильтры и номер последней показанной заявки
+    if len(leads) == LEADS_PAGE_SIZE:
+        parts = [part.strip() for part in (command.args or "").split(";") if part.strip()]
+        parts = [part for part in parts if not part.lower().startswith("before")]
+        parts.append(f"before={leads[-1]['id']}")
+        text += f"Следующая страница:\n<code>/leads {escape('; '.join(parts))}</code>"
+    
+    await message.answer(text)
+
+# Обработчик команды /export (только для администраторов): заявки по фильтрам /leads
+# файлом CSV (открывается в Excel) или JSON Lines; большая выгрузка приходит частями
+# Пример: /export type=Квартира; from=01.03.2024 или /export jsonl budget=3-5 млн ₽
+@dp.message(Command("export"), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_export(message: Message, command: CommandObject):
+    try:
+        fmt, filters = parse_export_args(command.args)
+    except ValueError as e:
         await message.answer(
-            "Пожалуйста, укажите желаемое расположение недвижимости:",
-            reply_markup=get_reply_keyboard([], add_back_button=True, row_width=1)
+            f"❌ {escape(str(e))}\n\n"
+            "Формат (csv или jsonl) и фильтры как у /leads: budget, type, phone, from, to (ДД.ММ.ГГГГ).\n"
+            "Например: <code>/export jsonl type=Квартира; from=01.03.2024</code>"
         )
-        # Остаемся в том же состоянии, чтобы получить текстовый ответ
         return
-    
-    await state.update_data(location=message.text)
-    
-    await message.answer(
-        "Какой у вас бюджет на покупку недвижимости?",
-        reply_markup=get_reply_keyboard([
-            "До 3 млн ₽",
-            "3-5 млн ₽",
-            "5-10 млн ₽",
-            "10-20 млн ₽",
-            "Более 20 млн ₽"
-        ], row_width=1)
-    )
-    await state.set_state(Form.budget)
 
-# Обработчик для состояния Form.budget
-@dp.message(Form.budget)
-async def get_budget(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+    await bot.send_chat_action(message.chat.id, "upload_document")
+    with tempfile.TemporaryDirectory(prefix="export") as directory:
+        total, paths = await export_leads(directory, fmt, filters)
+        if not total:
+            await message.answer("📂 Заявок не найдено.")
+            return
+        for number, path in enumerate(paths, 1):
+            caption = f"📂 Заявок: {total}"
+            if len(paths) > 1:
+                caption += f", часть {number} из {len(paths)}"
+            await bot.send_document(message.chat.id, FSInputFile(path), caption=caption,
+                                    request_timeout=EXPORT_UPLOAD_TIMEOUT)
+
+# Обработчик команды /broadcast (только для администраторов): рассылка клиентам, у которых
+# есть заявки по фильтрам. Текст берётся с разметкой администратора и сначала отправляется
+# ему самому: так он видит, что получат клиенты, а ошибка разметки обнаруживается до рассылки
+@dp.message(Command("broadcast"), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_broadcast(message: Message):
+    # Строки берутся из самого сообщения: в command.args нет перевода строки после команды,
+    # и без фильтров текст рассылки попал бы в первую строку
+    head, _, rest = message.text.partition("\n")
+    first = head.partition(" ")[2].strip()
+    if first.lower().startswith("cancel") and not rest.strip():
+        number = first[len("cancel"):].strip()
+        if number.isdigit() and await broadcaster.cancel(int(number)):
+            await message.answer(f"⛔ Рассылка #{number} отменена.")
+        else:
+            await message.answer(f"❌ Идущей рассылки #{escape(number)} нет.")
         return
-    
-    await state.update_data(budget=message.text)
-    
-    await message.answer(
-        "На каком этапе поиска недвижимости вы находитесь?",
-        reply_markup=get_reply_keyboard([
-            "Только начинаю искать",
-            "Уже смотрел(а) варианты",
-            "Определился(лась) с выбором",
-            "Готов(а) к сделке"
-        ], row_width=1)
-    )
-    await state.set_state(Form.search_status)
-
-# Обработчик для состояния Form.search_status
-@dp.message(Form.search_status)
-async def get_search_status(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+    if not rest.strip():
+        broadcasts = await broadcaster.recent() if not first else []
+        if broadcasts:
+            await message.answer("\n\n".join(describe_broadcast(broadcast) for broadcast in broadcasts))
+        else:
+            await message.answer(("❌ Нет текста рассылки.\n\n" if first else "📬 Рассылок ещё не было.\n\n") + BROADCAST_USAGE)
         return
-    
-    await state.update_data(search_status=message.text)
-    
-    await message.answer(
-        "Планируете ли вы использовать ипотеку для покупки?",
-        reply_markup=get_reply_keyboard([
-            "Да, уже одобрена",
-            "Да, планирую подать заявку",
-            "Нет, полная оплата",
-            "Еще не решил(а)"
-        ], row_width=1)
-    )
-    await state.set_state(Form.mortgage)
 
-# Обработчик для состояния Form.mortgage
-@dp.message(Form.mortgage)
-async def get_mortgage(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+    try:
+        filters = parse_filters(first)
+    except ValueError as e:
+        await message.answer(f"❌ {escape(str(e))}\n\n{BROADCAST_USAGE}")
         return
-    
-    await state.update_data(mortgage=message.text)
-    
-    await message.answer(
-        "Когда вы планируете совершить покупку?",
-        reply_markup=get_reply_keyboard([
-            "В ближайший месяц",
-            "В течение 3 месяцев",
-            "В течение полугода",
-            "В течение года",
-            "Пока просто интересуюсь"
-        ], row_width=1)
-    )
-    await state.set_state(Form.purchase_time)
-
-# Обработчик для состояния Form.purchase_time
-@dp.message(Form.purchase_time)
-async def get_purchase_time(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+    text = message.html_text.partition("\n")[2].strip()
+    try:
+        await message.answer(text)
+    except TelegramBadRequest as e:
+        await message.answer(f"❌ Telegram не принял текст рассылки: {escape(e.message)}")
         return
-    
-    await state.update_data(purchase_time=message.text)
-    
-    # Информационное сообщение о возможностях покупки недвижимости
-    await message.answer(
-        "Спасибо за информацию о ваших планах покупки!\n\n"
-        "Сейчас на рынке недвижимости есть много интересных предложений, и мы поможем вам найти оптимальный вариант в соответствии с вашими пожеланиями и бюджетом.\n\n"
-        "Теперь давайте соберем ваши контактные данные, чтобы наш специалист мог связаться с вами и предложить подходящие варианты."
-    )
-    
-    # Запрашиваем имя пользователя
+    broadcast = await broadcaster.create(message.from_user.id, text, filters, first)
     await message.answer(
-        "Как вас зовут?",
-        reply_markup=ReplyKeyboardRemove()
+        describe_broadcast(broadcast)
+        + ("\n\nВыше — сообщение, которое получат клиенты. Отменить: "
+           f"<code>/broadcast cancel {broadcast['id']}</code>" if broadcast["status"] == "running" else "")
     )
-    await state.set_state(Form.name)
 
-# Обработчик для состояния Form.name
-@dp.message(Form.name)
-async def get_name(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
-        return
-    
-    await state.update_data(name=message.text)
-    
-    # Запрашиваем номер телефона
+# Обработчик команды /stats (только для администраторов): воронка анкеты — где пользователи
+# уходят и сколько времени проводят на каждом шаге. Сводка считается по ходу, без чтения журнала
+@dp.message(Command("stats"), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_stats(message: Message):
+    await message.answer(format_report(funnel.stats, funnel.idle))
+
+# Обработчик команды /rescore (только для администраторов): пересчёт оценок всего архива
+# по текущей модели, например для заявок, сохранённых до появления оценки. Архив
+# обновляется пачками, новые заявки сохраняются между ними
+@dp.message(Command("rescore"), F.from_user.id.in_(ADMIN_IDS))
+async def cmd_rescore(message: Message):
+    await message.answer("⏳ Пересчитываю оценки заявок...")
+    started = time.perf_counter()
+    total = await rescore_archive(scorer, lead_store)
+    hot = await lead_store.count(score_min=scorer.hot)
     await message.answer(
-        "Введите ваш номер телефона для связи:",
-        reply_markup=get_reply_keyboard([], row_width=1)
+        f"🎯 Оценки пересчитаны: {total} заявок за {time.perf_counter() - started:.1f} с, "
+        f"горячих (от {scorer.hot}): {hot}.\nСписок: <code>/leads score={scorer.hot}</code>"
     )
-    await state.set_state(Form.phone)
 
-# Обработчик для состояния Form.contact_method
-@dp.message(Form.contact_method)
-async def get_contact_method(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+# Единый обработчик шагов анкеты: шаг берётся из таблицы questionnaire.STEPS по состоянию
+@dp.message(StepFilter())
+async def questionnaire_step(message: Message, state: FSMContext, step: Step):
+    if message.text == BACK_BUTTON:
+        if step.previous is None:
+            await cmd_start(message, state)
+        else:
+            await ask(message, state, STEPS[step.previous])
         return
     
-    if message.text == "Другое":
-        await message.answer(
-            "Укажите предпочтительный способ связи:",
-            reply_markup=get_reply_keyboard([], add_back_button=True, row_width=1)
-        )
-        await state.set_state(Form.contact_method_text)
-    else:
-        await state.update_data(contact_method=message.text)
-        
-        await message.answer(
-            "В какое время вам удобно, чтобы с вами связались?",
-            reply_markup=get_reply_keyboard([
-                "Утро (9:00-12:00)",
-                "День (12:00-18:00)",
-                "Вечер (18:00-21:00)",
-                "В любое время"
-            ], row_width=1)
-        )
-        await state.set_state(Form.contact_time)
-
-# Обработчик для состояния Form.contact_method_text
-@dp.message(Form.contact_method_text)
-async def get_contact_method_text(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+    if step.other is not None and message.text == step.other:
+        # Остаемся на том же шаге, чтобы получить текстовый ответ
+        await message.answer(step.other_prompt, reply_markup=reply_keyboard("text"))
         return
     
-    await state.update_data(contact_method=message.text)
-    
-    await message.answer(
-        "В какое время вам удобно, чтобы с вами связались?",
-        reply_markup=get_reply_keyboard([
-            "Утро (9:00-12:00)",
-            "День (12:00-18:00)",
-            "Вечер (18:00-21:00)",
-            "В любое время"
-        ], row_width=1)
-    )
-    await state.set_state(Form.contact_time)
-
-# Обработчик для состояния Form.contact_time
-@dp.message(Form.contact_time)
-async def get_contact_time(message: Message, state: FSMContext):
-    await state.update_data(contact_time=message.text)
-    
-    # Запрашиваем номер телефона
-    await message.answer(
-        "Пожалуйста, укажите ваш номер телефона для связи.",
-        reply_markup=get_contact_keyboard()
-    )
-    await state.set_state(Form.phone)
-
-# Обработчик для состояния Form.phone
-@dp.message(Form.phone)
-async def get_phone(message: Message, state: FSMContext):
-    if message.text == "⬅️ Назад":
-        # Обработка кнопки "Назад" уже реализована в отдельном обработчике
+    value = step.parse(message)
+    if value is None:
+        funnel.reject(message.chat.id, step.state)
+        await message.answer(step.error_text, reply_markup=step.keyboard)
         return
     
-    # Проверяем, был ли отправлен контакт
-    if message.contact is not None:
-        phone = message.contact.phone_number
-        await process_phone(message, state, phone)
-    elif message.text and re.match(r'^(\+7|7|8)?[\s\-]?\(?[489][0-9]{2}\)?[\s\-]?[0-9]{3}[\s\-]?[0-9]{2}[\s\-]?[0-9]{2}$', message.text):
-        # Если пользователь ввел номер вручную и он соответствует формату
-        phone = message.text
-        await process_phone(message, state, phone)
-    else:
-        # Если формат неверный или это не контакт
-        await message.answer(
-            "Пожалуйста, отправьте ваш номер телефона, нажав на кнопку 'Отправить контакт' или введите его вручную в формате +7XXXXXXXXXX",
-            reply_markup=get_contact_keyboard()
-        )
-
-async def process_phone(message: Message, state: FSMContext, phone: str):
-    # Удаляем все нецифровые символы
-    phone = re.sub(r'\D', '', phone)
-    
-    # Приводим к формату с 7 в начале
-    if phone.startswith('8'):
-        phone = '7' + phone[1:]
-    
-    # Сохраняем телефон
-    await state.update_data(phone=phone)
+    await state.update_data({step.name: value, DATA_VERSION: new_version()})
     
+    if step.next is None:
+        if step.after:
+            await message.answer(step.after)
+        await show_confirmation(message, state)
+    else:
+        # Сообщение после ответа уходит вместе со следующим вопросом
+        next_step = STEPS[step.next]
+        await ask(message, state, next_step, f"{step.after}\n\n{next_step.prompt}" if step.after else None)
+
+# Смена экрана под инлайн-кнопками: сообщение с нажатой кнопкой редактируется на месте,
+# а если его уже нельзя отредактировать (удалено, недоступно) — отправляется новое
+async def replace_screen(call: types.CallbackQuery, text: str, reply_markup=None):
+    if isinstance(call.message, Message):
+        try:
+            await call.message.edit_text(text, reply_markup=reply_markup)
+            return
+        except TelegramBadRequest as e:
+            # Повторное нажатие той же кнопки: на экране уже нужный текст
+            if "message is not modified" in e.message:
+                return
+            logging.warning(f"Не удалось отредактировать сообщение {call.message.message_id}: {e.message}")
+    await bot.send_message(call.from_user.id, text, reply_markup=reply_markup)
+
+# Экран подтверждения введенных данных. После нажатия кнопки (call) экран
+# заменяет сообщение с этой кнопкой, после ответа на шаг анкеты — отправляется новым
+async def show_confirmation(message: Message, state: FSMContext, call: Optional[types.CallbackQuery] = None):
     # Получаем все данные формы
     data = await state.get_data()
     
-    # Формируем сообщение для подтверждения
-    confirm_message = f"📋 <b>Проверьте введенные данные:</b>\n\n"
-    
-    # Блок 1. Жилищная ситуация
-    confirm_message += f"<b>Блок 1. Жилищная ситуация</b>\n"
-    confirm_message += f"👤 Имя: {data['name']}\n"
-    confirm_message += f"🏠 Текущее жилье: {data.get('residence', 'Не указано')}\n"
-    confirm_message += f"😊 Довольны условиями: {data.get('satisfaction', 'Не указано')}\n"
-    confirm_message += f"🏢 Тип недвижимости: {data.get('property_type', 'Не указано')}\n"
-    confirm_message += f"📍 Желаемое расположение: {data.get('location', 'Не указано')}\n"
-    confirm_message += f"💰 Бюджет: {data.get('budget', 'Не указано')}\n"
-    confirm_message += f"🔍 Статус поиска: {data.get('search_status', 'Не указано')}\n\n"
-    
-    # Блок 2. Готовность к покупке
-    confirm_message += f"<b>Блок 2. Готовность к покупке</b>\n"
-    confirm_message += f"🏦 Ипотека: {data.get('mortgage', 'Не указано')}\n"
-    confirm_message += f"⏱ Планируемое время покупки: {data.get('purchase_time', 'Не указано')}\n\n"
-    
-    # Блок 3. Контактные данные
-    confirm_message += f"<b>Блок 3. Контактные данные</b>\n"
-    confirm_message += f"📞 Предпочтительный способ связи: {data.get('contact_method', 'Не указано')}\n"
-    confirm_message += f"📅 Удобное время для связи: {data.get('contact_time', 'Не указано')}\n"
-    confirm_message += f"📱 Телефон: +{phone}\n\n"
-    
-    confirm_message += "Всё верно?"
-    
-    # Отправляем сообщение с подтверждением
-    await message.answer(
-        confirm_message,
-        reply_markup=get_inline_keyboard(["✅ Подтвердить", "❌ Изменить"], row_width=2)
-    )
+    text = renderer.confirmation(message.chat.id, data)
+    if call is None:
+        await message.answer(text, reply_markup=inline_keyboard("confirm"))
+    else:
+        await replace_screen(call, text, inline_keyboard("confirm"))
     
     # Устанавливаем состояние подтверждения
     await state.set_state(Form.confirm)
 
-@dp.callback_query(Form.confirm)
+# Кнопки экрана подтверждения (остальные кнопки обрабатываются ниже)
+@dp.callback_query(Form.confirm, F.data.in_(["✅ Подтвердить", "❌ Изменить"]))
 async def confirm_data(call: types.CallbackQuery, state: FSMContext):
     await call.answer()
     
@@ -481,63 +425,38 @@ async def confirm_data(call: types.CallbackQuery, state: FSMContext):
         # Получаем все данные формы
         data = await state.get_data()
         
-        # Формируем сообщение для администраторов
-        admin_message = f"📨 <b>Новая заявка на подбор недвижимости</b>\n\n"
-        admin_message += f"<b>Дата и время:</b> {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
-        
-        # Блок 1. Жилищная ситуация
-        admin_message += f"<b>Блок 1. Жилищная ситуация</b>\n"
-        admin_message += f"👤 Имя: {data['name']}\n"
-        admin_message += f"🏠 Текущее жилье: {data.get('residence', 'Не указано')}\n"
-        admin_message += f"😊 Довольны условиями: {data.get('satisfaction', 'Не указано')}\n"
-        admin_message += f"🏢 Тип недвижимости: {data.get('property_type', 'Не указано')}\n"
-        admin_message += f"📍 Желаемое расположение: {data.get('location', 'Не указано')}\n"
-        admin_message += f"💰 Бюджет: {data.get('budget', 'Не указано')}\n"
-        admin_message += f"🔍 Статус поиска: {data.get('search_status', 'Не указано')}\n\n"
+        # Повторная заявка того же клиента (телефон или аккаунт) объединяется с прежней
+        phone = data.get("phone")
+        lead_id = await duplicates.find(phone, call.from_user.id)
+        updated = lead_id is not None
+        score = scorer.score(data)
+        hot = scorer.is_hot(score)
         
-        # Блок 2. Готовность к покупке
-        admin_message += f"<b>Блок 2. Готовность к покупке</b>\n"
-        admin_message += f"🏦 Ипотека: {data.get('mortgage', 'Не указано')}\n"
-        admin_message += f"⏱ Планируемое время покупки: {data.get('purchase_time', 'Не указано')}\n\n"
-        
-        # Блок 3. Контактные данные
-        admin_message += f"<b>Блок 3. Контактные данные</b>\n"
-        admin_message += f"📞 Предпочтительный способ связи: {data.get('contact_method', 'Не указано')}\n"
-        admin_message += f"📅 Удобное время для связи: {data.get('contact_time', 'Не указано')}\n"
-        admin_message += f"📱 Телефон: +{data.get('phone', 'Не указано')}\n"
-        admin_message += f"🔗 Telegram: @{call.from_user.username if call.from_user.username else 'Отсутствует'}\n"
-        
-        # Отправляем сообщение администраторам
-        admin_ids = os.getenv("ADMIN_IDS", "").split(",")
-        for admin_id in admin_ids:
-            if admin_id.strip():
-                try:
-                    await bot.send_message(chat_id=admin_id.strip(), text=admin_message)
-                except Exception as e:
-                    logging.error(f"Ошибка при отправке сообщения администратору {admin_id}: {e}")
-        
-        # Отправляем сообщение пользователю об успешной отправке заявки
-        await call.message.answer(
-            "✅ Спасибо! Ваша заявка успешно отправлена.\n\n"
-            "Наш специалист свяжется с вами в ближайшее время для уточнения деталей и подбора оптимальных вариантов недвижимости.\n\n"
-            "Если у вас возникнут дополнительные вопросы, вы можете задать их, отправив новое сообщение.",
-            reply_markup=get_inline_keyboard(["🔄 Новая заявка", "❓ Помощь"], row_width=2)
+        # Сохраняем заявку в архив и в очередь отправки до ответа пользователю
+        if updated:
+            await lead_store.merge(lead_id, data, call.from_user.username, score=score)
+            LEADS_MERGED.inc()
+        else:
+            lead_id = await lead_store.add(data, call.from_user.id, call.from_user.username, score=score)
+            duplicates.add(phone, call.from_user.id)
+        admin_message = renderer.admin(
+            call.message.chat.id, data, call.from_user.username, updated=updated, score=score, hot=hot,
         )
+        await enqueue_lead(admin_message, lead_id, hot)
+        LEADS_CONFIRMED.inc()
+        if hot:
+            LEADS_HOT.inc()
+        
+        # Экран подтверждения сменяется благодарностью (сводка остаётся в сообщении)
+        await replace_screen(call, renderer.submitted(call.message.chat.id, data, updated=updated), inline_keyboard("done"))
         
         # Очищаем состояние
+        funnel.submitted(call.message.chat.id)
         await state.clear()
     
     elif call.data == "❌ Изменить":
-        # Предлагаем пользователю выбрать, какие данные нужно изменить
-        await call.message.answer(
-            "Какие данные вы хотели бы изменить?",
-            reply_markup=get_inline_keyboard([
-                "🏠 Жилищная ситуация", 
-                "💰 Готовность к покупке", 
-                "📞 Контактные данные",
-                "🔄 Начать заново"
-            ], row_width=2)
-        )
+        # Предлагаем пользователю выбрать, какие данные нужно изменить (в том же сообщении)
+        await replace_screen(call, "Какие данные вы хотели бы изменить?", inline_keyboard("edit"))
     
     # Обработка кнопки "Назад" реализована в отдельном обработчике
 
@@ -546,95 +465,18 @@ async def new_application(call: types.CallbackQuery, state: FSMContext):
     await call.answer()
     await state.clear()
     
-    await call.message.answer(
-        "Давайте начнем заново. Где вы сейчас проживаете?",
-        reply_markup=get_reply_keyboard([
-            "Собственная квартира",
-            "Собственный дом",
-            "Аренда",
-            "С родителями/родственниками",
-            "Другое"
-        ], row_width=1)
-    )
-    await state.set_state(Form.residence)
+    await ask(call.message, state, FIRST_STEP, f"Давайте начнем заново. {FIRST_STEP.prompt}")
 
-@dp.callback_query(lambda call: call.data in ["🏠 Жилищная ситуация", "💰 Готовность к покупке", "📞 Контактные данные", "⬅️ Назад"])
+@dp.callback_query(lambda call: call.data in EDIT_SECTIONS or call.data == BACK_BUTTON)
 async def edit_section(call: types.CallbackQuery, state: FSMContext):
     await call.answer()
     
-    if call.data == "🏠 Жилищная ситуация":
-        # Редактирование жилищной ситуации
-        await call.message.answer(
-            "Где вы сейчас проживаете?",
-            reply_markup=get_reply_keyboard([
-                "Собственная квартира",
-                "Собственный дом",
-                "Аренда",
-                "С родителями/родственниками",
-                "Другое"
-            ], row_width=1)
-        )
-        await state.set_state(Form.residence)
-    
-    elif call.data == "💰 Готовность к покупке":
-        # Редактирование готовности к покупке
-        await call.message.answer(
-            "Планируете ли вы использовать ипотеку для покупки?",
-            reply_markup=get_reply_keyboard([
-                "Да, уже одобрена",
-                "Да, планирую подать заявку",
-                "Нет, полная оплата",
-                "Еще не решил(а)"
-            ], row_width=1)
-        )
-        await state.set_state(Form.mortgage)
-    
-    elif call.data == "📞 Контактные данные":
-        # Редактирование контактных данных
-        await call.message.answer(
-            "Как вас зовут?",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        await state.set_state(Form.name)
-    
-    elif call.data == "⬅️ Назад":
-        # Возвращаемся к экрану подтверждения
-        data = await state.get_data()
-        
-        # Формируем сообщение для подтверждения
-        confirm_message = f"📋 <b>Проверьте введенные данные:</b>\n\n"
-        
-        # Блок 1. Жилищная ситуация
-        confirm_message += f"<b>Блок 1. Жилищная ситуация</b>\n"
-        confirm_message += f"👤 Имя: {data['name']}\n"
-        confirm_message += f"🏠 Текущее жилье: {data.get('residence', 'Не указано')}\n"
-        confirm_message += f"😊 Довольны условиями: {data.get('satisfaction', 'Не указано')}\n"
-        confirm_message += f"🏢 Тип недвижимости: {data.get('property_type', 'Не указано')}\n"
-        confirm_message += f"📍 Желаемое расположение: {data.get('location', 'Не указано')}\n"
-        confirm_message += f"💰 Бюджет: {data.get('budget', 'Не указано')}\n"
-        confirm_message += f"🔍 Статус поиска: {data.get('search_status', 'Не указано')}\n\n"
-        
-        # Блок 2. Готовность к покупке
-        confirm_message += f"<b>Блок 2. Готовность к покупке</b>\n"
-        confirm_message += f"🏦 Ипотека: {data.get('mortgage', 'Не указано')}\n"
-        confirm_message += f"⏱ Планируемое время покупки: {data.get('purchase_time', 'Не указано')}\n\n"
-        
-        # Блок 3. Контактные данные
-        confirm_message += f"<b>Блок 3. Контактные данные</b>\n"
-        confirm_message += f"📞 Предпочтительный способ связи: {data.get('contact_method', 'Не указано')}\n"
-        confirm_message += f"📅 Удобное время для связи: {data.get('contact_time', 'Не указано')}\n"
-        confirm_message += f"📱 Телефон: +{data.get('phone', 'Не указано')}\n\n"
-        
-        confirm_message += "Всё верно?"
-        
-        # Отправляем сообщение с подтверждением
-        await call.message.answer(
-            confirm_message,
-            reply_markup=get_inline_keyboard(["✅ Подтвердить", "❌ Изменить"], row_width=2)
-        )
-        
-        # Устанавливаем состояние подтверждения
-        await state.set_state(Form.confirm)
+    if call.data == BACK_BUTTON:
+        # Возвращаемся к экрану подтверждения в том же сообщении
+        await show_confirmation(call.message, state, call)
+    else:
+        # Редактирование раздела начинается с его первого шага
+        await ask(call.message, state, EDIT_SECTIONS[call.data])
 
 @dp.callback_query(lambda call: call.data == "❓ Помощь")
 async def help_callback(call: types.CallbackQuery):
@@ -646,151 +488,65 @@ async def help_callback(call: types.CallbackQuery):
         "2. Подобрать варианты по вашему бюджету\n"
         "3. Учесть ваши предпочтения по расположению\n"
         "4. Дать информацию об ипотечных программах\n\n"
+        "Срочная связь со специалистом — команда /sos\n\n"
         "Чтобы начать заново, нажмите кнопку ниже:",
-        reply_markup=get_inline_keyboard(["🔄 Новая заявка"])
+        reply_markup=inline_keyboard("help")
     )
 
-# Обработчик для кнопки "Назад"
-@dp.message(lambda message: message.text == "⬅️ Назад")
+# Обработчик для кнопки "Назад" вне шагов анкеты: начинаем заново
+@dp.message(F.text == BACK_BUTTON)
 async def back_button(message: Message, state: FSMContext):
-    # Получаем текущее состояние
-    current_state = await state.get_state()
-    if current_state is None:
-        await cmd_start(message, state)
-        return
-    
-    # Преобразуем строковое представление состояния в объект состояния
-    current_state_obj = getattr(Form, current_state.split(':')[1])
-    
-    # Проверяем, есть ли предыдущее состояние для текущего
-    if current_state_obj in PREVIOUS_STATES:
-        # Получаем предыдущее состояние
-        previous_state = PREVIOUS_STATES[current_state_obj]
-        
-        # Сохраняем текущие данные
-        data = await state.get_data()
-        
-        # Устанавливаем предыдущее состояние
-        await state.set_state(previous_state)
-        
-        # Отправляем соответствующий вопрос в зависимости от предыдущего состояния
-        if previous_state == Form.residence:
-            await message.answer(
-                "Где вы сейчас проживаете?",
-                reply_markup=get_reply_keyboard([
-                    "Собственная квартира",
-                    "Собственный дом",
-                    "Аренда",
-                    "С родителями/родственниками",
-                    "Другое"
-                ], row_width=1, add_back_button=False)
-            )
-        elif previous_state == Form.satisfaction:
-            await message.answer(
-                "Довольны ли вы своими текущими жилищными условиями?",
-                reply_markup=get_reply_keyboard([
-                    "Да, полностью доволен",
-                    "Частично доволен",
-                    "Нет, не доволен"
-                ])
-            )
-        elif previous_state == Form.property_type:
-            await message.answer(
-                "Какой тип недвижимости вас интересует?",
-                reply_markup=get_reply_keyboard([
-                    "Квартира",
-                    "Дом",
-                    "Таунхаус",
-                    "Участок земли",
-                    "Коммерческая недвижимость"
-                ], row_width=2)
-            )
-        elif previous_state == Form.location:
-            await message.answer(
-                "В каком районе или городе вы хотели бы приобрести недвижимость?",
-                reply_markup=get_reply_keyboard([
-                    "В центре города",
-                    "В спальном районе",
-                    "В пригороде",
-                    "За городом",
-                    "Другое (напишите свой вариант)"
-                ], row_width=1)
-            )
-        elif previous_state == Form.budget:
-            await message.answer(
-                "Какой у вас бюджет на покупку недвижимости?",
-                reply_markup=get_reply_keyboard([
-                    "До 3 млн ₽",
-                    "3-5 млн ₽",
-                    "5-10 млн ₽",
-                    "10-20 млн ₽",
-                    "Более 20 млн ₽"
-                ], row_width=1)
-            )
-        elif previous_state == Form.search_status:
-            await message.answer(
-                "На каком этапе поиска недвижимости вы находитесь?",
-                reply_markup=get_reply_keyboard([
-                    "Только начинаю искать",
-                    "Уже смотрел(а) варианты",
-                    "Определился(лась) с выбором",
-                    "Готов(а) к сделке"
-                ], row_width=1)
-            )
-        elif previous_state == Form.mortgage:
-            await message.answer(
-                "Планируете ли вы использовать ипотеку для покупки?",
-                reply_markup=get_reply_keyboard([
-                    "Да, уже одобрена",
-                    "Да, планирую подать заявку",
-                    "Нет, полная оплата",
-                    "Еще не решил(а)"
-                ], row_width=1)
-            )
-        elif previous_state == Form.purchase_time:
-            await message.answer(
-                "Когда вы планируете совершить покупку?",
-                reply_markup=get_reply_keyboard([
-                    "В ближайший месяц",
-                    "В течение 3 месяцев",
-                    "В течение полугода",
-                    "В течение года",
-                    "Пока просто смотрю варианты"
-                ], row_width=1)
-            )
-        elif previous_state == Form.name:
-            await message.answer(
-                "Как вас зовут?",
-                reply_markup=ReplyKeyboardRemove()
-            )
-        elif previous_state == Form.contact_method:
-            await message.answer(
-                "Как с вами удобнее связаться?",
-                reply_markup=get_reply_keyboard([
-                    "Телефон",
-                    "WhatsApp",
-                    "Telegram",
-                    "Другое"
-                ], row_width=2)
-            )
-        elif previous_state == Form.contact_time:
-            await message.answer(
-                "В какое время вам удобно, чтобы с вами связались?",
-                reply_markup=get_reply_keyboard([
-                    "Утро (9:00-12:00)",
-                    "День (12:00-18:00)",
-                    "Вечер (18:00-21:00)",
-                    "В любое время"
-                ], row_width=1)
-            )
-    else:
-        # Если предыдущего состояния нет, начинаем заново
-        await cmd_start(message, state)
+    await cmd_start(message, state)
+
+# Запускаем отправку SOS и заявок из очередей, рассылки и напоминания (в том числе оставшиеся с прошлого запуска)
+@dp.startup()
+async def on_startup():
+    global metrics_runner
+    await duplicates.load()
+    sos_outbox.start()
+    outbox.start()
+    broadcaster.start()
+    await reminders.load()
+    reminders.start()
+    await funnel.load()
+    funnel.start()
+    metrics_runner = await start_metrics_server()
+    # Объекты, созданные при импорте и запуске (модели aiogram, шаблоны, индексы), живут до
+    # выхода: без freeze каждая полная сборка мусора обходит их заново, и при всплеске
+    # заявок (тысячи задач и future) event loop замирает на ~100 мс
+    gc.freeze()
+
+# Остановка: обработчики обновлений уже завершены (а хранилище FSM сброшено на диск),
+# подтверждаем полученные обновления, досылаем очереди (сначала SOS) в пределах SHUTDOWN_TIMEOUT;
+# HTTP-сессия закрывается последней, когда все отправки завершены
+@dp.shutdown()
+async def on_shutdown():
+    if BOT_MODE == "polling":
+        await dp.confirm_updates(bot)
+    await sos_outbox.close(dp.time_left())
+    await outbox.close(dp.time_left())
+    await broadcaster.close(dp.time_left())
+    await reminders.close()
+    await funnel.close()
+    await duplicates.close()
+    await lead_store.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await session.close()
 
 # Запуск бота
 async def main():
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(dp, bot)
+    elif BOT_MODE == "worker":
+        # Рабочий процесс кластера: обновления присылает супервизор (cluster.py)
+        from cluster import exit_with_supervisor
+        from webhook import run_webhook
+        dp.startup.register(exit_with_supervisor)
+        run_webhook(dp, bot, host="127.0.0.1", port=WORKER_PORT, register=False)
+    else:
+        asyncio.run(main())
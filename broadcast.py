@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import BROADCAST_BATCH_SIZE, BROADCAST_RATE, BROADCASTS_PATH, LEADS_PATH, NOTIFY_MAX_ATTEMPTS
+from leads import LeadStore
+from metrics import BROADCAST_MESSAGES
+from notify import TokenBucket
+
+# Состояния рассылки
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+# Результаты отправки одному получателю
+DELIVERED = "delivered"
+BLOCKED = "blocked"
+FAILED = "failed"
+
+# Вызывается, когда рассылка закончена: строка рассылки (с итоговыми счётчиками)
+Reporter = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+# Рассылка сообщения клиентам из архива заявок (команда /broadcast).
+# Получатели — пользователи с заявками по фильтрам /leads — выбираются при создании
+# рассылки одним запросом INSERT ... SELECT по индексам архива (архив подключается к базе
+# рассылок только для чтения) и лежат в базе рассылок, а не в памяти. Фоновая задача
+# отправляет рассылки по одной, пачками по batch_size получателей, не быстрее rate
+# сообщений в секунду и в пределах общего лимита бота shared. После каждой пачки одной
+# транзакцией удаляются её получатели и обновляются счётчики (контрольная точка): после
+# сбоя рассылка продолжается с первой неподтверждённой пачки, так что повторно сообщение
+# получат не больше batch_size человек.
+class Broadcaster:
+    def __init__(
+        self,
+        bot: Bot,
+        path: str = BROADCASTS_PATH,
+        leads_path: str = LEADS_PATH,
+        rate: float = BROADCAST_RATE,
+        batch_size: int = BROADCAST_BATCH_SIZE,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        shared: Optional[TokenBucket] = None,
+        on_finish: Optional[Reporter] = None,
+    ):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.bucket = TokenBucket(rate)
+        self.shared = shared
+        self.on_finish = on_finish
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="broadcast")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "admin_id INTEGER NOT NULL, "
+            "text TEXT NOT NULL, "
+            "filters TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "total INTEGER NOT NULL DEFAULT 0, "
+            "delivered INTEGER NOT NULL DEFAULT 0, "
+            "blocked INTEGER NOT NULL DEFAULT 0, "
+            "failed INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, "
+            "finished_at REAL)"
+        )
+        # Ещё не обработанные получатели: пачка — первые batch_size по user_id
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS recipients ("
+            "broadcast_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+            "PRIMARY KEY (broadcast_id, user_id)) WITHOUT ROWID"
+        )
+        self._db.commit()
+        # Архив создаёт LeadStore (он же строит индексы фильтров); рассылка его только читает
+        self._db.execute("ATTACH DATABASE ? AS archive", (f"file:{leads_path}?mode=ro",))
+
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._cancelled: set = set()
+        self._closing = False
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _create(self, admin_id: int, text: str, description: str, filters: Dict[str, Any]) -> Dict[str, Any]:
+        filters = dict(filters)
+        filters.pop("before", None)
+        where, params = LeadStore._where(filters)
+        with self._db:
+            broadcast_id = self._db.execute(
+                "INSERT INTO broadcasts (admin_id, text, filters, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (admin_id, text, description, RUNNING, time.time()),
+            ).lastrowid
+            # У клиента может быть несколько заявок: сообщение он получает один раз
+            total = self._db.execute(
+                f"INSERT OR IGNORE INTO recipients (broadcast_id, user_id) SELECT ?, user_id FROM archive.leads{where}",
+                (broadcast_id, *params),
+            ).rowcount
+            status = RUNNING if total else DONE
+            self._db.execute(
+                "UPDATE broadcasts SET total = ?, status = ?, finished_at = ? WHERE id = ?",
+                (total, status, None if total else time.time(), broadcast_id),
+            )
+        return self._get(broadcast_id)
+
+    def _get(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+        return dict(row) if row else None
+
+    def _next_running(self) -> Optional[Dict[str, Any]]:
+        row = self._db.execute("SELECT * FROM broadcasts WHERE status = ? ORDER BY id LIMIT 1", (RUNNING,)).fetchone()
+        return dict(row) if row else None
+
+    def _next_batch(self, broadcast_id: int) -> List[int]:
+        rows = self._db.execute(
+            "SELECT user_id FROM recipients WHERE broadcast_id = ? ORDER BY user_id LIMIT ?",
+            (broadcast_id, self.batch_size),
+        )
+        return [row[0] for row in rows]
+
+    def _checkpoint(self, broadcast_id: int, last_user_id: int, counts: Counter):
+        with self._db:
+            self._db.execute(
+                "DELETE FROM recipients WHERE broadcast_id = ? AND user_id <= ?", (broadcast_id, last_user_id)
+            )
+            self._db.execute(
+                "UPDATE broadcasts SET delivered = delivered + ?, blocked = blocked + ?, failed = failed + ? "
+                "WHERE id = ?",
+                (counts[DELIVERED], counts[BLOCKED], counts[FAILED], broadcast_id),
+            )
+
+    def _finish(self, broadcast_id: int, status: str) -> Dict[str, Any]:
+        with self._db:
+            self._db.execute("DELETE FROM recipients WHERE broadcast_id = ?", (broadcast_id,))
+            self._db.execute(
+                "UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (status, time.time(), broadcast_id, RUNNING),
+            )
+        return self._get(broadcast_id)
+
+    # Новая рассылка text пользователям с заявками по фильтрам (как у /leads);
+    # description — фильтры в виде, понятном администратору. Возвращает строку рассылки
+    # с числом получателей (total) — рассылка без получателей сразу завершена
+    async def create(self, admin_id: int, text: str, filters: Dict[str, Any], description: str = "") -> Dict[str, Any]:
+        broadcast = await self._run(self._create, admin_id, text, description, filters)
+        self._wakeup.set()
+        return broadcast
+
+    # Последние рассылки, новые сначала
+    async def recent(self, limit: int = 5) -> List[Dict[str, Any]]:
+        def select():
+            rows = self._db.execute("SELECT * FROM broadcasts ORDER BY id DESC LIMIT ?", (limit,))
+            return [dict(row) for row in rows]
+
+        return await self._run(select)
+
+    # Отмена идущей рассылки (пачка, которая уже отправляется, будет доотправлена);
+    # False, если такой рассылки нет или она уже закончена
+    async def cancel(self, broadcast_id: int) -> bool:
+        broadcast = await self._run(self._get, broadcast_id)
+        if broadcast is None or broadcast["status"] != RUNNING:
+            return False
+        self._cancelled.add(broadcast_id)
+        await self._run(self._finish, broadcast_id, CANCELLED)
+        return True
+
+    # Отправка одному получателю с повторами при RetryAfter и сбоях сети. Исключения не
+    # выходят наружу: любая другая ошибка — FAILED, иначе пачка не отметилась бы и
+    # ушла бы заново тем, кто уже получил сообщение
+    async def _send(self, user_id: int, text: str) -> str:
+        for attempt in range(1, self.max_attempts + 1):
+            await self.bucket.acquire()
+            if self.shared is not None:
+                await self.shared.acquire()
+            try:
+                await self.bot.send_message(user_id, text)
+                return DELIVERED
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота или удалил аккаунт
+                return BLOCKED
+            except TelegramRetryAfter as e:
+                logging.warning(f"Telegram просит подождать {e.retry_after} с во время рассылки")
+                # Ожидание относится ко всему боту: заявки и напоминания тоже ждут
+                self.bucket.pause(e.retry_after)
+                if self.shared is not None:
+                    self.shared.pause(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                delay = min(2 ** attempt, 30)
+                logging.warning(f"Ошибка сети при рассылке в чат {user_id}, повтор через {delay} с: {e}")
+                await asyncio.sleep(delay)
+            except TelegramBadRequest as e:
+                logging.info(f"Рассылка в чат {user_id} не отправлена: {e.message}")
+                return FAILED
+            except Exception as e:
+                logging.error(f"Ошибка при рассылке в чат {user_id}: {e}")
+                return FAILED
+        return FAILED
+
+    async def _send_broadcast(self, broadcast: Dict[str, Any]):
+        broadcast_id = broadcast["id"]
+        while not self._closing and broadcast_id not in self._cancelled:
+            recipients = await self._run(self._next_batch, broadcast_id)
+            if not recipients:
+                broadcast = await self._run(self._finish, broadcast_id, DONE)
+                logging.info(
+                    f"Рассылка {broadcast_id} завершена: доставлено {broadcast['delivered']}, "
+                    f"заблокировали бота {broadcast['blocked']}, ошибок {broadcast['failed']}"
+                )
+                if self.on_finish is not None:
+                    await self.on_finish(broadcast)
+                return
+            results = await asyncio.gather(*(self._send(user_id, broadcast["text"]) for user_id in recipients))
+            counts = Counter(results)
+            for result, count in counts.items():
+                BROADCAST_MESSAGES.inc(result, amount=count)
+            await self._run(self._checkpoint, broadcast_id, recipients[-1], counts)
+
+    async def _work(self):
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                broadcast = await self._run(self._next_running)
+                if broadcast is not None:
+                    await self._send_broadcast(broadcast)
+                    continue
+            except Exception as e:
+                logging.error(f"Ошибка обработчика рассылок: {e}")
+                await asyncio.sleep(1)
+                continue
+            await self._wakeup.wait()
+
+    # Запуск фоновой задачи (продолжает рассылки, прерванные остановкой или сбоем)
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._work())
+
+    # Остановка: текущая пачка досылается не дольше timeout секунд, остальное — после
+    # перезапуска. Прерванная пачка не отмечена и будет отправлена заново
+    async def close(self, timeout: float = 0):
+        if self._worker is not None:
+            self._closing = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._worker), timeout)
+            except asyncio.TimeoutError:
+                self._worker.cancel()
+                await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
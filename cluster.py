@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from bisect import bisect, insort
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector, web
+
+from config import (
+    BOT_TOKEN,
+    BOT_WORKERS,
+    BROADCAST_RATE,
+    BROADCASTS_PATH,
+    CLUSTER_BASE_PORT,
+    CLUSTER_VNODES,
+    FUNNEL_PATH,
+    LOG_FILE,
+    METRICS_PORT,
+    NOTIFY_GLOBAL_RATE,
+    NOTIFY_PER_CHAT_RATE,
+    OUTBOX_PATH,
+    REMINDERS_PATH,
+    SHUTDOWN_TIMEOUT,
+    SOS_OUTBOX_PATH,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from logs import setup_logging
+from metrics import CLUSTER_FORWARDED, CLUSTER_RESTARTS, start_metrics_server
+from session import create_bot_session
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Сколько ждать готовности рабочего процесса и его остановки, секунды
+# (остановка включает ожидание обработчиков, до SHUTDOWN_TIMEOUT)
+WORKER_START_TIMEOUT = 30
+WORKER_STOP_TIMEOUT = SHUTDOWN_TIMEOUT + 10
+# Задержка перед перезапуском упавшего процесса растёт до этого значения
+MAX_RESTART_DELAY = 30
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+# Кольцо консистентного хеширования: у каждого узла replicas виртуальных точек.
+# При удалении узла на соседние переезжают только его ключи, остальные остаются на месте.
+class HashRing:
+    def __init__(self, nodes=(), replicas: int = CLUSTER_VNODES):
+        self.replicas = replicas
+        self._points: List[Tuple[int, int]] = []
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return frozenset(self._nodes)
+
+    def add(self, node: int):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self.replicas):
+            insort(self._points, (_hash(f"{node}:{replica}"), node))
+
+    def remove(self, node: int):
+        if node in self._nodes:
+            self._nodes.discard(node)
+            self._points = [point for point in self._points if point[1] != node]
+
+    # Узел, которому принадлежит ключ (первый по кругу не из exclude), или None
+    def get(self, key: Any, exclude=()) -> Optional[int]:
+        start = bisect(self._points, (_hash(str(key)), sys.maxsize))
+        for offset in range(len(self._points)):
+            node = self._points[(start + offset) % len(self._points)][1]
+            if node not in exclude:
+                return node
+        return None
+
+
+# Ключ шардирования: чат обновления (как в FSM aiogram), иначе отправитель
+def shard_key(update: Dict[str, Any]) -> int:
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+    return update.get("update_id", 0)
+
+
+# Путь к файлу рабочего процесса: outbox.sqlite3 -> outbox.worker1.sqlite3
+def _worker_path(path: str, index: int) -> str:
+    base, ext = os.path.splitext(path)
+    return f"{base}.worker{index}{ext}"
+
+
+# Вызывается при старте рабочего процесса: когда супервизор завершается (даже по SIGKILL
+# или посреди запуска), ОС закрывает его конец stdin, и рабочий процесс штатно останавливается
+async def exit_with_supervisor():
+    global _supervisor_watch
+    reader = asyncio.StreamReader()
+    await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async def wait():
+        await reader.read()
+        logging.warning("Супервизор завершился, рабочий процесс останавливается")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    _supervisor_watch = asyncio.create_task(wait())
+
+
+_supervisor_watch: Optional[asyncio.Task] = None
+
+
+# Рабочий процесс: bot.py в режиме BOT_MODE=worker на локальном порту
+class Worker:
+    def __init__(self, index: int, port: int, workers: int):
+        self.index = index
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.env = dict(
+            os.environ,
+            BOT_MODE="worker",
+            WORKER_PORT=str(port),
+            WEBHOOK_SECRET=WEBHOOK_SECRET,
+            # Свои очереди outbox (заявки и SOS), рассылки и напоминания у каждого процесса:
+            # ничего не отправляется дважды. Журнал воронки тоже свой (/stats — по процессу)
+            OUTBOX_PATH=_worker_path(OUTBOX_PATH, index),
+            SOS_OUTBOX_PATH=_worker_path(SOS_OUTBOX_PATH, index),
+            BROADCASTS_PATH=_worker_path(BROADCASTS_PATH, index),
+            REMINDERS_PATH=_worker_path(REMINDERS_PATH, index),
+            FUNNEL_PATH=_worker_path(FUNNEL_PATH, index),
+            # Лимиты Telegram действуют на бота целиком и делятся между процессами
+            NOTIFY_GLOBAL_RATE=str(NOTIFY_GLOBAL_RATE / workers),
+            NOTIFY_PER_CHAT_RATE=str(NOTIFY_PER_CHAT_RATE / workers),
+            BROADCAST_RATE=str(BROADCAST_RATE / workers),
+            # Чаты переезжают между процессами при сбоях, поэтому кэш общего хранилища FSM выключен
+            FSM_CACHE_SIZE="0",
+            METRICS_PORT=str(METRICS_PORT + 1 + index if METRICS_PORT else 0),
+        )
+        # Файл журнала у каждого процесса свой: ротацию одного файла несколько процессов не согласуют
+        if LOG_FILE:
+            self.env["LOG_FILE"] = _worker_path(LOG_FILE, index)
+
+    # Процесс запускается в своей сессии: Ctrl+C в терминале получает только супервизор,
+    # и он сам останавливает рабочие процессы, не перезапуская их. stdin остаётся открытым
+    # до конца жизни супервизора (см. exit_with_supervisor)
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, "bot.py"),
+            cwd=ROOT, env=self.env, stdin=asyncio.subprocess.PIPE, start_new_session=True,
+        )
+
+    # Ждём, пока процесс начнёт принимать соединения; False, если он завершился раньше
+    async def wait_ready(self, timeout: float = WORKER_START_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.process.returncode is None:
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+            except OSError:
+                await asyncio.sleep(0.1)
+                continue
+            writer.close()
+            await writer.wait_closed()
+            return True
+        return False
+
+    async def stop(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), WORKER_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning(f"Рабочий процесс {self.index} не остановился за {WORKER_STOP_TIMEOUT} с, завершаем принудительно")
+            self.process.kill()
+            await self.process.wait()
+
+
+# Супервизор: принимает webhook Telegram и передаёт каждое обновление рабочему
+# процессу по консистентному хешу чата, так что состояние анкеты пользователя
+# (FSM, очередь по чатам, защита от флуда) остаётся в одном процессе.
+# Упавший процесс исключается из кольца (его чаты временно обслуживают соседи)
+# и перезапускается с растущей задержкой.
+class Supervisor:
+    def __init__(self, workers: int = BOT_WORKERS, base_port: int = CLUSTER_BASE_PORT):
+        self.workers = [Worker(index, base_port + index, workers) for index in range(workers)]
+        self.ring = HashRing()
+        self._session: Optional[ClientSession] = None
+        self._watchers: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def _watch(self, worker: Worker):
+        restarts = 0
+        while not self._stopping:
+            started = time.monotonic()
+            await worker.start()
+            if await worker.wait_ready():
+                self.ring.add(worker.index)
+                logging.info(f"Рабочий процесс {worker.index} (pid {worker.process.pid}) готов, порт {worker.port}")
+            code = await worker.process.wait()
+            self.ring.remove(worker.index)
+            if self._stopping:
+                return
+            CLUSTER_RESTARTS.inc(str(worker.index))
+            # Процесс, проработавший дольше максимальной задержки, перезапускается сразу
+            restarts = 0 if time.monotonic() - started > MAX_RESTART_DELAY else restarts + 1
+            delay = min(2 ** restarts - 1, MAX_RESTART_DELAY)
+            logging.error(f"Рабочий процесс {worker.index} завершился с кодом {code}, перезапуск через {delay} с")
+            await asyncio.sleep(delay)
+
+    async def start(self):
+        self._session = ClientSession(
+            connector=TCPConnector(limit=0, limit_per_host=0),
+            timeout=ClientTimeout(total=30),
+        )
+        self._watchers = [asyncio.create_task(self._watch(worker)) for worker in self.workers]
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while len(self.ring.nodes) < len(self.workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if not self.ring.nodes:
+            raise RuntimeError("Ни один рабочий процесс не запустился")
+        logging.info(f"Кластер готов: {len(self.ring.nodes)} из {len(self.workers)} рабочих процессов")
+
+    # Остановка (в том числе посреди запуска): сначала наблюдатели, чтобы никто не
+    # перезапускал процессы, затем сами процессы
+    async def close(self):
+        self._stopping = True
+        for watcher in self._watchers:
+            watcher.cancel()
+        await asyncio.gather(*self._watchers, return_exceptions=True)
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+        if self._session is not None:
+            await self._session.close()
+
+    # Передача обновления владельцу чата; если процесс недоступен (упал, а супервизор
+    # ещё не заметил), обновление уходит следующему по кольцу
+    async def forward(self, body: bytes, key: int) -> bool:
+        failed = set()
+        while True:
+            index = self.ring.get(key, failed)
+            if index is None:
+                return False
+            worker = self.workers[index]
+            try:
+                async with self._session.post(
+                    worker.url,
+                    data=body,
+                    headers={SECRET_HEADER: WEBHOOK_SECRET, "Content-Type": "application/json"},
+                ) as response:
+                    if response.status < 500:
+                        CLUSTER_FORWARDED.inc(str(index))
+                        return True
+                    logging.error(f"Рабочий процесс {index} ответил {response.status}")
+            except (ClientError, asyncio.TimeoutError) as e:
+                logging.error(f"Рабочий процесс {index} недоступен: {e}")
+            failed.add(index)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401, text="Unauthorized")
+        body = await request.read()
+        try:
+            key = shard_key(json.loads(body))
+        except (ValueError, AttributeError, KeyError, TypeError):
+            return web.Response(status=400, text="Bad update")
+        if not await self.forward(body, key):
+            # Telegram повторит доставку позже
+            return web.Response(status=503, text="No workers")
+        return web.Response()
+
+
+# Регистрация webhook у Telegram (обработчиков в супервизоре нет, поэтому
+# allowed_updates не передаётся — Telegram присылает типы по умолчанию)
+async def _register_webhook():
+    if not WEBHOOK_URL:
+        logging.warning("WEBHOOK_URL не задан, webhook не будет зарегистрирован")
+        return
+    session = create_bot_session()
+    bot = Bot(token=BOT_TOKEN, session=session)
+    try:
+        await bot.set_webhook(url=f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+    finally:
+        await session.close()
+    logging.info(f"Webhook зарегистрирован: {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+
+# Создание приложения супервизора: рабочие процессы запускаются вместе с ним
+def create_app(supervisor: Supervisor) -> web.Application:
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, supervisor.handle)
+
+    async def on_startup(app: web.Application):
+        await supervisor.start()
+        app["metrics_runner"] = await start_metrics_server()
+        await _register_webhook()
+
+    async def on_cleanup(app: web.Application):
+        await supervisor.close()
+        if app["metrics_runner"] is not None:
+            await app["metrics_runner"].cleanup()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    setup_logging()
+    web.run_app(create_app(Supervisor()), host=WEBHOOK_HOST, port=WEBHOOK_PORT, access_log=None)
@@ -0,0 +1,182 @@
+import os
+import secrets
+
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения из файла .env
+load_dotenv()
+
+# Основные настройки бота
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Список администраторов разбирается один раз при запуске
+ADMIN_IDS = [int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id.strip()]
+
+# Режим работы бота: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Кластер (cluster.py): число рабочих процессов (по умолчанию — по числу ядер),
+# порты рабочих процессов начиная с CLUSTER_BASE_PORT и число виртуальных узлов
+# на процесс в кольце консистентного хеширования
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "0")) or os.cpu_count() or 1
+CLUSTER_BASE_PORT = int(os.getenv("CLUSTER_BASE_PORT", "8100"))
+CLUSTER_VNODES = int(os.getenv("CLUSTER_VNODES", "64"))
+# Порт рабочего процесса (BOT_MODE=worker, задаётся супервизором).
+# Архив заявок у процессов общий; индекс повторных заявок в рабочем процессе не держит
+# фильтр Блума (он видел бы только свои заявки) и каждый раз ищет по архиву
+WORKER_PORT = int(os.getenv("WORKER_PORT", "0"))
+
+# Адрес Bot API (можно указать локальный сервер telegram-bot-api или тестовый стенд)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# HTTP-клиент бота (одна сессия aiohttp на процесс): соединений в пуле (всего и на один
+# хост), сколько секунд держать простаивающее соединение открытым, сколько кэшировать
+# DNS и таймауты запроса (целиком) и установки соединения
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "200"))
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "0"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60"))
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "3600"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
+# Настройки webhook-режима (nginx проксирует https://<домен>/ на http://bot:8080/)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+# Секрет, который Telegram передаёт в заголовке X-Telegram-Bot-Api-Secret-Token.
+# Если не задан, генерируется при каждом запуске и заново регистрируется в setWebhook.
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+# Передача webhook при перезапуске без простоя: экземпляр следит (раз в
+# HANDOVER_CHECK_INTERVAL секунд), не зарегистрировал ли webhook другой экземпляр,
+# и тогда сам корректно останавливается
+WEBHOOK_HANDOVER = os.getenv("WEBHOOK_HANDOVER", "0").lower() in ("1", "true", "yes")
+# Метка экземпляра: при WEBHOOK_HANDOVER добавляется к адресу webhook (?instance=...), чтобы
+# экземпляры за одним общим WEBHOOK_URL отличали свою регистрацию от чужой.
+# Если не задана, генерируется при каждом запуске
+WEBHOOK_INSTANCE = os.getenv("WEBHOOK_INSTANCE") or secrets.token_hex(8)
+HANDOVER_CHECK_INTERVAL = float(os.getenv("HANDOVER_CHECK_INTERVAL", "5"))
+
+# Журнал: уровень, формат (json — объект на строку, text — для чтения глазами), файл с
+# ротацией по размеру (пусто — только stderr), его наибольший размер в байтах и число
+# старых файлов. LOG_SAMPLE — доля сохраняемых INFO-записей частых логгеров,
+# "логгер=доля" через запятую (по умолчанию — 1% строк aiogram «Update id=... is handled»)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 2 ** 20)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+# Записей в очереди к потоку записи; при переполнении новые записи отбрасываются
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "100000"))
+LOG_SAMPLE = {
+    name.strip(): float(share)
+    for name, share in (item.split("=", 1) for item in os.getenv("LOG_SAMPLE", "aiogram.event=0.01").split(",") if item.strip())
+}
+
+# Сколько секунд при остановке ждать обработчиков обновлений и досылки очереди outbox
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+
+# Выбор хранилища состояний анкеты: memory, sqlite или redis
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "fsm.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+# Сколько секунд хранить незаконченную анкету без действий пользователя (FSM_STORAGE=memory
+# и redis; 0 — бессрочно). FSM_STATE_TTL задаёт срок для отдельных состояний, например
+# "Form:confirm=1209600,Form:residence=86400". Просроченные анкеты в памяти удаляются раз
+# в FSM_SWEEP_INTERVAL секунд пачками по FSM_SWEEP_CHUNK записей
+FSM_TTL = float(os.getenv("FSM_TTL", str(7 * 86400)))
+FSM_STATE_TTL = {
+    state.strip(): float(ttl)
+    for state, ttl in (item.split("=", 1) for item in os.getenv("FSM_STATE_TTL", "").split(",") if item.strip())
+}
+FSM_SWEEP_INTERVAL = float(os.getenv("FSM_SWEEP_INTERVAL", "60"))
+FSM_SWEEP_CHUNK = int(os.getenv("FSM_SWEEP_CHUNK", "1000"))
+# Размер LRU-кэша чтения для SQLite-хранилища (0 — без кэша)
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+# Как часто (в секундах) накопленные изменения сбрасываются в хранилище одним пакетом
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.05"))
+
+# Лимиты рассылки администраторам: сообщений в секунду на бота и на один чат
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "30"))
+NOTIFY_PER_CHAT_RATE = float(os.getenv("NOTIFY_PER_CHAT_RATE", "1"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+
+# Очередь исходящих уведомлений (outbox): файл базы и политика повторов
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_BASE_DELAY = float(os.getenv("OUTBOX_BASE_DELAY", "5"))
+OUTBOX_MAX_DELAY = float(os.getenv("OUTBOX_MAX_DELAY", "3600"))
+# Срочные запросы /sos: отдельная очередь outbox (свой файл и поток записи, поэтому
+# не ждёт записи заявок) и сколько секунд повторный /sos того же пользователя не отправляется
+SOS_OUTBOX_PATH = os.getenv("SOS_OUTBOX_PATH", "sos.sqlite3")
+SOS_COOLDOWN = float(os.getenv("SOS_COOLDOWN", "60"))
+
+# Архив подтверждённых заявок и размер страницы команды /leads
+LEADS_PATH = os.getenv("LEADS_PATH", "leads.sqlite3")
+LEADS_PAGE_SIZE = int(os.getenv("LEADS_PAGE_SIZE", "10"))
+# Выгрузка заявок командой /export: заявок на один запрос к архиву, наибольший размер
+# файла в байтах (Bot API принимает документы до 50 МБ, большая выгрузка делится на
+# части) и таймаут отправки одного файла в секундах
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_PART_SIZE = int(os.getenv("EXPORT_PART_SIZE", str(45 * 2 ** 20)))
+EXPORT_UPLOAD_TIMEOUT = float(os.getenv("EXPORT_UPLOAD_TIMEOUT", "300"))
+# Рассылка клиентам командой /broadcast: файл базы рассылок, сообщений в секунду (часть
+# общего лимита бота NOTIFY_GLOBAL_RATE — остальное остаётся заявкам и напоминаниям) и
+# сколько получателей отправляется между контрольными точками
+BROADCASTS_PATH = os.getenv("BROADCASTS_PATH", "broadcasts.sqlite3")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "20"))
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "100"))
+
+# Оценка заявок (scoring.py): JSON-файл модели (баллы за варианты ответов; пусто — модель по
+# умолчанию), с какой оценки (0-100) заявка горячая и заявок в одной транзакции пересчёта
+# архива. Горячие заявки обгоняют очередь заявок и сначала уходят администраторам из
+# HOT_LEAD_ADMIN_IDS (пусто — всем ADMIN_IDS сразу), остальным ADMIN_IDS — через
+# HOT_LEAD_HEAD_START секунд
+LEAD_SCORE_MODEL = os.getenv("LEAD_SCORE_MODEL", "")
+LEAD_HOT_SCORE = int(os.getenv("LEAD_HOT_SCORE", "70"))
+LEAD_SCORE_BATCH_SIZE = int(os.getenv("LEAD_SCORE_BATCH_SIZE", "10000"))
+HOT_LEAD_ADMIN_IDS = [int(admin_id) for admin_id in os.getenv("HOT_LEAD_ADMIN_IDS", "").split(",") if admin_id.strip()]
+HOT_LEAD_HEAD_START = float(os.getenv("HOT_LEAD_HEAD_START", "0"))
+
+# Повторные заявки: окно (в секундах), в течение которого заявка с тем же телефоном
+# или от того же пользователя объединяется с прежней (0 — не объединять), и размер
+# фильтра Блума в памяти (ключей) с допустимой долей ложных срабатываний
+LEAD_DEDUP_WINDOW = int(os.getenv("LEAD_DEDUP_WINDOW", str(30 * 86400)))
+LEAD_INDEX_CAPACITY = int(os.getenv("LEAD_INDEX_CAPACITY", "1000000"))
+LEAD_INDEX_ERROR_RATE = float(os.getenv("LEAD_INDEX_ERROR_RATE", "0.01"))
+
+# Напоминания о незаконченной анкете: через сколько секунд после перехода на шаг
+# отправить первое напоминание, через сколько после него — второе и т. д. (через запятую,
+# пусто — не напоминать); файл базы таймеров, напоминаний в секунду, сколько отправлять
+# за раз и как часто (в секундах) сбрасывать изменения таймеров на диск
+REMINDER_DELAYS = [float(delay) for delay in os.getenv("REMINDER_DELAYS", "1800,86400").split(",") if delay.strip()]
+REMINDERS_PATH = os.getenv("REMINDERS_PATH", "reminders.sqlite3")
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", "10"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "100"))
+REMINDER_FLUSH_INTERVAL = float(os.getenv("REMINDER_FLUSH_INTERVAL", "1"))
+
+# Воронка анкеты (/stats): журнал переходов между шагами, как часто (в секундах) дописывать
+# его на диск и сохранять сводку, и через сколько секунд без переходов пользователь
+# считается ушедшим с шага (0 — никогда)
+FUNNEL_PATH = os.getenv("FUNNEL_PATH", "funnel.log")
+FUNNEL_FLUSH_INTERVAL = float(os.getenv("FUNNEL_FLUSH_INTERVAL", "1"))
+FUNNEL_SNAPSHOT_INTERVAL = float(os.getenv("FUNNEL_SNAPSHOT_INTERVAL", "60"))
+FUNNEL_IDLE = float(os.getenv("FUNNEL_IDLE", "86400"))
+
+# Сколько последних сводок анкеты держать в кэше (0 — без кэша)
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "10000"))
+
+# Сколько нормализованных телефонов держать в кэше (по исходной строке)
+PHONE_CACHE_SIZE = int(os.getenv("PHONE_CACHE_SIZE", "10000"))
+
+# Защита от флуда: обновлений в секунду от одного пользователя и запас на серию нажатий,
+# окно (в секундах) для повторных нажатий той же кнопки и размер таблиц блокировок/пользователей
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "2"))
+FLOOD_BURST = float(os.getenv("FLOOD_BURST", "10"))
+CALLBACK_DEDUP_WINDOW = float(os.getenv("CALLBACK_DEDUP_WINDOW", "1"))
+FLOOD_TABLE_SIZE = int(os.getenv("FLOOD_TABLE_SIZE", "10000"))
+
+# HTTP-эндпоинт /metrics для Prometheus (отдельный порт, 0 — отключить)
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
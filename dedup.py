@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Iterable, List, Optional
+
+from config import LEAD_DEDUP_WINDOW, LEAD_INDEX_CAPACITY, LEAD_INDEX_ERROR_RATE
+from leads import LeadStore
+
+
+# Фильтр Блума: «точно нет» или «возможно есть» за O(k) без обращения к базе.
+# Размер подбирается под capacity ключей и долю ложных срабатываний error_rate
+# (миллион ключей при 1% — около 1,2 МБ).
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    # Позиции битов по двойному хешированию из одного 128-битного blake2b
+    def _positions(self, key: str) -> Iterable[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(first + i * step) % size for i in range(self.hashes)]
+
+    def add(self, key: str):
+        bits = self._bits
+        for position in self._positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        for position in self._positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+def _keys(phone: Optional[str], user_id: int) -> List[str]:
+    keys = [f"u:{user_id}"]
+    if phone:
+        keys.append(f"p:{phone}")
+    return keys
+
+
+# Индекс повторных заявок: по телефону и id пользователя находит заявку, отправленную
+# за последние window секунд. Фильтр Блума в памяти отвечает «новый клиент» без запроса
+# к базе (самый частый случай), и только при совпадении выполняется поиск по индексам
+# архива. Фильтр строится из архива при запуске и пересобирается, когда в нём больше
+# ключей, чем рассчитано: устаревшие заявки при этом выпадают, память остаётся ограниченной.
+# Фильтр видит только заявки своего процесса, поэтому рабочие процессы cluster.py, которые
+# пишут в один архив, создают индекс с bloom=False: каждый поиск идёт в архив, и повторная
+# заявка из чата, попавшего к другому процессу, тоже объединяется с прежней
+class DuplicateIndex:
+    def __init__(
+        self,
+        store: LeadStore,
+        window: int = LEAD_DEDUP_WINDOW,
+        capacity: int = LEAD_INDEX_CAPACITY,
+        error_rate: float = LEAD_INDEX_ERROR_RATE,
+        bloom: bool = True,
+    ):
+        self.store = store
+        self.window = window
+        self.bloom = bloom
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = BloomFilter(capacity, error_rate)
+        # Ключи, добавленные во время пересборки: попадут и в новый фильтр
+        self._added: Optional[List[str]] = None
+        self._rebuild_task: Optional[asyncio.Task] = None
+        # Сколько раз фильтр избавил от запроса к базе и сколько запросов всё же было
+        self.skipped = 0
+        self.lookups = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._filter.nbytes
+
+    # Построение фильтра по заявкам из окна (при запуске и при переполнении)
+    async def load(self):
+        if not self.window or not self.bloom:
+            return
+        since = int(time.time()) - self.window
+        self._added = []
+        try:
+            # Два ключа на заявку и запас на столько же новых
+            capacity = max(self.capacity, await self.store.count_recent(since) * 4)
+            if capacity > self.capacity:
+                # Заявок в окне больше, чем рассчитано: фильтр растёт, иначе ложных совпадений будет слишком много
+                logging.warning(f"Индекс повторных заявок расширен до {capacity} ключей (LEAD_INDEX_CAPACITY={self.capacity})")
+            bloom = BloomFilter(capacity, self.error_rate)
+            async for batch in self.store.recent_keys(since):
+                for phone, user_id in batch:
+                    for key in _keys(phone, user_id):
+                        bloom.add(key)
+            for key in self._added:
+                bloom.add(key)
+            self._filter = bloom
+        finally:
+            self._added = None
+        logging.info(f"Индекс повторных заявок: {bloom.count} ключей, {bloom.nbytes / 2 ** 20:.1f} МБ")
+
+    # Номер заявки того же клиента из окна или None
+    async def find(self, phone: Optional[str], user_id: int) -> Optional[int]:
+        if not self.window:
+            return None
+        if self.bloom and not any(key in self._filter for key in _keys(phone, user_id)):
+            self.skipped += 1
+            return None
+        self.lookups += 1
+        return await self.store.find_recent(phone, user_id, int(time.time()) - self.window)
+
+    # Учёт новой заявки
+    def add(self, phone: Optional[str], user_id: int):
+        if not self.window or not self.bloom:
+            return
+        for key in _keys(phone, user_id):
+            self._filter.add(key)
+            if self._added is not None:
+                self._added.append(key)
+        if self._filter.count > self._filter.capacity and (self._rebuild_task is None or self._rebuild_task.done()):
+            self._rebuild_task = asyncio.create_task(self.load())
+
+    async def close(self):
+        if self._rebuild_task is not None:
+            self._rebuild_task.cancel()
+            await asyncio.gather(self._rebuild_task, return_exceptions=True)
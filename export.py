@@ -0,0 +1,162 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from config import EXPORT_BATCH_SIZE, EXPORT_PART_SIZE, LEADS_PATH
+from leads import EXPORT_COLUMNS, iter_leads, parse_filters
+from questionnaire import QUESTIONNAIRE
+
+# Столбцы со временем (в архиве — Unix-время, в выгрузке — местное время, как в фильтрах)
+TIME_COLUMNS = tuple(EXPORT_COLUMNS.index(name) for name in ("created_at", "updated_at"))
+# Столбцы со свободным вводом пользователя (остальные — варианты с кнопок)
+TEXT_COLUMNS = tuple(EXPORT_COLUMNS.index(step.name) for step in QUESTIONNAIRE if step.free_text)
+# Первые символы ячейки, с которых Excel и LibreOffice начинают формулу
+FORMULA_CHARS = "=+-@\t\r"
+
+# Выгрузки идут по одной в отдельном потоке: чтение архива и запись файла не блокируют
+# event loop, а поток LeadStore остаётся свободным для новых заявок
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+
+def _readable(row: Sequence[Any]) -> List[Any]:
+    row = list(row)
+    for index in TIME_COLUMNS:
+        if row[index] is not None:
+            row[index] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[index]))
+    return row
+
+
+# Пачка заявок в CSV. Свободные ответы, похожие на формулу, экранируются апострофом,
+# чтобы таблица не выполнила их при открытии
+def _csv_chunk(rows: List[Tuple]) -> str:
+    prepared = []
+    for row in rows:
+        row = _readable(row)
+        for index in TEXT_COLUMNS:
+            value = row[index]
+            if value and value[0] in FORMULA_CHARS:
+                row[index] = "'" + value
+        prepared.append(row)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(prepared)
+    return buffer.getvalue()
+
+
+# Пачка заявок в JSON Lines: объект на строку
+def _jsonl_chunk(rows: List[Tuple]) -> str:
+    return "".join(json.dumps(dict(zip(EXPORT_COLUMNS, _readable(row))), ensure_ascii=False) + "\n" for row in rows)
+
+
+# Форматы выгрузки: заголовок каждого файла и кодирование пачки заявок.
+# BOM нужен, чтобы Excel открыл CSV в UTF-8, а не в системной кодировке
+FORMATS: Dict[str, Tuple[str, Callable[[List[Tuple]], str]]] = {
+    "csv": ("\ufeff" + ",".join(EXPORT_COLUMNS) + "\r\n", _csv_chunk),
+    "jsonl": ("", _jsonl_chunk),
+}
+
+
+# Конвейер выгрузки: пачки заявок -> куски текста в байтах (пачки читаются по мере записи,
+# поэтому в памяти одновременно одна пачка)
+def encode_batches(batches: Iterable[List[Tuple]], fmt: str) -> Iterator[Tuple[bytes, int]]:
+    _, encode = FORMATS[fmt]
+    for rows in batches:
+        yield encode(rows).encode(), len(rows)
+
+
+# Запись кусков в поток вывода (например, stdout); возвращает число заявок
+def write_stream(chunks: Iterable[Tuple[bytes, int]], fmt: str, output: BinaryIO) -> int:
+    total = 0
+    output.write(FORMATS[fmt][0].encode())
+    for data, count in chunks:
+        output.write(data)
+        total += count
+    return total
+
+
+# Запись кусков в файлы не больше part_size байт (0 — в один файл): base.csv, base-2.csv, ...
+# Каждая часть начинается с заголовка и открывается отдельно. Возвращает число заявок и пути
+# созданных файлов (ни одного, если заявок нет)
+def write_parts(chunks: Iterable[Tuple[bytes, int]], fmt: str, base: str, part_size: int = 0) -> Tuple[int, List[str]]:
+    header = FORMATS[fmt][0].encode()
+    paths: List[str] = []
+    total = size = 0
+    output: Optional[BinaryIO] = None
+    try:
+        for data, count in chunks:
+            if output is None or (part_size and size > len(header) and size + len(data) > part_size):
+                if output is not None:
+                    output.close()
+                paths.append(f"{base}.{fmt}" if not paths else f"{base}-{len(paths) + 1}.{fmt}")
+                output = open(paths[-1], "wb")
+                output.write(header)
+                size = len(header)
+            output.write(data)
+            size += len(data)
+            total += count
+    finally:
+        if output is not None:
+            output.close()
+    return total, paths
+
+
+# Выгрузка заявок по фильтрам (как у /leads) в файлы каталога directory
+async def export_leads(
+    directory: str,
+    fmt: str = "csv",
+    filters: Optional[Dict[str, Any]] = None,
+    part_size: int = EXPORT_PART_SIZE,
+    path: str = LEADS_PATH,
+) -> Tuple[int, List[str]]:
+    batches = iter_leads(path, EXPORT_BATCH_SIZE, **(filters or {}))
+    base = os.path.join(directory, f"leads_{datetime.now():%Y%m%d_%H%M}")
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, write_parts, encode_batches(batches, fmt), fmt, base, part_size
+    )
+
+
+# Разбор аргументов команды /export вида "jsonl type=Квартира; from=01.03.2024":
+# формат (необязательно, по умолчанию CSV) и фильтры /leads
+def parse_export_args(args: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    fmt, _, rest = (args or "").strip().partition(" ")
+    if fmt.lower() in FORMATS:
+        return fmt.lower(), parse_filters(rest)
+    return "csv", parse_filters(args)
+
+
+# Выгрузка из командной строки, например:
+#   python export.py --format jsonl --filters "type=Квартира; from=01.03.2024" -o leads.jsonl
+#   python export.py --filters "budget=3-5 млн ₽" | gzip > leads.csv.gz
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Выгрузка архива заявок в CSV или JSON Lines")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+    parser.add_argument("--filters", default="", help="фильтры как у /leads: \"type=Квартира; from=01.03.2024\"")
+    parser.add_argument("-o", "--output", default="-", help="файл выгрузки, - — стандартный вывод")
+    parser.add_argument("--leads", default=LEADS_PATH, help="архив заявок")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    try:
+        filters = parse_filters(args.filters)
+    except ValueError as e:
+        parser.error(str(e))
+
+    chunks = encode_batches(iter_leads(args.leads, args.batch_size, **filters), args.format)
+    if args.output == "-":
+        total = write_stream(chunks, args.format, sys.stdout.buffer)
+        sys.stdout.flush()
+    else:
+        with open(args.output, "wb") as output:
+            total = write_stream(chunks, args.format, output)
+    print(f"Выгружено заявок: {total}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
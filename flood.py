@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.types import CallbackQuery, Update
+
+from config import CALLBACK_DEDUP_WINDOW, FLOOD_BURST, FLOOD_RATE, FLOOD_TABLE_SIZE, SOS_COOLDOWN
+from metrics import FLOOD_DROPPED
+from notify import TokenBucket
+
+# Сколько записей просматривать при вытеснении за один раз
+EVICT_SCAN = 8
+
+THROTTLE_TEXT = "⏳ Слишком много сообщений подряд. Пожалуйста, подождите пару секунд."
+SOS_REPEAT_TEXT = "🆘 Ваш запрос уже отправлен. Специалист свяжется с вами в ближайшее время."
+
+
+# Команда /sos (в том числе /sos@имя_бота и с текстом после команды)
+def is_sos(event: Update) -> bool:
+    text = event.message.text if event.message is not None else None
+    if not text or not text.startswith("/sos"):
+        return False
+    command = text.split(maxsplit=1)[0]
+    return command == "/sos" or command.startswith("/sos@")
+
+
+# Изоляция обновлений: обновления одного чата обрабатываются строго по очереди,
+# разные чаты — параллельно. FSM-middleware aiogram читает состояние уже под этой
+# блокировкой, поэтому два быстрых нажатия не видят одно и то же состояние.
+# В отличие от SimpleEventIsolation, таблица блокировок ограничена: сверх max_size
+# вытесняются давно не использованные блокировки, которые никто не держит и не ждёт.
+class BoundedEventIsolation(BaseEventIsolation):
+    def __init__(self, max_size: int = FLOOD_TABLE_SIZE):
+        self.max_size = max_size
+        # ключ -> [блокировка, сколько обработчиков её держат или ждут]
+        self._locks: "OrderedDict[StorageKey, List[Any]]" = OrderedDict()
+
+    # Число блокировок в таблице (не __len__: диспетчер проверяет изоляцию на истинность)
+    @property
+    def size(self) -> int:
+        return len(self._locks)
+
+    def _evict(self):
+        # Занятые блокировки переставляются в конец (они и так используются прямо сейчас);
+        # просмотр ограничен, остальное освобождается при выходе из блокировки
+        for _ in range(EVICT_SCAN):
+            if len(self._locks) <= self.max_size:
+                return
+            key, entry = self._locks.popitem(last=False)
+            if entry[1]:
+                self._locks[key] = entry
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        else:
+            self._locks.move_to_end(key)
+        entry[1] += 1
+        if len(self._locks) > self.max_size:
+            self._evict()
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            # После всплеска, когда все блокировки были заняты, таблица сжимается обратно
+            if not entry[1] and len(self._locks) > self.max_size and self._locks.get(key) is entry:
+                del self._locks[key]
+
+    async def close(self) -> None:
+        self._locks.clear()
+
+
+# Защита от флуда: ограничение частоты обновлений от одного пользователя
+# (ведро с токенами, одно вежливое предупреждение за серию) и отбрасывание
+# повторных нажатий той же инлайн-кнопки в течение dedup_window секунд.
+# /sos не ограничивается ведром (пользователь, который только что засыпал бота
+# сообщениями, всё равно дозовётся специалиста), но повторный /sos в течение
+# sos_cooldown секунд не отправляется ещё раз.
+# Таблицы пользователей, нажатий и SOS ограничены max_size записями (LRU).
+class FloodControlMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        rate: float = FLOOD_RATE,
+        burst: float = FLOOD_BURST,
+        dedup_window: float = CALLBACK_DEDUP_WINDOW,
+        max_size: int = FLOOD_TABLE_SIZE,
+        sos_cooldown: float = SOS_COOLDOWN,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.dedup_window = dedup_window
+        self.max_size = max_size
+        self.sos_cooldown = sos_cooldown
+        # id пользователя -> [ведро, предупреждён ли в текущей серии]
+        self._users: "OrderedDict[int, List[Any]]" = OrderedDict()
+        # (пользователь, сообщение, кнопка) -> время нажатия
+        self._callbacks: "OrderedDict[Tuple[Any, ...], float]" = OrderedDict()
+        # id пользователя -> время последнего отправленного SOS
+        self._sos: "OrderedDict[int, float]" = OrderedDict()
+        self.throttled = 0
+        self.duplicates = 0
+
+    def _user(self, user_id: int) -> List[Any]:
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = [TokenBucket(self.rate, capacity=self.burst), False]
+            if len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return entry
+
+    def _is_duplicate(self, callback: CallbackQuery) -> bool:
+        now = time.monotonic()
+        # Нажатия лежат в порядке времени: устаревшие всегда в начале
+        while self._callbacks:
+            key, pressed_at = next(iter(self._callbacks.items()))
+            if now - pressed_at < self.dedup_window and len(self._callbacks) < self.max_size:
+                break
+            self._callbacks.popitem(last=False)
+
+        message_id = callback.message.message_id if callback.message else callback.inline_message_id
+        key = (callback.from_user.id, message_id, callback.data)
+        if key in self._callbacks:
+            return True
+        self._callbacks[key] = now
+        return False
+
+    def _is_sos_repeat(self, user_id: int) -> bool:
+        now = time.monotonic()
+        # Как и нажатия, SOS лежат в порядке времени
+        while self._sos:
+            sent_at = next(iter(self._sos.values()))
+            if now - sent_at < self.sos_cooldown and len(self._sos) < self.max_size:
+                break
+            self._sos.popitem(last=False)
+        if user_id in self._sos:
+            return True
+        self._sos[user_id] = now
+        return False
+
+    async def _warn(self, event: Update):
+        try:
+            if event.message is not None:
+                await event.message.answer(THROTTLE_TEXT)
+            elif event.callback_query is not None:
+                await event.callback_query.answer(THROTTLE_TEXT)
+        except Exception as e:
+            logging.warning(f"Не удалось предупредить пользователя о флуде: {e}")
+
+    # Ответ на отброшенное нажатие кнопки (чтобы у клиента пропали «часики»). Ошибка здесь
+    # не важна — после всплеска запрос часто уже слишком старый
+    async def _answer(self, callback: CallbackQuery):
+        try:
+            await callback.answer()
+        except Exception as e:
+            logging.debug(f"Не удалось ответить на отброшенное нажатие кнопки: {e}")
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and is_sos(event):
+            if self.sos_cooldown > 0 and self._is_sos_repeat(user.id):
+                FLOOD_DROPPED.inc("sos_repeat")
+                try:
+                    await event.message.answer(SOS_REPEAT_TEXT)
+                except Exception as e:
+                    logging.warning(f"Не удалось ответить на повторный SOS: {e}")
+                return None
+            return await handler(event, data)
+
+        if user is not None:
+            entry = self._user(user.id)
+            if not entry[0].try_acquire():
+                self.throttled += 1
+                FLOOD_DROPPED.inc("throttled")
+                if not entry[1]:
+                    entry[1] = True
+                    await self._warn(event)
+                elif event.callback_query is not None:
+                    await self._answer(event.callback_query)
+                return None
+            entry[1] = False
+
+        callback = event.callback_query
+        if callback is not None and self.dedup_window > 0 and self._is_duplicate(callback):
+            self.duplicates += 1
+            FLOOD_DROPPED.inc("duplicate")
+            await self._answer(callback)
+            return None
+
+        return await handler(event, data)
@@ -0,0 +1,385 @@
+import array
+import asyncio
+import base64
+import json
+import logging
+import os
+import struct
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config import FUNNEL_FLUSH_INTERVAL, FUNNEL_IDLE, FUNNEL_PATH, FUNNEL_SNAPSHOT_INTERVAL
+from questionnaire import STEPS, Form
+from storage import StorageProxy
+
+# Коды состояний в журнале воронки: 0 — вне анкеты, затем шаги анкеты по порядку и
+# подтверждение, затем итоги: заявка отправлена и пользователь ушёл (не было переходов
+# FUNNEL_IDLE секунд). Событие с одинаковыми кодами «откуда» и «куда» — ответ на шаг,
+# не прошедший проверку
+OUTSIDE = 0
+STATES: Tuple[Optional[str], ...] = (None, *STEPS, Form.confirm.state)
+CODES: Dict[Optional[str], int] = {state: code for code, state in enumerate(STATES)}
+FIRST = CODES[next(iter(STEPS))]
+CONFIRM = CODES[Form.confirm.state]
+SUBMITTED = len(STATES)
+ABANDONED = SUBMITTED + 1
+# Шаг -> код следующего шага (с подтверждения — отправленная заявка)
+NEXT = {CODES[state]: CODES[step.next or Form.confirm.state] for state, step in STEPS.items()}
+NEXT[CONFIRM] = SUBMITTED
+# Названия шагов в отчёте /stats
+LABELS = {**{CODES[state]: step.name for state, step in STEPS.items()}, CONFIRM: "confirm"}
+
+# Границы корзин времени на шаге, секунды (последняя корзина — дольше суток)
+DURATION_BOUNDS = (1, 2, 3, 5, 7, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300, 600, 1800, 3600, 3 * 3600, 86400)
+
+# Сегмент журнала: заголовок (метка, число событий, время самого раннего события в мс) и столбцы:
+# chat_id (int64), откуда и куда (по байту), миллисекунды от этого времени (uint32) —
+# 14 байт на событие. Время везде в целых миллисекундах: сводка, пересчитанная по
+# журналу, совпадает с живой до корзины
+SEGMENT = struct.Struct("<4sIq")
+MAGIC = b"FNL1"
+Columns = Tuple[array.array, array.array, array.array, array.array]
+
+
+def _columns() -> Columns:
+    return array.array("q"), array.array("B"), array.array("B"), array.array("q")
+
+
+def _encode(values: array.array) -> str:
+    return base64.b64encode(values.tobytes()).decode()
+
+
+def _decode(typecode: str, text: str) -> array.array:
+    values = array.array(typecode)
+    values.frombytes(base64.b64decode(text))
+    return values
+
+
+def _now() -> int:
+    return time.time_ns() // 1_000_000
+
+
+# Дописать события в конец журнала одним сегментом
+def write_segment(file, columns: Columns):
+    chat_ids, sources, targets, times = columns
+    # Не первое событие, а самое раннее: часы могут перевести назад
+    base = min(times)
+    offsets = array.array("I", [at - base for at in times])
+    file.write(SEGMENT.pack(MAGIC, len(chat_ids), base))
+    for column in (chat_ids, sources, targets, offsets):
+        file.write(column.tobytes())
+
+
+# Сегменты журнала начиная с offset: (смещение конца сегмента, столбцы событий).
+# Недописанный при сбое последний сегмент пропускается
+def read_segments(path: str, offset: int = 0) -> Iterator[Tuple[int, Columns]]:
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while True:
+            header = file.read(SEGMENT.size)
+            if len(header) < SEGMENT.size:
+                return
+            magic, count, base = SEGMENT.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f"Повреждён журнал воронки {path} по смещению {offset}")
+            columns = _columns()
+            offsets = array.array("I")
+            for column in (columns[0], columns[1], columns[2], offsets):
+                data = file.read(count * column.itemsize)
+                if len(data) < count * column.itemsize:
+                    return
+                column.frombytes(data)
+            columns[3].extend(base + value for value in offsets)
+            offset = file.tell()
+            yield offset, columns
+
+
+# Процентиль по корзинам (линейно внутри корзины, как histogram_quantile в Prometheus);
+# None — наблюдений нет, inf — процентиль в последней корзине
+def percentile(buckets: List[int], share: float) -> Optional[float]:
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = share * total
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            if index == len(DURATION_BOUNDS):
+                return float("inf")
+            lower = DURATION_BOUNDS[index - 1] if index else 0
+            return lower + (DURATION_BOUNDS[index] - lower) * (rank - seen) / count
+        seen += count
+    return None
+
+
+# Сводка воронки, обновляемая по одному событию за O(1) без пересчёта журнала:
+# матрица переходов между состояниями, ошибки ввода и корзины времени на каждом шаге.
+# Пользователи на шагах анкеты (chat_id -> код шага и время перехода) лежат в порядке
+# перехода, поэтому ушедшие находятся с начала словаря
+class FunnelStats:
+    def __init__(self):
+        size = ABANDONED + 1
+        self.transitions = [[0] * size for _ in range(size)]
+        self.rejected = [0] * size
+        self.durations = [[0] * (len(DURATION_BOUNDS) + 1) for _ in range(size)]
+        self.events = 0
+        self.since: Optional[int] = None
+        self.open: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+
+    def apply(self, chat_id: int, source: int, target: int, at: int):
+        self.events += 1
+        if self.since is None:
+            self.since = at
+        if source == target:
+            self.rejected[source] += 1
+            return
+        self.transitions[source][target] += 1
+        entry = self.open.pop(chat_id, None)
+        if entry is not None and entry[0] == source and target != ABANDONED:
+            self.durations[source][bisect_left(DURATION_BOUNDS, (at - entry[1]) / 1000)] += 1
+        if OUTSIDE < target < SUBMITTED:
+            self.open[chat_id] = (target, at)
+
+    def apply_columns(self, columns: Columns):
+        for event in zip(*columns):
+            self.apply(*event)
+
+    def entered(self, code: int) -> int:
+        return sum(row[code] for row in self.transitions)
+
+    def dump(self) -> Dict[str, Any]:
+        open_users = self.open
+        return {
+            "events": self.events,
+            "since": self.since,
+            "transitions": [row[:] for row in self.transitions],
+            "rejected": self.rejected[:],
+            "durations": [row[:] for row in self.durations],
+            # Столбцами, как в журнале: сотни тысяч пользователей на шагах — несколько МБ
+            "open": {
+                "chat_id": _encode(array.array("q", open_users.keys())),
+                "code": _encode(array.array("B", [code for code, _ in open_users.values()])),
+                "at": _encode(array.array("q", [at for _, at in open_users.values()])),
+            },
+        }
+
+    @classmethod
+    def load(cls, data: Dict[str, Any]) -> "FunnelStats":
+        stats = cls()
+        stats.events, stats.since = data["events"], data["since"]
+        stats.transitions, stats.rejected, stats.durations = data["transitions"], data["rejected"], data["durations"]
+        columns = data["open"]
+        stats.open = OrderedDict(zip(
+            _decode("q", columns["chat_id"]),
+            zip(_decode("B", columns["code"]), _decode("q", columns["at"])),
+        ))
+        return stats
+
+
+def _duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    if seconds == float("inf"):
+        return ">1д"
+    if seconds < 1:
+        return "<1с"
+    if seconds < 60:
+        return f"{seconds:.0f}с"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}м"
+    return f"{seconds / 3600:.0f}ч"
+
+
+def _share(part: int, total: int) -> str:
+    return f"{part * 100 // total}%" if total else "—"
+
+
+# Отчёт /stats: по каждому шагу — сколько раз на него переходили, доля перешедших дальше
+# и ушедших, ответы с ошибкой и время на шаге (медиана и 90-й процентиль)
+def format_report(stats: FunnelStats, idle: float = FUNNEL_IDLE) -> str:
+    if not stats.events:
+        return "📊 Переходов по анкете ещё не было."
+    started = stats.transitions[OUTSIDE][FIRST]
+    submitted = stats.entered(SUBMITTED)
+    lines = [
+        f"📊 <b>Воронка анкеты</b> с {time.strftime('%d.%m.%Y %H:%M', time.localtime(stats.since / 1000))}, "
+        f"событий: {stats.events}",
+        f"Начали анкету: {started}, отправили заявку: {submitted} ({_share(submitted, started)}), "
+        f"сейчас на шагах: {len(stats.open)}",
+        "",
+        "<pre>"
+        f"{'шаг':<15}{'вошли':>7}{'дальше':>7}{'ушли':>6}{'ошибки':>7}{'p50':>5}{'p90':>5}",
+    ]
+    for code in range(1, SUBMITTED):
+        entered = stats.entered(code)
+        exits = stats.transitions[code]
+        left = exits[OUTSIDE] + exits[ABANDONED]
+        buckets = stats.durations[code]
+        lines.append(
+            f"{LABELS[code]:<15}{entered:>7}{_share(exits[NEXT[code]], entered):>7}{_share(left, entered):>6}"
+            f"{stats.rejected[code]:>7}{_duration(percentile(buckets, 0.5)):>5}{_duration(percentile(buckets, 0.9)):>5}"
+        )
+    lines[-1] += "</pre>"
+    lines.append(
+        f"Дальше — перешли на следующий шаг (с confirm — отправили заявку), ушли — отменили анкету, "
+        f"начали заново или не отвечали {_duration(idle)}, ошибки — ответы, не прошедшие проверку"
+    )
+    return "\n".join(lines)
+
+
+# Аналитика воронки анкеты: каждый переход пользователя между состояниями анкеты
+# записывается событием (chat_id, откуда, куда, время) в столбцы в памяти и сразу
+# учитывается в сводке FunnelStats. Раз в flush_interval секунд накопленные события
+# дописываются в журнал одним сегментом (только добавление в конец файла), раз в
+# snapshot_interval секунд рядом сохраняется сводка со смещением в журнале. Запись идёт
+# в отдельном потоке; при запуске сводка загружается из снимка и дочитывается только
+# хвост журнала после него. Ключ — chat_id, как у напоминаний
+class Funnel:
+    def __init__(
+        self,
+        path: str = FUNNEL_PATH,
+        flush_interval: float = FUNNEL_FLUSH_INTERVAL,
+        snapshot_interval: float = FUNNEL_SNAPSHOT_INTERVAL,
+        idle: float = FUNNEL_IDLE,
+    ):
+        self.path = path
+        self.snapshot_path = f"{path}.json"
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.idle = idle
+        self.stats = FunnelStats()
+
+        self._columns = _columns()
+        self._snapshot_at = 0.0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="funnel")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _append(self, chat_id: int, source: int, target: int, at: int):
+        chat_ids, sources, targets, times = self._columns
+        chat_ids.append(chat_id)
+        sources.append(source)
+        targets.append(target)
+        times.append(at)
+        self.stats.apply(chat_id, source, target, at)
+
+    def _transition(self, chat_id: int, target: int):
+        entry = self.stats.open.get(chat_id)
+        source = entry[0] if entry is not None else OUTSIDE
+        if source != target:
+            self._append(chat_id, source, target, _now())
+
+    # Пользователь перешёл в состояние state (None — вышел из анкеты); состояния не из анкеты не учитываются
+    def record(self, chat_id: int, state: Optional[str]):
+        target = CODES.get(state)
+        if target is not None:
+            self._transition(chat_id, target)
+
+    # Пользователь отправил заявку с экрана подтверждения
+    def submitted(self, chat_id: int):
+        self._transition(chat_id, SUBMITTED)
+
+    # Ответ на шаг state не прошёл проверку
+    def reject(self, chat_id: int, state: str):
+        code = CODES.get(state)
+        if code:
+            self._append(chat_id, code, code, _now())
+
+    # Пользователи без переходов дольше idle секунд уходят с шага
+    def _expire(self, now: int):
+        open_users = self.stats.open
+        deadline = now - self.idle * 1000
+        while open_users:
+            chat_id, (code, at) = next(iter(open_users.items()))
+            if at > deadline:
+                break
+            self._append(chat_id, code, ABANDONED, now)
+
+    def _write(self, columns: Columns, snapshot: Optional[Dict[str, Any]]):
+        with open(self.path, "ab") as file:
+            if len(columns[0]):
+                write_segment(file, columns)
+            offset = file.tell()
+        if snapshot is not None:
+            snapshot["offset"] = offset
+            temporary = f"{self.snapshot_path}.tmp"
+            with open(temporary, "w") as file:
+                json.dump(snapshot, file)
+            os.replace(temporary, self.snapshot_path)
+
+    # Записать накопленные события (и снимок сводки — если пора или snapshot=True)
+    async def flush(self, snapshot: bool = False):
+        now = time.time()
+        if self.idle:
+            self._expire(_now())
+        columns, self._columns = self._columns, _columns()
+        dump = None
+        if snapshot or now - self._snapshot_at >= self.snapshot_interval:
+            self._snapshot_at = now
+            dump = self.stats.dump()
+        if len(columns[0]) or dump is not None:
+            await self._run(self._write, columns, dump)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Не удалось записать журнал воронки: {e}")
+
+    def _load(self) -> FunnelStats:
+        stats, offset = FunnelStats(), 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as file:
+                data = json.load(file)
+            stats, offset = FunnelStats.load(data), data["offset"]
+        if not os.path.exists(self.path):
+            return stats
+        end = offset
+        for end, columns in read_segments(self.path, offset):
+            stats.apply_columns(columns)
+        if end < os.path.getsize(self.path):
+            # Сегмент, недописанный при сбое, отрезается: новые сегменты пишутся после последнего целого
+            logging.warning(f"Журнал воронки {self.path} обрезан до {end} байт после сбоя")
+            with open(self.path, "r+b") as file:
+                file.truncate(end)
+        return stats
+
+    # Загрузка сводки (снимок и хвост журнала после него)
+    async def load(self):
+        self.stats = await self._run(self._load)
+        self._snapshot_at = time.time()
+
+    # Запуск фоновой записи журнала
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    # Остановка: оставшиеся события и снимок сводки записываются на диск
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush(snapshot=True)
+        self._executor.shutdown(wait=True)
+
+
+# Обёртка хранилища FSM: переходы по состояниям анкеты записываются в воронку
+class FunnelStorage(StorageProxy):
+    def __init__(self, storage: BaseStorage, funnel: Funnel):
+        super().__init__(storage)
+        self.funnel = funnel
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.storage.set_state(key, state)
+        self.funnel.record(key.chat_id, state.state if isinstance(state, State) else state)
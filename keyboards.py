@@ -0,0 +1,213 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiohttp import FormData
+
+BACK_BUTTON = "⬅️ Назад"
+
+# Варианты ответов на вопросы анкеты
+RESIDENCE_OPTIONS = [
+    "Собственная квартира",
+    "Собственный дом",
+    "Аренда",
+    "С родителями/родственниками",
+    "Другое",
+]
+SATISFACTION_OPTIONS = [
+    "Да, полностью доволен",
+    "Частично доволен",
+    "Нет, не доволен",
+]
+PROPERTY_TYPE_OPTIONS = [
+    "Квартира",
+    "Дом",
+    "Таунхаус",
+    "Участок земли",
+    "Коммерческая недвижимость",
+]
+LOCATION_OPTIONS = [
+    "В центре города",
+    "В спальном районе",
+    "В пригороде",
+    "За городом",
+    "Другое (напишите свой вариант)",
+]
+BUDGET_OPTIONS = [
+    "До 3 млн ₽",
+    "3-5 млн ₽",
+    "5-10 млн ₽",
+    "10-20 млн ₽",
+    "Более 20 млн ₽",
+]
+SEARCH_STATUS_OPTIONS = [
+    "Только начинаю искать",
+    "Уже смотрел(а) варианты",
+    "Определился(лась) с выбором",
+    "Готов(а) к сделке",
+]
+MORTGAGE_OPTIONS = [
+    "Да, уже одобрена",
+    "Да, планирую подать заявку",
+    "Нет, полная оплата",
+    "Еще не решил(а)",
+]
+PURCHASE_TIME_OPTIONS = [
+    "В ближайший месяц",
+    "В течение 3 месяцев",
+    "В течение полугода",
+    "В течение года",
+    "Пока просто интересуюсь",
+]
+CONTACT_METHOD_OPTIONS = [
+    "Телефон",
+    "WhatsApp",
+    "Telegram",
+    "Другое",
+]
+CONTACT_TIME_OPTIONS = [
+    "Утро (9:00-12:00)",
+    "День (12:00-18:00)",
+    "Вечер (18:00-21:00)",
+    "В любое время",
+]
+
+# Раскладка обычных клавиатур: шаг -> (варианты, кнопок в ряду).
+# "text" — только кнопка «Назад» для ввода своего варианта.
+REPLY_LAYOUTS: Dict[str, Tuple[List[str], int]] = {
+    "residence": (RESIDENCE_OPTIONS, 1),
+    "satisfaction": (SATISFACTION_OPTIONS, 1),
+    "property_type": (PROPERTY_TYPE_OPTIONS, 2),
+    "location": (LOCATION_OPTIONS, 1),
+    "budget": (BUDGET_OPTIONS, 1),
+    "search_status": (SEARCH_STATUS_OPTIONS, 1),
+    "mortgage": (MORTGAGE_OPTIONS, 1),
+    "purchase_time": (PURCHASE_TIME_OPTIONS, 1),
+    "contact_method": (CONTACT_METHOD_OPTIONS, 2),
+    "contact_time": (CONTACT_TIME_OPTIONS, 1),
+    "text": ([], 1),
+}
+
+# Раскладка инлайн-клавиатур: имя -> (кнопки, кнопок в ряду)
+INLINE_LAYOUTS: Dict[str, Tuple[List[str], int]] = {
+    "confirm": (["✅ Подтвердить", "❌ Изменить"], 2),
+    "edit": (["🏠 Жилищная ситуация", "💰 Готовность к покупке", "📞 Контактные данные", "🔄 Начать заново", BACK_BUTTON], 2),
+    "done": (["🔄 Новая заявка", "❓ Помощь"], 2),
+    "help": (["🔄 Новая заявка"], 1),
+}
+
+
+# Функция для создания инлайн-клавиатуры
+def get_inline_keyboard(buttons, row_width=1, add_back_button=False):
+    builder = InlineKeyboardBuilder()
+    for button in buttons:
+        builder.button(text=button, callback_data=button)
+
+    # Добавляем кнопку "Назад" если требуется
+    if add_back_button:
+        builder.button(text=BACK_BUTTON, callback_data=BACK_BUTTON)
+
+    builder.adjust(row_width)
+    return builder.as_markup()
+
+# Функция для создания клавиатуры только с кнопкой "Назад"
+def get_back_keyboard():
+    keyboard = [[KeyboardButton(text=BACK_BUTTON)]]
+    return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
+
+# Функция для создания обычной клавиатуры
+def get_reply_keyboard(buttons, row_width=1, one_time_keyboard=True, resize_keyboard=True, add_back_button=True):
+    keyboard = []
+    row = []
+    for i, button in enumerate(buttons):
+        row.append(KeyboardButton(text=button))
+        if (i + 1) % row_width == 0 or i == len(buttons) - 1:
+            keyboard.append(row)
+            row = []
+
+    # Добавляем кнопку "Назад" в последний ряд, если требуется
+    if add_back_button:
+        back_button = KeyboardButton(text=BACK_BUTTON)
+        if keyboard and len(keyboard[-1]) < row_width:
+            keyboard[-1].append(back_button)
+        else:
+            keyboard.append([back_button])
+
+    return ReplyKeyboardMarkup(keyboard=keyboard, one_time_keyboard=one_time_keyboard, resize_keyboard=resize_keyboard)
+
+# Функция для создания клавиатуры с кнопкой отправки контакта
+def get_contact_keyboard():
+    keyboard = [
+        [KeyboardButton(text="Отправить контакт", request_contact=True)],
+        [KeyboardButton(text="Отправить мой номер телефона")]
+    ]
+    return ReplyKeyboardMarkup(keyboard=keyboard, one_time_keyboard=True, resize_keyboard=True)
+
+
+# Сериализация клавиатуры так же, как это делает aiogram при отправке (без полей None)
+def _serialize(markup) -> str:
+    def drop_none(value):
+        if isinstance(value, dict):
+            return {key: drop_none(item) for key, item in value.items() if item is not None}
+        if isinstance(value, list):
+            return [drop_none(item) for item in value if item is not None]
+        return value
+
+    return json.dumps(drop_none(markup.model_dump(warnings=False)))
+
+
+# Реестр готовых клавиатур: строится один раз при импорте.
+# Объекты клавиатур в aiogram неизменяемые, поэтому их можно отправлять повторно.
+REPLY_KEYBOARDS = {
+    (step, back): get_reply_keyboard(options, row_width=row_width, add_back_button=back)
+    for step, (options, row_width) in REPLY_LAYOUTS.items()
+    for back in (False, True)
+}
+INLINE_KEYBOARDS = {
+    name: get_inline_keyboard(buttons, row_width=row_width)
+    for name, (buttons, row_width) in INLINE_LAYOUTS.items()
+}
+CONTACT_KEYBOARD = get_contact_keyboard()
+BACK_KEYBOARD = get_back_keyboard()
+REMOVE_KEYBOARD = ReplyKeyboardRemove()
+
+# Готовый JSON каждой клавиатуры из реестра (по id объекта)
+SERIALIZED_KEYBOARDS = {
+    id(markup): _serialize(markup)
+    for markup in (*REPLY_KEYBOARDS.values(), *INLINE_KEYBOARDS.values(), CONTACT_KEYBOARD, BACK_KEYBOARD, REMOVE_KEYBOARD)
+}
+
+
+# Обычная клавиатура для шага анкеты
+def reply_keyboard(step: str, back: bool = True) -> ReplyKeyboardMarkup:
+    return REPLY_KEYBOARDS[(step, back)]
+
+
+# Инлайн-клавиатура по имени
+def inline_keyboard(name: str):
+    return INLINE_KEYBOARDS[name]
+
+
+# Сессия Bot API, которая подставляет готовый JSON клавиатур из реестра,
+# вместо того чтобы сериализовать reply_markup при каждой отправке
+class MarkupCacheSession(AiohttpSession):
+    def build_form_data(self, bot: Bot, method: TelegramMethod[Any]) -> FormData:
+        markup_json = SERIALIZED_KEYBOARDS.get(id(getattr(method, "reply_markup", None)))
+        if markup_json is None:
+            return super().build_form_data(bot, method)
+
+        form = FormData(quote_fields=False)
+        files: Dict[str, Any] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", markup_json)
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
@@ -0,0 +1,329 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from config import LEADS_PATH
+from phones import normalize_phone
+
+# Ответы анкеты, которые сохраняются в архиве заявок
+LEAD_FIELDS = (
+    "residence",
+    "satisfaction",
+    "property_type",
+    "location",
+    "budget",
+    "search_status",
+    "mortgage",
+    "purchase_time",
+    "name",
+    "phone",
+    "contact_method",
+    "contact_time",
+)
+
+# Фильтры поиска: имя параметра -> условие SQL
+FILTERS = {
+    "budget": "budget = ?",
+    "property_type": "property_type = ?",
+    "phone": "phone = ?",
+    "date_from": "created_at >= ?",
+    "date_to": "created_at < ?",
+    "before": "id < ?",
+    "score_min": "score >= ?",
+}
+
+# Ключи фильтров команды /leads -> параметры поиска
+COMMAND_FILTERS = {
+    "budget": "budget",
+    "type": "property_type",
+    "phone": "phone",
+    "from": "date_from",
+    "to": "date_to",
+    "before": "before",
+    "score": "score_min",
+}
+
+
+# Разбор аргументов команды /leads вида "budget=3-5 млн ₽; type=Квартира; from=01.03.2024"
+def parse_filters(args: Optional[str]) -> Dict[str, Any]:
+    filters = {}
+    for part in (args or "").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        key, separator, value = part.partition("=")
+        key, value = key.strip().lower(), value.strip()
+        if not separator or key not in COMMAND_FILTERS or not value:
+            raise ValueError(f"Не удалось разобрать фильтр «{part}»")
+
+        name = COMMAND_FILTERS[key]
+        if name in ("date_from", "date_to"):
+            try:
+                timestamp = int(datetime.strptime(value, "%d.%m.%Y").timestamp())
+            except ValueError:
+                raise ValueError(f"Дата должна быть в формате ДД.ММ.ГГГГ: {value}")
+            # Дата «по» включается в выборку целиком
+            filters[name] = timestamp + 86400 if name == "date_to" else timestamp
+        elif name == "before":
+            if not value.isdigit():
+                raise ValueError(f"Номер заявки должен быть числом: {value}")
+            filters[name] = int(value)
+        elif name == "score_min":
+            if not value.isdigit():
+                raise ValueError(f"Оценка должна быть числом от 0 до 100: {value}")
+            filters[name] = int(value)
+        elif name == "phone":
+            # В архиве есть и номера из контактов других стран
+            phone = normalize_phone(value, international=True)
+            if phone is None:
+                raise ValueError(f"Некорректный номер телефона: {value}")
+            filters[name] = phone
+        else:
+            filters[name] = value
+    return filters
+
+
+# Архив подтверждённых заявок в SQLite с индексами для поиска администраторами.
+# Страницы выдаются по ключу (id < before), поэтому глубина листания не влияет на скорость.
+class LeadStore:
+    def __init__(self, path: str = LEADS_PATH):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leads")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{field} TEXT" for field in LEAD_FIELDS)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leads ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "created_at INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            f"username TEXT, {columns})"
+        )
+        # Повторные заявки объединяются с прежней: время последней отправки и их число
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(leads)")}
+        if "updated_at" not in existing:
+            self._db.execute("ALTER TABLE leads ADD COLUMN updated_at INTEGER")
+        if "submissions" not in existing:
+            self._db.execute("ALTER TABLE leads ADD COLUMN submissions INTEGER NOT NULL DEFAULT 1")
+        # Оценка заявки (scoring.py); у заявок до её появления — NULL до пересчёта архива
+        if "score" not in existing:
+            self._db.execute("ALTER TABLE leads ADD COLUMN score INTEGER")
+        # Сообщения о заявке в чатах администраторов (для редактирования при повторной отправке)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lead_messages ("
+            "lead_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, "
+            "PRIMARY KEY (lead_id, chat_id)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_phone ON leads (phone)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_user_id ON leads (user_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_budget ON leads (budget)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_property_type ON leads (property_type)")
+        # Рассылка по типу и бюджету читает получателей только из индекса, без строк таблицы
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_type_budget ON leads (property_type, budget, user_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_created_at ON leads (created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS leads_score ON leads (score)")
+        self._db.commit()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _where(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        conditions = []
+        params = []
+        for name, value in filters.items():
+            if value is None:
+                continue
+            if name not in FILTERS:
+                raise ValueError(f"Неизвестный фильтр заявок: {name}")
+            conditions.append(FILTERS[name])
+            params.append(value)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def _insert(self, row: Tuple) -> int:
+        placeholders = ", ".join("?" * len(row))
+        with self._db:
+            cursor = self._db.execute(
+                f"INSERT INTO leads (created_at, user_id, username, {', '.join(LEAD_FIELDS)}, score) VALUES ({placeholders})",
+                row,
+            )
+        return cursor.lastrowid
+
+    def _select(self, filters: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        where, params = self._where(filters)
+        # При фильтре по дате сортируем по created_at (растёт вместе с id), чтобы SQLite
+        # читал индекс по дате с нужного места, а не перебирал таблицу с конца
+        if filters.get("date_from") is not None or filters.get("date_to") is not None:
+            order = "created_at DESC, id DESC"
+        else:
+            order = "id DESC"
+        rows = self._db.execute(f"SELECT * FROM leads{where} ORDER BY {order} LIMIT ?", (*params, limit))
+        return [dict(row) for row in rows]
+
+    def _find_recent(self, phone: Optional[str], user_id: int, since: int) -> Optional[int]:
+        # Два поиска по индексам (телефон и пользователь) вместо OR, который SQLite
+        # может выполнить перебором таблицы
+        return self._db.execute(
+            "SELECT MAX(id) FROM ("
+            "SELECT id FROM leads WHERE phone = ? AND COALESCE(updated_at, created_at) >= ? "
+            "UNION ALL "
+            "SELECT id FROM leads WHERE user_id = ? AND COALESCE(updated_at, created_at) >= ?)",
+            (phone, since, user_id, since),
+        ).fetchone()[0]
+
+    def _merge(self, lead_id: int, row: Tuple):
+        assignments = ", ".join(f"{field} = ?" for field in LEAD_FIELDS)
+        with self._db:
+            self._db.execute(
+                f"UPDATE leads SET updated_at = ?, username = COALESCE(?, username), {assignments}, "
+                "score = ?, submissions = submissions + 1 WHERE id = ?",
+                (*row, lead_id),
+            )
+
+    def _recent_keys(self, since: int, after: int, limit: int) -> List[Tuple[int, Optional[str], int]]:
+        return self._db.execute(
+            "SELECT id, phone, user_id FROM leads WHERE id > ? AND COALESCE(updated_at, created_at) >= ? "
+            "ORDER BY id LIMIT ?",
+            (after, since, limit),
+        ).fetchall()
+
+    def _count_recent(self, since: int) -> int:
+        return self._db.execute(
+            "SELECT COUNT(*) FROM leads WHERE COALESCE(updated_at, created_at) >= ?", (since,)
+        ).fetchone()[0]
+
+    def _count(self, filters: Dict[str, Any]) -> int:
+        where, params = self._where(filters)
+        return self._db.execute(f"SELECT COUNT(*) FROM leads{where}", params).fetchone()[0]
+
+    # Сохранение подтверждённой заявки с оценкой (см. scoring.py); возвращает её номер
+    async def add(self, data: Dict[str, Any], user_id: int, username: Optional[str] = None,
+                  created_at: Optional[int] = None, score: Optional[int] = None) -> int:
+        row = (
+            int(created_at if created_at is not None else time.time()),
+            user_id,
+            username,
+            *(data.get(field) for field in LEAD_FIELDS),
+            score,
+        )
+        return await self._run(self._insert, row)
+
+    # Последняя заявка того же телефона или пользователя, отправленная не раньше since
+    async def find_recent(self, phone: Optional[str], user_id: int, since: int) -> Optional[int]:
+        return await self._run(self._find_recent, phone, user_id, since)
+
+    # Повторная отправка: ответы и оценка заменяются новыми, счётчик отправок растёт
+    async def merge(self, lead_id: int, data: Dict[str, Any], username: Optional[str] = None,
+                    updated_at: Optional[int] = None, score: Optional[int] = None):
+        row = (
+            int(updated_at if updated_at is not None else time.time()),
+            username,
+            *(data.get(field) for field in LEAD_FIELDS),
+            score,
+        )
+        await self._run(self._merge, lead_id, row)
+
+    # (телефон, пользователь) заявок, отправленных не раньше since, пачками по batch_size
+    async def recent_keys(self, since: int, batch_size: int = 5000) -> AsyncIterator[List[Tuple[Optional[str], int]]]:
+        after = 0
+        while True:
+            rows = await self._run(self._recent_keys, since, after, batch_size)
+            if not rows:
+                return
+            after = rows[-1][0]
+            yield [(phone, user_id) for _, phone, user_id in rows]
+
+    async def count_recent(self, since: int) -> int:
+        return await self._run(self._count_recent, since)
+
+    def _update_scores(self, expression: str, params: List[Any], after: int, batch_size: int) -> int:
+        with self._db:
+            return self._db.execute(
+                f"UPDATE leads SET score = {expression} WHERE id > ? AND id <= ?", (*params, after, after + batch_size)
+            ).rowcount
+
+    # Пересчёт оценок всего архива выражением SQL (см. scoring.LeadScorer.sql) пачками по
+    # диапазону id. Каждая пачка — отдельная задача потока LeadStore, поэтому новые заявки
+    # ждут не дольше одной пачки. Возвращает число обновлённых заявок
+    async def update_scores(self, expression: str, params: List[Any], batch_size: int) -> int:
+        last = await self._run(lambda: self._db.execute("SELECT COALESCE(MAX(id), 0) FROM leads").fetchone()[0])
+        total = 0
+        for after in range(0, last, batch_size):
+            total += await self._run(self._update_scores, expression, params, after, batch_size)
+        return total
+
+    # Сообщение о заявке в чате администратора
+    async def admin_message(self, lead_id: int, chat_id: int) -> Optional[int]:
+        def select():
+            row = self._db.execute(
+                "SELECT message_id FROM lead_messages WHERE lead_id = ? AND chat_id = ?", (lead_id, chat_id)
+            ).fetchone()
+            return row[0] if row else None
+
+        return await self._run(select)
+
+    async def save_admin_message(self, lead_id: int, chat_id: int, message_id: int):
+        def save():
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO lead_messages (lead_id, chat_id, message_id) VALUES (?, ?, ?)",
+                    (lead_id, chat_id, message_id),
+                )
+
+        await self._run(save)
+
+    # Поиск заявок (новые сначала). Для следующей страницы передайте before=id последней заявки.
+    async def search(self, limit: int = 20, **filters: Any) -> List[Dict[str, Any]]:
+        return await self._run(self._select, filters, limit)
+
+    # Количество заявок по тем же фильтрам
+    async def count(self, **filters: Any) -> int:
+        filters.pop("before", None)
+        return await self._run(self._count, filters)
+
+    async def close(self):
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
+
+
+# Столбцы выгрузки заявок
+EXPORT_COLUMNS = ("id", "created_at", "updated_at", "submissions", "score", "user_id", "username", *LEAD_FIELDS)
+
+
+# Заявки по фильтрам в порядке поступления, пачками по batch_size, для выгрузки.
+# Синхронный генератор со своим соединением только для чтения: выгрузку можно вести в
+# отдельном потоке, не занимая поток LeadStore, через который сохраняются новые заявки.
+# Каждая пачка — отдельный запрос по ключу (id или (created_at, id) больше последнего),
+# так что память не зависит от числа заявок, а чтение не держит открытой транзакцию
+# и не мешает контрольным точкам WAL.
+def iter_leads(path: str = LEADS_PATH, batch_size: int = 5000, **filters: Any) -> Iterator[List[Tuple]]:
+    filters.pop("before", None)
+    date_from = filters.pop("date_from", None)
+    where, params = LeadStore._where(filters)
+    # При фильтре по дате SQLite идёт по индексу created_at, без него — по id или индексу
+    # фильтра. Начало периода — начальное значение ключа, а не отдельное условие: иначе
+    # SQLite начинает каждую пачку с начала периода, а не с последней выгруженной заявки
+    if date_from is not None or filters.get("date_to") is not None:
+        key, order, last = "(created_at, id) > (?, ?)", "created_at, id", (date_from if date_from is not None else -1, -1)
+    else:
+        key, order, last = "id > ?", "id", (-1,)
+    query = (
+        f"SELECT {', '.join(EXPORT_COLUMNS)} FROM leads{where}{' AND ' if where else ' WHERE '}{key} "
+        f"ORDER BY {order} LIMIT ?"
+    )
+
+    # Генератор может закрыть сборщик мусора в другом потоке
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        while True:
+            rows = db.execute(query, (*params, *last, batch_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            last = (rows[-1][1], rows[-1][0]) if len(last) == 2 else (rows[-1][0],)
+    finally:
+        db.close()
@@ -0,0 +1,155 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, TextIO, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from config import LOG_BACKUPS, LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_MAX_BYTES, LOG_QUEUE_SIZE, LOG_SAMPLE
+from metrics import LOG_RECORDS
+
+# Обновление, которое обрабатывается в текущей задаче: (update_id, user_id, состояние анкеты)
+_update: ContextVar[Optional[Tuple[int, Optional[int], Optional[str]]]] = ContextVar("update", default=None)
+# Поля контекста обновления в записи журнала
+CONTEXT_FIELDS = ("update_id", "user_id", "state")
+
+
+# Middleware обновлений: запоминает номер обновления, пользователя и состояние анкеты
+# для всех записей журнала, сделанных во время его обработки. Значение не сбрасывается:
+# aiogram пишет «is handled» и ошибку обработчика уже после выхода из middleware, а
+# каждое обновление (polling и webhook) обрабатывается в своей задаче со своим контекстом
+class LogContextMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if isinstance(event, Update):
+            user = data.get("event_from_user")
+            _update.set((event.update_id, user.id if user is not None else None, data.get("raw_state")))
+        return await handler(event, data)
+
+
+# Фильтр записей в потоке event loop (до очереди): INFO-записи частых логгеров проходят
+# с долей из sample (предупреждения и ошибки — всегда), прошедшим добавляется контекст
+# обновления. Доля записывается в запись, чтобы по выборке можно было оценить общее число
+class UpdateContextFilter(logging.Filter):
+    def __init__(self, sample: Mapping[str, float] = LOG_SAMPLE):
+        super().__init__()
+        self.sample = dict(sample)
+        # Логгер -> доля (с учётом родительских логгеров), считается один раз на логгер
+        self._shares: Dict[str, float] = {}
+
+    def _share(self, name: str) -> float:
+        share = self._shares.get(name)
+        if share is None:
+            matches = [prefix for prefix in self.sample if name == prefix or name.startswith(prefix + ".")]
+            share = self._shares[name] = self.sample[max(matches, key=len)] if matches else 1.0
+        return share
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        share = self._share(record.name) if record.levelno < logging.WARNING else 1.0
+        if share < 1.0 and random.random() >= share:
+            LOG_RECORDS.inc("sampled")
+            return False
+        record.sample = share
+        record.update_id, record.user_id, record.state = _update.get() or (None, None, None)
+        return True
+
+
+# Обработчик корневого логгера: только кладёт запись в очередь. Форматирование (в том
+# числе трассировок), сериализация и запись в stderr и файл идут в потоке QueueListener
+# и не задерживают event loop, даже если stderr читают медленно. Очередь — SimpleQueue
+# (на C, без блокировки и условной переменной на каждую запись), её размер ограничен
+# max_size записей (0 — без ограничения)
+class LoopQueueHandler(QueueHandler):
+    def __init__(self, records: queue.SimpleQueue, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(records)
+        self.max_size = max_size
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Текст собирается сразу: аргументы могут измениться, пока запись ждёт в очереди
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.max_size and self.queue.qsize() >= self.max_size:
+            LOG_RECORDS.inc("dropped")
+            return
+        self.queue.put_nowait(record)
+
+
+# Запись журнала одним JSON-объектом на строку (время в UTC)
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if getattr(record, "sample", 1.0) < 1.0:
+            entry["sample"] = record.sample
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Запись журнала для чтения глазами (LOG_FORMAT=text): контекст обновления в скобках
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        if getattr(record, "update_id", None) is not None:
+            text += f" [update={record.update_id} user={record.user_id} state={record.state}]"
+        return text
+
+
+# Настройка журнала процесса вместо logging.basicConfig: корневой логгер пишет в очередь,
+# поток QueueListener — в stderr и (если задан path) в файл с ротацией по размеру.
+# Поток останавливается при выходе из процесса, дописав очередь
+def setup_logging(
+    level: str = LOG_LEVEL,
+    fmt: str = LOG_FORMAT,
+    path: str = LOG_FILE,
+    stream: Optional[TextIO] = None,
+    queue_size: int = LOG_QUEUE_SIZE,
+) -> QueueListener:
+    formatter = JsonFormatter() if fmt == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(stream or sys.stderr)]
+    if path:
+        handlers.append(RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = LoopQueueHandler(records, queue_size)
+    handler.addFilter(UpdateContextFilter())
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
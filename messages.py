@@ -0,0 +1,167 @@
+import itertools
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from html import escape
+from typing import Any, Dict, Optional, Tuple
+
+from config import RENDER_CACHE_SIZE
+
+NOT_SPECIFIED = "Не указано"
+
+# Ключ версии данных анкеты в FSM: меняется при каждом сохранённом ответе
+DATA_VERSION = "version"
+
+# Разделы сводки по анкете: заголовок -> (поле, подпись)
+SECTIONS = (
+    ("Блок 1. Жилищная ситуация", (
+        ("name", "👤 Имя"),
+        ("residence", "🏠 Текущее жилье"),
+        ("satisfaction", "😊 Довольны условиями"),
+        ("property_type", "🏢 Тип недвижимости"),
+        ("location", "📍 Желаемое расположение"),
+        ("budget", "💰 Бюджет"),
+        ("search_status", "🔍 Статус поиска"),
+    )),
+    ("Блок 2. Готовность к покупке", (
+        ("mortgage", "🏦 Ипотека"),
+        ("purchase_time", "⏱ Планируемое время покупки"),
+    )),
+    ("Блок 3. Контактные данные", (
+        ("contact_method", "📞 Предпочтительный способ связи"),
+        ("contact_time", "📅 Удобное время для связи"),
+        ("phone", "📱 Телефон"),
+    )),
+)
+# Постоянная приставка перед значением поля
+PREFIXES = {"phone": "+"}
+
+CONFIRM_HEADER = "📋 <b>Проверьте введенные данные:</b>\n\n"
+CONFIRM_FOOTER = "\nВсё верно?"
+# Экран подтверждения после отправки: сводка остаётся, вместо вопроса — благодарность
+SUBMITTED_HEADER = "📋 <b>Ваша заявка:</b>\n\n"
+SUBMITTED_FOOTER = (
+    "\n✅ Спасибо! Ваша заявка {}.\n\n"
+    "Наш специалист свяжется с вами в ближайшее время для уточнения деталей и подбора оптимальных вариантов недвижимости.\n\n"
+    "Если у вас возникнут дополнительные вопросы, вы можете задать их, отправив новое сообщение."
+)
+ADMIN_HEADER = "📨 <b>Новая заявка на подбор недвижимости</b>\n\n<b>Дата и время:</b> {}\n\n"
+ADMIN_UPDATED_HEADER = "🔄 <b>Заявка обновлена (повторная отправка)</b>\n\n<b>Дата и время:</b> {}\n\n"
+ADMIN_FOOTER = "🔗 Telegram: @{}\n"
+# Оценка заявки (scoring.py) после даты; горячая заявка отмечается отдельно
+ADMIN_SCORE = "<b>Оценка:</b> {} из 100\n\n"
+ADMIN_HOT_SCORE = "🔥 <b>Горячая заявка</b> — оценка {} из 100\n\n"
+SOS_TEMPLATE = (
+    "🆘 <b>SOS запрос!</b>\n\n"
+    "От: {}\n"
+    "📱 Телефон: {}\n"
+    "🆔 ID пользователя: {}\n"
+    "⏰ Время запроса: {}"
+)
+
+# Напоминания о незаконченной анкете: перед вопросом текущего шага и перед сводкой
+REMINDER_STEP = "👋 Вы не закончили анкету — осталось совсем немного. Продолжим?\n\n{}"
+REMINDER_CONFIRM = "👋 Ваша заявка почти готова — осталось только подтвердить данные.\n\n{}"
+
+_versions = itertools.count(time.time_ns())
+
+
+# Новая версия данных анкеты (растёт и между перезапусками, т.к. начинается с текущего времени)
+def new_version() -> int:
+    return next(_versions)
+
+
+# Сборка шаблона сводки один раз: статичный текст из SECTIONS превращается в строку
+# формата с позиционными полями {} (фигурные скобки в подписях экранируются) и порядок полей для неё
+def _compile(sections) -> Tuple[str, Tuple[str, ...]]:
+    blocks = []
+    fields = []
+    for title, items in sections:
+        lines = [f"<b>{title}</b>\n"]
+        for field, label in items:
+            lines.append(f"{label}: {PREFIXES.get(field, '')}".replace("{", "{{").replace("}", "}}") + "{}\n")
+            fields.append(field)
+        blocks.append("".join(lines))
+    return "\n".join(blocks), tuple(fields)
+
+
+SUMMARY_TEMPLATE, SUMMARY_FIELDS = _compile(SECTIONS)
+
+
+# Экранирование для parse_mode="HTML". Ответы в основном — варианты с кнопок,
+# поэтому результат для повторяющихся строк берётся из кэша.
+_escape = lru_cache(maxsize=4096)(escape)
+
+
+# Значение для HTML-сообщения: всё, что ввёл пользователь, экранируется
+def _value(data: Dict[str, Any], field: str) -> str:
+    value = data.get(field)
+    if value is None or value == "":
+        return NOT_SPECIFIED
+    return _escape(str(value))
+
+
+def _render_summary(data: Dict[str, Any]) -> str:
+    get = data.get
+    return SUMMARY_TEMPLATE.format(*[_escape(str(get(field) or NOT_SPECIFIED)) for field in SUMMARY_FIELDS])
+
+
+# Сообщения по данным анкеты: подтверждение для пользователя, заявка и SOS для администраторов.
+# Сводка по анкете кэшируется по (чат, версия данных), поэтому повторный показ
+# подтверждения после «Изменить»/«Назад» без новых ответов не пересобирает текст.
+class SummaryRenderer:
+    def __init__(self, cache_size: int = RENDER_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+
+    # Сводка по разделам анкеты (общая часть подтверждения и заявки)
+    def summary(self, chat_id: Optional[int], data: Dict[str, Any]) -> str:
+        version = data.get(DATA_VERSION)
+        if not self.cache_size or chat_id is None or version is None:
+            return _render_summary(data)
+
+        key = (chat_id, version)
+        text = self._cache.get(key)
+        if text is not None:
+            self._cache.move_to_end(key)
+            return text
+        text = self._cache[key] = _render_summary(data)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return text
+
+    # Экран подтверждения для пользователя
+    def confirmation(self, chat_id: Optional[int], data: Dict[str, Any]) -> str:
+        return CONFIRM_HEADER + self.summary(chat_id, data) + CONFIRM_FOOTER
+
+    # Экран подтверждения после отправки заявки; updated=True — заявка объединена с прежней
+    def submitted(self, chat_id: Optional[int], data: Dict[str, Any], updated: bool = False) -> str:
+        return (
+            SUBMITTED_HEADER + self.summary(chat_id, data)
+            + SUBMITTED_FOOTER.format("обновлена" if updated else "успешно отправлена")
+        )
+
+    # Заявка для администраторов; updated=True — повторная отправка, которая заменяет прежнюю,
+    # score — оценка заявки, hot — горячая ли она
+    def admin(self, chat_id: Optional[int], data: Dict[str, Any], username: Optional[str],
+              created_at: Optional[datetime] = None, updated: bool = False,
+              score: Optional[int] = None, hot: bool = False) -> str:
+        created_at = created_at or datetime.now()
+        return (
+            (ADMIN_UPDATED_HEADER if updated else ADMIN_HEADER).format(created_at.strftime("%d.%m.%Y %H:%M"))
+            + ("" if score is None else (ADMIN_HOT_SCORE if hot else ADMIN_SCORE).format(score))
+            + self.summary(chat_id, data)
+            + ADMIN_FOOTER.format(_escape(username) if username else "Отсутствует")
+        )
+
+    # Срочный запрос для администраторов (анкета может быть заполнена не до конца)
+    def sos(self, user_id: int, data: Dict[str, Any], created_at: Optional[datetime] = None) -> str:
+        created_at = created_at or datetime.now()
+        phone = data.get("phone")
+        return SOS_TEMPLATE.format(
+            _value(data, "name"),
+            f"+{_escape(phone)}" if phone else NOT_SPECIFIED,
+            user_id,
+            created_at.strftime("%d.%m.%Y %H:%M"),
+        )
@@ -0,0 +1,257 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.storage.base import StateType, StorageKey
+from aiogram.types import TelegramObject, Update
+from aiogram.types.update import UpdateTypeLookupError
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+from storage import StorageProxy
+
+# Границы корзин гистограмм задержки, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Границы корзин времени доставки из очереди outbox, секунды (с учётом повторов)
+DELIVERY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+# Все метрики процесса в порядке объявления
+REGISTRY: List["_Metric"] = []
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+# Счётчик в формате Prometheus: значения по наборам меток
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+# Гистограмма в формате Prometheus. В памяти хранятся некумулятивные счётчики корзин,
+# поэтому запись — это один bisect и два сложения; суммы по корзинам считаются при выдаче.
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики корзин (последняя — +Inf), сумма]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels((*self.labelnames, 'le'), (*labels, le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+UPDATES = Counter("bot_updates_total", "Полученные обновления по типу", ("type",))
+UPDATE_LATENCY = Histogram("bot_update_duration_seconds", "Время обработки обновления", ("type",))
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Время работы обработчика", ("handler",))
+STATE_LATENCY = Histogram("bot_state_duration_seconds", "Время обработки по состоянию анкеты", ("state",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler", "error"))
+API_LATENCY = Histogram("bot_api_request_duration_seconds", "Время запроса к Bot API", ("method",))
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "error"))
+STORAGE_LATENCY = Histogram("bot_storage_duration_seconds", "Время операции хранилища FSM", ("operation",))
+STATE_ENTERED = Counter("bot_funnel_state_entered_total", "Сколько раз пользователи переходили в состояние анкеты", ("state",))
+LEADS_CONFIRMED = Counter("bot_leads_confirmed_total", "Подтверждённые заявки")
+LEADS_MERGED = Counter("bot_leads_merged_total", "Повторные заявки, объединённые с прежними")
+LEADS_HOT = Counter("bot_leads_hot_total", "Горячие заявки (оценка не ниже LEAD_HOT_SCORE)")
+ADMIN_NOTIFICATIONS = Counter("bot_admin_notifications_total", "Отправка сообщений администраторам", ("result",))
+OUTBOX_DELIVERY = Histogram("bot_outbox_delivery_seconds", "Время от постановки сообщения в очередь outbox до доставки", ("queue",), buckets=DELIVERY_BUCKETS)
+BROADCAST_MESSAGES = Counter("bot_broadcast_messages_total", "Сообщения рассылки /broadcast по результату", ("result",))
+REMINDERS = Counter("bot_reminders_total", "Напоминания о незаконченной анкете", ("result",))
+FLOOD_DROPPED = Counter("bot_flood_dropped_total", "Обновления, отброшенные защитой от флуда", ("reason",))
+LOG_RECORDS = Counter("bot_log_records_total", "Записи журнала, не попавшие в запись: отброшенные выборкой или при переполнении очереди", ("result",))
+CLUSTER_FORWARDED = Counter("bot_cluster_forwarded_total", "Обновления, переданные рабочим процессам", ("worker",))
+CLUSTER_RESTARTS = Counter("bot_cluster_worker_restarts_total", "Перезапуски упавших рабочих процессов", ("worker",))
+
+
+# Текст для /metrics (формат Prometheus text exposition 0.0.4)
+def render_metrics() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def _update_type(update: Update) -> str:
+    try:
+        return update.event_type
+    except UpdateTypeLookupError:
+        return "unknown"
+
+
+# Middleware метрик. На dp.update считает обновления по типу и общее время обработки,
+# на наблюдателях событий (message, callback_query) — время каждого обработчика
+# и время обработки в каждом состоянии анкеты.
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        if isinstance(event, Update):
+            update_type = _update_type(event)
+            UPDATES.inc(update_type)
+            try:
+                return await handler(event, data)
+            finally:
+                UPDATE_LATENCY.observe(time.perf_counter() - started, update_type)
+
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_LATENCY.observe(elapsed, name)
+            STATE_LATENCY.observe(elapsed, data.get("raw_state") or "none")
+
+
+# Middleware сессии Bot API: задержка и ошибки каждого метода
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot: Bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, name)
+
+
+# Обёртка хранилища FSM: задержка операций и переходы по состояниям анкеты (воронка)
+class InstrumentedStorage(StorageProxy):
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        started = time.perf_counter()
+        await self.storage.set_state(key, state)
+        STORAGE_LATENCY.observe(time.perf_counter() - started, "set_state")
+        if state is not None:
+            STATE_ENTERED.inc(state.state if hasattr(state, "state") else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        started = time.perf_counter()
+        state = await self.storage.get_state(key)
+        STORAGE_LATENCY.observe(time.perf_counter() - started, "get_state")
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        await self.storage.set_data(key, data)
+        STORAGE_LATENCY.observe(time.perf_counter() - started, "set_data")
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        started = time.perf_counter()
+        data = await self.storage.get_data(key)
+        STORAGE_LATENCY.observe(time.perf_counter() - started, "get_data")
+        return data
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = await self.storage.update_data(key, data)
+        STORAGE_LATENCY.observe(time.perf_counter() - started, "update_data")
+        return result
+
+
+# Подключение метрик к диспетчеру и сессии бота
+def instrument(dispatcher: Dispatcher, bot: Bot):
+    middleware = MetricsMiddleware()
+    dispatcher.update.outer_middleware(middleware)
+    dispatcher.message.middleware(middleware)
+    dispatcher.callback_query.middleware(middleware)
+    bot.session.middleware(ApiMetricsMiddleware())
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render_metrics().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+# HTTP-сервер с /metrics на отдельном порту (не проксируется nginx наружу).
+# Возвращает runner для остановки или None, если METRICS_PORT=0.
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
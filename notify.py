@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from config import NOTIFY_GLOBAL_RATE, NOTIFY_MAX_ATTEMPTS, NOTIFY_PER_CHAT_RATE
+from metrics import ADMIN_NOTIFICATIONS
+
+
+# Ограничитель частоты «ведро с токенами»: rate токенов в секунду, не больше capacity в запасе.
+# Срочные запросы (urgent) получают токен раньше обычных: обычные ждут по очереди и
+# пропускают вперёд, пока ждёт хотя бы один срочный
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._urgent = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Попытка взять токен без ожидания
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    # Ожидание, пока в ведре появится токен
+    async def acquire(self, urgent: bool = False):
+        if urgent:
+            self._urgent += 1
+            try:
+                while not self.try_acquire():
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+            finally:
+                self._urgent -= 1
+            return
+        async with self._lock:
+            while self._urgent or not self.try_acquire():
+                await asyncio.sleep((1 if self._urgent else 1 - self.tokens) / self.rate)
+
+    # Не выдавать токены seconds секунд (например, после RetryAfter от Telegram). Паузы не
+    # складываются: одновременные 429 с тем же retry_after останавливают ведро один раз
+    def pause(self, seconds: float):
+        self._refill()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+# Сообщения в чатах администраторов (заявки и SOS из очередей outbox, отчёты о рассылках)
+# с общим лимитом Telegram (~30 сообщений в секунду на бота) и лимитом на один чат
+# (~1 сообщение в секунду), с повтором при RetryAfter.
+class AdminNotifier:
+    def __init__(
+        self,
+        bot: Bot,
+        global_rate: float = NOTIFY_GLOBAL_RATE,
+        per_chat_rate: float = NOTIFY_PER_CHAT_RATE,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+    ):
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.per_chat_rate = per_chat_rate
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        return bucket
+
+    # Вызов метода Bot API в чате администратора с учётом лимитов и повторами;
+    # возвращает результат метода или None, если вызвать его не удалось.
+    # urgent=True (SOS) — токены лимитов выдаются раньше обычных уведомлений и напоминаний.
+    # retry=False — одна попытка: временная ошибка (RetryAfter, сеть, 5xx) пробрасывается
+    # вызывающему, чтобы очередь outbox повторила отправку со своей задержкой и не держала
+    # остальную пачку, пока этот вызов ждёт
+    async def _call(self, chat_id: int, method: Callable[..., Awaitable[Any]], result: str,
+                    urgent: bool = False, retry: bool = True, **kwargs) -> Any:
+        chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(1, self.max_attempts + 1):
+            await chat_bucket.acquire(urgent)
+            await self.global_bucket.acquire(urgent)
+            try:
+                response = await method(chat_id=chat_id, **kwargs)
+                ADMIN_NOTIFICATIONS.inc(result)
+                return response
+            except TelegramRetryAfter as e:
+                logging.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой в чат {chat_id}")
+                # Ожидание может относиться ко всему боту: остальные чаты тоже ждут
+                chat_bucket.pause(e.retry_after)
+                self.global_bucket.pause(e.retry_after)
+                if not retry:
+                    raise
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if not retry:
+                    raise
+                delay = min(2 ** attempt, 30)
+                logging.warning(f"Ошибка сети при отправке в чат {chat_id}, повтор через {delay} с: {e}")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logging.error(f"Ошибка при отправке сообщения администратору {chat_id}: {e}")
+                ADMIN_NOTIFICATIONS.inc("failed")
+                return None
+        logging.error(f"Не удалось отправить сообщение администратору {chat_id} после {self.max_attempts} попыток")
+        ADMIN_NOTIFICATIONS.inc("failed")
+        return None
+
+    # Отправка одного сообщения; возвращает его id или None
+    async def send_message(self, chat_id: int, text: str, urgent: bool = False, retry: bool = True,
+                           **kwargs) -> Optional[int]:
+        message = await self._call(chat_id, self.bot.send_message, "sent", urgent, retry, text=text, **kwargs)
+        return message.message_id if message is not None else None
+
+    async def send(self, chat_id: int, text: str, **kwargs) -> bool:
+        return await self.send_message(chat_id, text, **kwargs) is not None
+
+    async def _edit_text(self, **kwargs) -> bool:
+        try:
+            await self.bot.edit_message_text(**kwargs)
+        except TelegramBadRequest as e:
+            # Текст не изменился — сообщение и так актуально
+            if "message is not modified" not in e.message:
+                raise
+        return True
+
+    # Замена текста уже отправленного сообщения; False, если его нельзя отредактировать
+    # (удалено администратором, слишком старое)
+    async def edit(self, chat_id: int, message_id: int, text: str, retry: bool = True, **kwargs) -> bool:
+        return await self._call(
+            chat_id, self._edit_text, "edited", retry=retry, message_id=message_id, text=text, **kwargs
+        ) is not None
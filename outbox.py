@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Deque, Iterable, List, Optional, Tuple
+
+from config import OUTBOX_BASE_DELAY, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_MAX_DELAY, OUTBOX_PATH
+from metrics import OUTBOX_DELIVERY
+
+# Функция доставки: (chat_id, текст, номер заявки или None) -> удалось ли отправить
+Sender = Callable[[int, str, Optional[int]], Awaitable[bool]]
+
+
+# Надёжная очередь исходящих сообщений (outbox) в SQLite.
+# Заявка сохраняется на диск до ответа пользователю; фоновый обработчик
+# отправляет сообщения с повторами и экспоненциальной задержкой, после
+# max_attempts неудачных попыток сообщение помечается как «мёртвое» (dead).
+# Неотправленные сообщения переживают перезапуск и досылаются при старте.
+# name — имя очереди в метрике времени доставки (bot_outbox_delivery_seconds).
+# Сообщения с большим priority (горячие заявки) отправляются раньше остальных готовых.
+class Outbox:
+    def __init__(
+        self,
+        send: Sender,
+        path: str = OUTBOX_PATH,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        base_delay: float = OUTBOX_BASE_DELAY,
+        max_delay: float = OUTBOX_MAX_DELAY,
+        name: str = "leads",
+    ):
+        self.send = send
+        self.name = name
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "chat_id INTEGER NOT NULL, "
+            "text TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, "
+            "dead INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL)"
+        )
+        # Сообщения о заявке: новое заменяет ещё не отправленное прежнее
+        if "lead_id" not in {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN lead_id INTEGER")
+        if "priority" not in {row[1] for row in self._db.execute("PRAGMA table_info(outbox)")}:
+            self._db.execute("ALTER TABLE outbox ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (dead, next_attempt_at)")
+        # Выборка готовых сообщений идёт по индексу в порядке отправки, без сортировки накопившейся очереди
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_ready ON outbox (dead, priority DESC, next_attempt_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_lead ON outbox (lead_id, chat_id)")
+        self._db.commit()
+
+        # Заявки, ожидающие записи на диск: группируются в транзакции до batch_size сообщений
+        self._waiting: Deque[Tuple[List[Tuple[int, str, Optional[int], int, float, float]], asyncio.Future]] = deque()
+        self._commit_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _insert(self, rows):
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM outbox WHERE lead_id = ? AND chat_id = ? AND dead = 0",
+                [(lead_id, chat_id) for chat_id, _, lead_id, _, _, _ in rows if lead_id is not None],
+            )
+            self._db.executemany(
+                "INSERT INTO outbox (chat_id, text, lead_id, priority, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    # Без INDEXED BY SQLite выбирает outbox_due и сортирует все готовые сообщения:
+    # при очереди в 300 000 сообщений это 127 мс на пачку против 0,2 мс по outbox_ready
+    def _fetch_due(self, now: float):
+        return self._db.execute(
+            "SELECT id, chat_id, text, lead_id, attempts, created_at FROM outbox INDEXED BY outbox_ready "
+            "WHERE dead = 0 AND next_attempt_at <= ? ORDER BY priority DESC, next_attempt_at LIMIT ?",
+            (now, self.batch_size),
+        ).fetchall()
+
+    def _next_due(self) -> Optional[float]:
+        return self._db.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE dead = 0").fetchone()[0]
+
+    def _save_results(self, sent, retry, dead):
+        with self._db:
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", sent)
+            self._db.executemany("UPDATE outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?", retry)
+            self._db.executemany("UPDATE outbox SET attempts = ?, dead = 1 WHERE id = ?", dead)
+
+    # Сохранение сообщения для каждого получателя; возвращается после записи на диск.
+    # Одновременные вызовы объединяются в транзакции до batch_size сообщений (group commit).
+    # lead_id — номер заявки: ещё не отправленное сообщение о ней в том же чате заменяется новым.
+    # delay — через сколько секунд сообщение можно отправлять.
+    async def enqueue(self, chat_ids: Iterable[int], text: str, lead_id: Optional[int] = None,
+                      priority: int = 0, delay: float = 0):
+        now = time.time()
+        rows = [(chat_id, text, lead_id, priority, now + delay, now) for chat_id in chat_ids]
+        if not rows:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((rows, future))
+        if self._commit_task is None or self._commit_task.done():
+            self._commit_task = asyncio.create_task(self._commit_waiting())
+        await future
+
+    # Запись ожидающих вызовов частями: при всплеске в тысячи заявок каждая транзакция и
+    # разбор её результатов занимают event loop ненадолго, а между частями, пока поток
+    # пишет следующую, обрабатываются другие обновления. Сообщения одного вызова не делятся
+    async def _commit_waiting(self):
+        waiting = self._waiting
+        while waiting:
+            rows, futures = [], []
+            while waiting and (not rows or len(rows) + len(waiting[0][0]) <= self.batch_size):
+                call_rows, future = waiting.popleft()
+                rows.extend(call_rows)
+                futures.append(future)
+            try:
+                await self._run(self._insert, rows)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for future in futures:
+                if not future.done():
+                    future.set_result(None)
+            self._wakeup.set()
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+
+    async def _deliver(self, row):
+        outbox_id, chat_id, text, lead_id, attempts, created_at = row
+        try:
+            delivered = await self.send(chat_id, text, lead_id)
+        except Exception as e:
+            logging.error(f"Ошибка при доставке сообщения {outbox_id} в чат {chat_id}: {e}")
+            delivered = False
+        if delivered:
+            OUTBOX_DELIVERY.observe(time.time() - created_at, self.name)
+        return outbox_id, attempts + 1, delivered
+
+    # Отправка одной пачки готовых к доставке сообщений; возвращает их количество
+    async def drain_once(self) -> int:
+        rows = await self._run(self._fetch_due, time.time())
+        if not rows:
+            return 0
+        results = await asyncio.gather(*(self._deliver(row) for row in rows))
+
+        now = time.time()
+        sent, retry, dead = [], [], []
+        for outbox_id, attempts, delivered in results:
+            if delivered:
+                sent.append((outbox_id,))
+            elif attempts >= self.max_attempts:
+                logging.error(f"Сообщение {outbox_id} не доставлено после {attempts} попыток и перенесено в dead")
+                dead.append((attempts, outbox_id))
+            else:
+                retry.append((attempts, now + self._backoff(attempts), outbox_id))
+        await self._run(self._save_results, sent, retry, dead)
+        return len(rows)
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.drain_once():
+                    continue
+                if self._closing:
+                    return
+                next_due = await self._run(self._next_due)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика очереди outbox: {e}")
+                if self._closing:
+                    return
+                next_due = time.time() + self.base_delay
+            timeout = None if next_due is None else max(next_due - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # Запуск фонового обработчика (досылает и то, что осталось с прошлого запуска)
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._work())
+
+    # Количество неотправленных и «мёртвых» сообщений
+    async def stats(self) -> Tuple[int, int]:
+        def count():
+            pending, dead = self._db.execute(
+                "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM outbox"
+            ).fetchone()
+            return pending, dead
+
+        return await self._run(count)
+
+    # Остановка. Обработчик досылает всё, что уже пора отправить, не дольше timeout секунд,
+    # и только потом отменяется: сообщения, отправленные в прерванной пачке, не успевают
+    # отметиться и будут отправлены повторно после перезапуска
+    async def close(self, timeout: float = 0):
+        if self._commit_task is not None:
+            await self._commit_task
+        if self._worker is not None:
+            self._closing = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._worker), timeout)
+            except asyncio.TimeoutError:
+                self._worker.cancel()
+                await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,54 @@
+from functools import lru_cache
+from typing import Optional
+
+from config import PHONE_CACHE_SIZE
+
+# Разделители, которые допускаются между цифрами номера. Номер разбирается
+# как bytes: bytes.translate с удалением символов в разы быстрее str.translate
+SEPARATORS = " -.()\t"
+_SEPARATORS = SEPARATORS.encode()
+
+# Первая цифра национального номера в зоне +7: 3, 4, 8, 9 — Россия, 6, 7 — Казахстан.
+# Номеров на 0, 1, 2 и 5 в этой зоне не бывает.
+NATIONAL_FIRST_DIGITS = frozenset("346789")
+_FIRST_DIGIT_CODES = frozenset(map(ord, NATIONAL_FIRST_DIGITS))
+NATIONAL_LENGTH = 10
+# Длина номера E.164 с кодом страны (для контактов из других стран)
+E164_MIN_LENGTH = 8
+E164_MAX_LENGTH = 15
+_SEVEN, _EIGHT, _ZERO = ord("7"), ord("8"), ord("0")
+
+
+# Нормализация телефона за один проход. Возвращает номер в формате E.164 без «+»
+# (так он хранится в анкете и архиве заявок) или None, если номер невозможен.
+#
+# Принимаются номера зоны +7 в любом привычном написании: «+7 999 123-45-67»,
+# «8 (999) 123 45 67», «9991234567». international=True (контакт, которым поделился
+# пользователь) дополнительно принимает номера других стран с кодом страны.
+# Результат кэшируется по исходной строке.
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def normalize_phone(raw: str, international: bool = False) -> Optional[str]:
+    try:
+        data = raw.encode("ascii").strip()
+    except UnicodeEncodeError:
+        return None
+    plus = data.startswith(b"+")
+    digits = (data[1:] if plus else data).translate(None, _SEPARATORS)
+    if not digits.isdigit():
+        return None
+
+    length = len(digits)
+    if length == NATIONAL_LENGTH + 1 and (digits[0] == _SEVEN or digits[0] == _EIGHT and not plus):
+        if digits[1] in _FIRST_DIGIT_CODES:
+            return "7" + digits[1:].decode()
+    elif length == NATIONAL_LENGTH and not plus:
+        if digits[0] in _FIRST_DIGIT_CODES:
+            return "7" + digits.decode()
+
+    # Код страны не начинается с 0, зона 7 уже проверена выше, «8» + 10 цифр — российский
+    # номер с невозможным кодом
+    trunk = length == NATIONAL_LENGTH + 1 and digits[0] == _EIGHT and not plus
+    if international and digits[0] != _ZERO and digits[0] != _SEVEN and not trunk:
+        if E164_MIN_LENGTH <= length <= E164_MAX_LENGTH:
+            return digits.decode()
+    return None
@@ -0,0 +1,179 @@
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, FrozenSet, Optional, Union
+
+from aiogram.filters import Filter
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message
+
+from keyboards import CONTACT_KEYBOARD, REPLY_LAYOUTS, reply_keyboard
+from phones import normalize_phone
+
+
+# Определение состояний формы
+class Form(StatesGroup):
+    start = State()            # Начальное состояние
+    residence = State()        # Текущее жилье
+    satisfaction = State()     # Довольны ли текущими условиями
+    property_type = State()    # Тип недвижимости
+    location = State()         # Желаемое расположение
+    budget = State()           # Бюджет
+    search_status = State()    # Статус поиска
+    mortgage = State()         # Ипотека
+    purchase_time = State()    # Планируемое время покупки
+    name = State()             # Имя
+    contact_method = State()   # Способ связи
+    contact_time = State()     # Удобное время для связи
+    phone = State()            # Телефон
+    confirm = State()          # Подтверждение данных
+
+
+# Телефон из контакта или из текста в формате E.164 без «+» (см. phones.py)
+def parse_phone(message: Message) -> Optional[str]:
+    if message.contact is not None:
+        return normalize_phone(message.contact.phone_number, international=True)
+    if message.text:
+        return normalize_phone(message.text)
+    return None
+
+
+# Имя: не короче двух символов
+def parse_name(message: Message) -> Optional[str]:
+    name = (message.text or "").strip()
+    return name if len(name) >= 2 else None
+
+
+# Шаг анкеты. Ответ сохраняется в данных FSM под именем шага (оно же имя состояния Form).
+# Варианты и раскладка кнопок берутся из keyboards.REPLY_LAYOUTS, а предыдущий и
+# следующий шаги — из порядка в QUESTIONNAIRE, поэтому вперёд, назад и при
+# редактировании бот ходит по одному и тому же описанию.
+@dataclass(frozen=True)
+class Step:
+    name: str
+    prompt: str
+    free_text: bool = True                          # принимать ответ не из вариантов
+    other: Optional[str] = None                     # вариант, после которого ждём ответ текстом
+    other_prompt: Optional[str] = None
+    validator: Optional[Callable[[Message], Optional[str]]] = None  # ответ или None, если неверный
+    error: Optional[str] = None
+    after: Optional[str] = None                     # сообщение после ответа на шаг
+    keyboard: Any = None
+    # Заполняются при сборке таблицы
+    state: str = ""
+    options: FrozenSet[str] = frozenset()
+    previous: Optional[str] = None                  # состояние предыдущего шага (None — это первый шаг)
+    next: Optional[str] = None                      # состояние следующего шага (None — подтверждение)
+
+    # Разбор ответа пользователя; None, если ответ не подходит
+    def parse(self, message: Message) -> Optional[str]:
+        if self.validator is not None:
+            return self.validator(message)
+        if message.text is None or message.text == self.other:
+            return None
+        if self.free_text or message.text in self.options:
+            return message.text
+        return None
+
+    @property
+    def error_text(self) -> str:
+        if self.error is not None:
+            return self.error
+        if self.free_text:
+            return "Пожалуйста, напишите ответ текстом."
+        return "Пожалуйста, выберите один из вариантов на клавиатуре."
+
+
+# Шаги анкеты по порядку
+QUESTIONNAIRE = (
+    Step(
+        "residence",
+        "Где вы сейчас проживаете?",
+        other="Другое",
+        other_prompt="Пожалуйста, опишите вашу текущую жилищную ситуацию:",
+    ),
+    Step("satisfaction", "Довольны ли вы своими текущими жилищными условиями?", free_text=False),
+    Step("property_type", "Какой тип недвижимости вас интересует?", free_text=False),
+    Step(
+        "location",
+        "В каком районе или городе вы хотели бы приобрести недвижимость?",
+        other="Другое (напишите свой вариант)",
+        other_prompt="Пожалуйста, укажите желаемое расположение недвижимости:",
+    ),
+    Step("budget", "Какой у вас бюджет на покупку недвижимости?", free_text=False),
+    Step("search_status", "На каком этапе поиска недвижимости вы находитесь?", free_text=False),
+    Step("mortgage", "Планируете ли вы использовать ипотеку для покупки?", free_text=False),
+    Step(
+        "purchase_time",
+        "Когда вы планируете совершить покупку?",
+        free_text=False,
+        after="Спасибо за информацию о ваших планах покупки!\n\n"
+              "Сейчас на рынке недвижимости есть много интересных предложений, и мы поможем вам найти оптимальный вариант в соответствии с вашими пожеланиями и бюджетом.\n\n"
+              "Теперь давайте соберем ваши контактные данные, чтобы наш специалист мог связаться с вами и предложить подходящие варианты.",
+    ),
+    Step(
+        "name",
+        "Как вас зовут?",
+        validator=parse_name,
+        error="Пожалуйста, введите ваше имя (минимум 2 символа).",
+    ),
+    Step(
+        "contact_method",
+        "Как с вами удобнее связаться?",
+        other="Другое",
+        other_prompt="Укажите предпочтительный способ связи:",
+    ),
+    Step("contact_time", "В какое время вам удобно, чтобы с вами связались?"),
+    Step(
+        "phone",
+        "Пожалуйста, укажите ваш номер телефона для связи.",
+        validator=parse_phone,
+        error="Пожалуйста, отправьте ваш номер телефона, нажав на кнопку 'Отправить контакт' или введите его вручную в формате +7XXXXXXXXXX",
+        keyboard=CONTACT_KEYBOARD,
+    ),
+)
+
+
+# Сборка таблицы шагов: состояние -> шаг, со ссылками на соседние шаги и готовой клавиатурой
+def _build(steps) -> Dict[str, Step]:
+    table = {}
+    for index, step in enumerate(steps):
+        previous = getattr(Form, steps[index - 1].name).state if index else None
+        following = getattr(Form, steps[index + 1].name).state if index + 1 < len(steps) else None
+        options, _ = REPLY_LAYOUTS.get(step.name, ([], 1))
+        keyboard = step.keyboard
+        if keyboard is None:
+            keyboard = reply_keyboard(step.name if step.name in REPLY_LAYOUTS else "text", back=previous is not None)
+        state = getattr(Form, step.name).state
+        table[state] = replace(
+            step, state=state, options=frozenset(options), previous=previous, next=following, keyboard=keyboard,
+        )
+    return table
+
+
+# Таблица шагов: строка состояния -> шаг (поиск за O(1))
+STEPS: Dict[str, Step] = _build(QUESTIONNAIRE)
+FIRST_STEP = STEPS[Form.residence.state]
+
+# Разделы редактирования на экране подтверждения -> шаг, с которого начинается раздел
+EDIT_SECTIONS = {
+    "🏠 Жилищная ситуация": STEPS[Form.residence.state],
+    "💰 Готовность к покупке": STEPS[Form.mortgage.state],
+    "📞 Контактные данные": STEPS[Form.name.state],
+}
+
+
+# Фильтр: пользователь находится на одном из шагов анкеты.
+# Шаг находится по строке состояния в словаре и передаётся в обработчик как step.
+class StepFilter(Filter):
+    async def __call__(self, message: Message, raw_state: Optional[str] = None) -> Union[bool, Dict[str, Any]]:
+        step = STEPS.get(raw_state)
+        if step is None:
+            return False
+        return {"step": step}
+
+
+# Переход на шаг: состояние и вопрос (text — если вопрос нужно дополнить, например приветствием)
+async def ask(message: Message, state: FSMContext, step: Step, text: Optional[str] = None):
+    await state.set_state(step.state)
+    await message.answer(text or step.prompt, reply_markup=step.keyboard)
+
@@ -0,0 +1,229 @@
+import asyncio
+import heapq
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from config import REMINDER_BATCH_SIZE, REMINDER_DELAYS, REMINDER_FLUSH_INTERVAL, REMINDER_RATE, REMINDERS_PATH
+from metrics import REMINDERS
+from notify import TokenBucket
+from storage import StorageProxy
+
+# Функция напоминания: (chat_id, состояние анкеты, номер напоминания с 0) -> отправлено ли;
+# False — напоминать больше не нужно, исключение — повторить позже
+Nudger = Callable[[int, str, int], Awaitable[bool]]
+# Таймер чата: (когда сработать, состояние, сколько напоминаний уже отправлено)
+Timer = Tuple[float, str, int]
+
+
+# Планировщик напоминаний о незаконченной анкете.
+# Таймеры лежат в словаре chat_id -> таймер и в куче (время, chat_id): постановка и
+# перенос — O(log n), отмена — O(1) (запись в куче становится устаревшей и пропускается,
+# когда доходит до вершины; куча перестраивается, если устаревших записей стало больше
+# живых). Срабатывания ждёт одна фоновая задача до ближайшего таймера.
+# Изменения копятся в памяти и раз в flush_interval секунд пишутся в SQLite одним
+# пакетом, при запуске таймеры загружаются из базы — напоминания переживают перезапуск.
+# Ключ — chat_id: бот работает только в личных чатах, где chat_id совпадает с user_id.
+class ReminderScheduler:
+    def __init__(
+        self,
+        nudge: Nudger,
+        path: str = REMINDERS_PATH,
+        delays: Sequence[float] = REMINDER_DELAYS,
+        rate: float = REMINDER_RATE,
+        batch_size: int = REMINDER_BATCH_SIZE,
+        flush_interval: float = REMINDER_FLUSH_INTERVAL,
+    ):
+        self.nudge = nudge
+        self.delays = tuple(delays)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.bucket = TokenBucket(rate)
+
+        self._timers: Dict[int, Timer] = {}
+        self._heap: List[Tuple[float, int]] = []
+        # Таймеры, напоминание по которым отправляется прямо сейчас
+        self._firing: Dict[int, Timer] = {}
+        # Изменения, ещё не записанные на диск (None — таймер удалён)
+        self._dirty: Dict[int, Optional[Timer]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reminders")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reminders ("
+            "chat_id INTEGER PRIMARY KEY, "
+            "due_at REAL NOT NULL, "
+            "state TEXT NOT NULL, "
+            "sent INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._timers) + len(self._firing)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _push(self, chat_id: int, timer: Timer):
+        due_at = timer[0]
+        if not self._heap or due_at < self._heap[0][0]:
+            # Новый таймер раньше всех: фоновая задача должна проснуться раньше
+            self._wakeup.set()
+        heapq.heappush(self._heap, (due_at, chat_id))
+        if len(self._heap) > 2 * len(self._timers) + 1024:
+            self._heap = [(entry[0], key) for key, entry in self._timers.items()]
+            heapq.heapify(self._heap)
+
+    def _mark_dirty(self, chat_id: int, timer: Optional[Timer]):
+        self._dirty[chat_id] = timer
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    # Поставить (или перенести) таймер: пользователь только что перешёл в состояние state
+    def schedule(self, chat_id: int, state: str, sent: int = 0, now: Optional[float] = None):
+        self._firing.pop(chat_id, None)
+        if sent >= len(self.delays):
+            self.cancel(chat_id)
+            return
+        timer = ((now if now is not None else time.time()) + self.delays[sent], state, sent)
+        self._timers[chat_id] = timer
+        self._push(chat_id, timer)
+        self._mark_dirty(chat_id, timer)
+
+    # Отменить таймер: анкета заполнена, сброшена или пользователь ушёл из анкеты
+    def cancel(self, chat_id: int):
+        firing = self._firing.pop(chat_id, None)
+        if self._timers.pop(chat_id, None) is not None or firing is not None or chat_id in self._dirty:
+            self._mark_dirty(chat_id, None)
+
+    # Загрузка таймеров, оставшихся с прошлого запуска (куча строится за O(n))
+    async def load(self):
+        rows = await self._run(lambda: self._db.execute("SELECT chat_id, due_at, state, sent FROM reminders").fetchall())
+        for chat_id, due_at, state, sent in rows:
+            self._timers[chat_id] = (due_at, state, sent)
+        self._heap = [(timer[0], chat_id) for chat_id, timer in self._timers.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+        logging.info(f"Загружено напоминаний: {len(rows)}")
+
+    def _write(self, batch: Dict[int, Optional[Timer]]):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO reminders (chat_id, due_at, state, sent) VALUES (?, ?, ?, ?)",
+                [(chat_id, *timer) for chat_id, timer in batch.items() if timer is not None],
+            )
+            self._db.executemany(
+                "DELETE FROM reminders WHERE chat_id = ?",
+                [(chat_id,) for chat_id, timer in batch.items() if timer is None],
+            )
+
+    async def _flush_loop(self):
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # Запись накопленных изменений одним пакетом
+    async def flush(self):
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self._run(self._write, batch)
+        except Exception as e:
+            logging.error(f"Ошибка при записи напоминаний, запись будет повторена: {e}")
+            # Более свежие изменения имеют приоритет
+            self._dirty = {**batch, **self._dirty}
+
+    # Снять с кучи таймеры, которым пора сработать (не больше batch_size)
+    def _pop_due(self, now: float) -> List[Tuple[int, Timer]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            due_at, chat_id = heapq.heappop(self._heap)
+            timer = self._timers.get(chat_id)
+            # Устаревшая запись: таймер отменён или перенесён
+            if timer is None or timer[0] != due_at:
+                continue
+            del self._timers[chat_id]
+            self._firing[chat_id] = timer
+            due.append((chat_id, timer))
+        return due
+
+    async def _fire(self, chat_id: int, timer: Timer):
+        _, state, sent = timer
+        await self.bucket.acquire()
+        # Пока ждали очереди, пользователь мог продолжить анкету
+        if self._firing.get(chat_id) is not timer:
+            return
+        try:
+            delivered = await self.nudge(chat_id, state, sent)
+        except Exception as e:
+            # Сбой сети или Bot API: то же напоминание повторяется через тот же интервал
+            logging.error(f"Ошибка при отправке напоминания в чат {chat_id}: {e}")
+            REMINDERS.inc("failed")
+            if self._firing.get(chat_id) is timer:
+                self.schedule(chat_id, state, sent)
+            return
+        REMINDERS.inc("sent" if delivered else "skipped")
+        # Следующее напоминание — только если пользователь так и не ответил
+        if self._firing.get(chat_id) is timer:
+            if delivered:
+                self.schedule(chat_id, state, sent + 1)
+            else:
+                self.cancel(chat_id)
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            due = self._pop_due(time.time())
+            if due:
+                await asyncio.gather(*(self._fire(chat_id, timer) for chat_id, timer in due))
+                continue
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # Запуск фоновой задачи (напоминания, просроченные за время простоя, уходят сразу)
+    def start(self):
+        if self._worker is None and self.delays:
+            self._worker = asyncio.create_task(self._work())
+
+    # Остановка: прерванные напоминания остаются в базе и сработают после перезапуска
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.flush()
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
+
+
+# Хранилище FSM, которое ставит напоминание при переходе в одно из состояний states
+# и отменяет его при переходе в любое другое (в том числе при сбросе анкеты)
+class ReminderStorage(StorageProxy):
+    def __init__(self, storage: BaseStorage, scheduler: ReminderScheduler, states: FrozenSet[str]):
+        super().__init__(storage)
+        self.scheduler = scheduler
+        self.states = states
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.storage.set_state(key, state)
+        name = state.state if isinstance(state, State) else state
+        if name in self.states:
+            self.scheduler.schedule(key.chat_id, name)
+        else:
+            self.scheduler.cancel(key.chat_id)
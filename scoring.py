@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from itertools import repeat
+from operator import add
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import LEAD_HOT_SCORE, LEAD_SCORE_BATCH_SIZE, LEAD_SCORE_MODEL, LEADS_PATH
+from keyboards import (
+    BUDGET_OPTIONS,
+    MORTGAGE_OPTIONS,
+    PURCHASE_TIME_OPTIONS,
+    SATISFACTION_OPTIONS,
+    SEARCH_STATUS_OPTIONS,
+)
+from leads import LEAD_FIELDS, LeadStore
+
+# Модель оценки заявки по умолчанию: поле анкеты -> баллы за вариант ответа (за ответ не из
+# списка и пустое поле — 0). Сумма лучших вариантов — 100; «Пока просто интересуюсь»
+# отнимает баллы, чтобы такая заявка не становилась горячей за счёт остальных ответов
+DEFAULT_MODEL: Dict[str, Dict[str, int]] = {
+    "search_status": dict(zip(SEARCH_STATUS_OPTIONS, (0, 10, 20, 30))),
+    "mortgage": dict(zip(MORTGAGE_OPTIONS, (25, 10, 25, 0))),
+    "purchase_time": dict(zip(PURCHASE_TIME_OPTIONS, (25, 18, 10, 5, -20))),
+    "budget": dict(zip(BUDGET_OPTIONS, (2, 4, 6, 8, 10))),
+    "satisfaction": dict(zip(SATISFACTION_OPTIONS, (0, 5, 10))),
+}
+
+
+# Модель из JSON-файла того же вида, что DEFAULT_MODEL (пустой путь — модель по умолчанию)
+def load_model(path: str = LEAD_SCORE_MODEL) -> Dict[str, Dict[str, int]]:
+    if not path:
+        return DEFAULT_MODEL
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+# Оценка заявки от 0 до 100: сумма баллов за ответы, приведённая к шкале по сумме лучших
+# вариантов модели. Одна и та же модель считается тремя способами с одинаковым результатом:
+# по ответам одной заявки (при подтверждении), по столбцам пачки заявок и выражением SQL,
+# которое SQLite вычисляет для всего архива без передачи строк в Python
+class LeadScorer:
+    def __init__(self, model: Optional[Dict[str, Dict[str, int]]] = None, hot: int = LEAD_HOT_SCORE):
+        model = load_model() if model is None else model
+        for field, weights in model.items():
+            if field not in LEAD_FIELDS:
+                raise ValueError(f"Поля «{field}» нет в анкете")
+            if not all(isinstance(points, int) for points in weights.values()):
+                raise ValueError(f"Баллы поля «{field}» должны быть целыми числами")
+        self.hot = hot
+        self.fields: Tuple[str, ...] = tuple(model)
+        self.weights: Tuple[Dict[str, int], ...] = tuple(model[field] for field in self.fields)
+        # Наименьшая и наибольшая сумма баллов (ответ не из списка даёт 0)
+        low = sum(min((0, *weights.values())) for weights in self.weights)
+        self.best = sum(max((0, *weights.values())) for weights in self.weights)
+        if self.best <= 0:
+            raise ValueError("В модели нет вариантов с положительными баллами")
+        # Сумма баллов -> оценка; SQLite делит целые с отбрасыванием дробной части, а не вниз,
+        # но после ограничения снизу нулём результат тот же
+        self._scale = {raw: max(0, min(100, raw * 100 // self.best)) for raw in range(low, self.best + 1)}
+
+    # Оценка по ответам анкеты
+    def score(self, data: Dict[str, Any]) -> int:
+        get = data.get
+        return self._scale[sum(weights.get(get(field), 0) for field, weights in zip(self.fields, self.weights))]
+
+    def is_hot(self, score: Optional[int]) -> bool:
+        return score is not None and score >= self.hot
+
+    # Оценки пачки заявок по столбцам (columns — значения полей self.fields в том же порядке):
+    # каждый столбец переводится в баллы одним проходом map по словарю, без цикла по заявкам в Python
+    def score_columns(self, columns: Sequence[Sequence[Optional[str]]]) -> List[int]:
+        totals = None
+        for column, weights in zip(columns, self.weights):
+            points = map(weights.get, column, repeat(0))
+            totals = list(points) if totals is None else list(map(add, totals, points))
+        return list(map(self._scale.__getitem__, totals or []))
+
+    # Выражение SQL с оценкой заявки по столбцам таблицы leads и его параметры
+    def sql(self) -> Tuple[str, List[str]]:
+        terms, params = [], []
+        for field, weights in zip(self.fields, self.weights):
+            cases = " ".join(f"WHEN ? THEN {int(points)}" for points in weights.values())
+            terms.append(f"(CASE {field} {cases} ELSE 0 END)" if weights else "0")
+            params.extend(weights)
+        return f"MAX(0, MIN(100, ({' + '.join(terms)}) * 100 / {self.best}))", params
+
+
+# Пересчёт оценок всего архива (после изменения модели): пачки идут через поток LeadStore
+# вперемешку с сохранением новых заявок. Возвращает число заявок
+async def rescore_archive(scorer: LeadScorer, store: LeadStore, batch_size: int = LEAD_SCORE_BATCH_SIZE) -> int:
+    expression, params = scorer.sql()
+    return await store.update_scores(expression, params, batch_size)
+
+
+async def _rescore(scorer: LeadScorer, path: str, batch_size: int) -> Tuple[int, int, float]:
+    store = LeadStore(path)
+    try:
+        started = time.perf_counter()
+        total = await rescore_archive(scorer, store, batch_size)
+        elapsed = time.perf_counter() - started
+        return total, await store.count(score_min=scorer.hot), elapsed
+    finally:
+        await store.close()
+
+
+# Пересчёт из командной строки после изменения модели (при работающем боте лучше /rescore), например:
+#   python scoring.py --model scoring.json
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Пересчёт оценок всех заявок архива")
+    parser.add_argument("--model", default=LEAD_SCORE_MODEL, help="JSON-файл модели (по умолчанию — LEAD_SCORE_MODEL или встроенная)")
+    parser.add_argument("--leads", default=LEADS_PATH, help="архив заявок")
+    parser.add_argument("--batch-size", type=int, default=LEAD_SCORE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    try:
+        scorer = LeadScorer(load_model(args.model))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    total, hot, elapsed = asyncio.run(_rescore(scorer, args.leads, args.batch_size))
+    print(f"Пересчитано заявок: {total} за {elapsed:.1f} с, горячих: {hot}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
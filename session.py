@@ -0,0 +1,68 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+from aiogram import Bot
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import TelegramMethod
+from aiohttp import ClientResponse, ClientTimeout
+
+from config import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_DNS_TTL,
+    HTTP_KEEPALIVE,
+    HTTP_POOL_PER_HOST,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    TELEGRAM_API_URL,
+)
+from keyboards import MarkupCacheSession
+
+
+# Единственная HTTP-сессия процесса: запросы к Bot API и любые другие исходящие
+# интеграции (CRM, вебхуки) идут через один пул соединений aiohttp.
+# Соединения держатся открытыми дольше, чем по умолчанию (keep-alive), адреса
+# кэшируются, а у запроса ограничено и общее время, и время установки соединения.
+class BotSession(MarkupCacheSession):
+    def __init__(
+        self,
+        api: Optional[TelegramAPIServer] = None,
+        pool_size: int = HTTP_POOL_SIZE,
+        pool_per_host: int = HTTP_POOL_PER_HOST,
+        keepalive: float = HTTP_KEEPALIVE,
+        dns_ttl: int = HTTP_DNS_TTL,
+        timeout: float = HTTP_TIMEOUT,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+    ):
+        kwargs = {"api": api} if api is not None else {}
+        super().__init__(limit=pool_size, timeout=timeout, **kwargs)
+        self._connector_init.update(
+            limit_per_host=pool_per_host,
+            keepalive_timeout=keepalive,
+            ttl_dns_cache=dns_ttl,
+            enable_cleanup_closed=True,
+        )
+        self.connect_timeout = connect_timeout
+        self._default_timeout = ClientTimeout(total=timeout, sock_connect=connect_timeout)
+
+    # aiogram передаёт в aiohttp только общий таймаут (в polling — с учётом long polling),
+    # к нему добавляется таймаут установки соединения
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        if timeout is None:
+            client_timeout = self._default_timeout
+        else:
+            client_timeout = ClientTimeout(total=timeout, sock_connect=self.connect_timeout)
+        return await super().make_request(bot, method, timeout=client_timeout)
+
+    # Запрос исходящей интеграции (CRM, вебхуки) через тот же пул соединений и с теми же
+    # таймаутами, что и у Bot API: async with bot.session.request("POST", url, json=...) as response
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs: Any) -> AsyncIterator[ClientResponse]:
+        session = await self.create_session()
+        kwargs.setdefault("timeout", self._default_timeout)
+        async with session.request(method, url, **kwargs) as response:
+            yield response
+
+
+# Сессия для бота с адресом Bot API из настроек (по умолчанию api.telegram.org)
+def create_bot_session() -> BotSession:
+    return BotSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else None)
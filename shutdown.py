@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from config import SHUTDOWN_TIMEOUT
+
+
+# Диспетчер, который знает, какие обновления сейчас обрабатываются.
+# При остановке (emit_shutdown) он сначала дожидается их, не дольше shutdown_timeout
+# секунд, и только потом закрываются хранилище FSM, очередь outbox и сессия бота.
+# Обновления, ждущие очереди своего чата, тоже считаются начатыми.
+class GracefulDispatcher(Dispatcher):
+    def __init__(self, *args: Any, shutdown_timeout: float = SHUTDOWN_TIMEOUT, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.shutdown_timeout = shutdown_timeout
+        self.in_flight: Counter = Counter()
+        self.last_update_id: Optional[int] = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._deadline: Optional[float] = None
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        update_id = update.update_id
+        self.in_flight[update_id] += 1
+        self._idle.clear()
+        if self.last_update_id is None or update_id > self.last_update_id:
+            self.last_update_id = update_id
+        try:
+            return await super().feed_update(bot, update, **kwargs)
+        finally:
+            self.in_flight[update_id] -= 1
+            if not self.in_flight[update_id]:
+                del self.in_flight[update_id]
+            if not self.in_flight:
+                self._idle.set()
+
+    # Сколько секунд осталось до конца остановки (общий срок на все её этапы)
+    def time_left(self) -> float:
+        if self._deadline is None:
+            return self.shutdown_timeout
+        return max(self._deadline - time.monotonic(), 0)
+
+    # Ожидание обработчиков; возвращает число обновлений, которые не успели обработаться
+    async def drain(self) -> int:
+        if self._deadline is None:
+            self._deadline = time.monotonic() + self.shutdown_timeout
+        # Задачи, созданные polling'ом или webhook'ом перед остановкой, успевают начаться
+        await asyncio.sleep(0)
+        if self.in_flight:
+            logging.info(f"Остановка: ждём {len(self.in_flight)} обновлений в обработке (до {self.time_left():.0f} с)")
+            try:
+                await asyncio.wait_for(self._idle.wait(), self.time_left())
+            except asyncio.TimeoutError:
+                logging.warning(f"Остановка: {len(self.in_flight)} обновлений не успели обработаться")
+        return len(self.in_flight)
+
+    async def emit_shutdown(self, *args: Any, **kwargs: Any) -> None:
+        await self.drain()
+        await super().emit_shutdown(*args, **kwargs)
+
+    # Подтверждение обработанных обновлений в Bot API (режим polling): Telegram считает
+    # полученными все обновления до offset, остальные достанутся следующему экземпляру.
+    # Обычно подтверждение уходит со следующим getUpdates, которого при остановке не будет.
+    async def confirm_updates(self, bot: Bot):
+        if self.last_update_id is None:
+            return
+        offset = min(self.in_flight) if self.in_flight else self.last_update_id + 1
+        try:
+            await bot.get_updates(offset=offset, limit=1, timeout=0)
+        except Exception as e:
+            logging.error(f"Не удалось подтвердить обновления до {offset}: {e}")
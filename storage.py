@@ -0,0 +1,452 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from abc import abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+from config import (
+    FSM_CACHE_SIZE,
+    FSM_FLUSH_INTERVAL,
+    FSM_SQLITE_PATH,
+    FSM_STATE_TTL,
+    FSM_STORAGE,
+    FSM_SWEEP_CHUNK,
+    FSM_SWEEP_INTERVAL,
+    FSM_TTL,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_URL,
+)
+from keyboards import BACK_BUTTON, REPLY_LAYOUTS
+from messages import DATA_VERSION
+from questionnaire import QUESTIONNAIRE, Form
+
+# Запись хранилища: (состояние, данные анкеты)
+Record = Tuple[Optional[str], Dict[str, Any]]
+
+
+# Базовое хранилище с отложенной пакетной записью.
+# Изменения (set_state, set_data, update_data) копятся в памяти и раз в
+# flush_interval секунд записываются в базу одним пакетом; чтение сначала
+# смотрит в ещё не записанные изменения, поэтому обработчик всегда видит свои данные.
+# cache_size > 0 включает LRU-кэш чтения — только если база не разделяется с другими процессами.
+# Наследник задаёт чтение одной записи (_load) и запись пакета (_write_batch).
+class BufferedStorage(BaseStorage):
+    def __init__(self, flush_interval: float = FSM_FLUSH_INTERVAL, cache_size: int = 0):
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Record]" = OrderedDict()
+        self._pending: Dict[str, Record] = {}
+        self._flushing: Dict[str, Record] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def _load(self, key: str) -> Record:
+        pass
+
+    @abstractmethod
+    async def _write_batch(self, batch: Dict[str, Record]) -> None:
+        pass
+
+    async def _close(self) -> None:
+        pass
+
+    async def _get_record(self, key: StorageKey) -> Record:
+        storage_key = self.key_builder.build(key)
+        if storage_key in self._pending:
+            return self._pending[storage_key]
+        if storage_key in self._flushing:
+            return self._flushing[storage_key]
+        if storage_key in self._cache:
+            self._cache.move_to_end(storage_key)
+            return self._cache[storage_key]
+        record = await self._load(storage_key)
+        self._remember(storage_key, record)
+        return record
+
+    def _remember(self, key: str, record: Record):
+        if not self.cache_size:
+            return
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _put_record(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        self._pending[self.key_builder.build(key)] = (state, data)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # Запись всех накопленных изменений одним пакетом
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self._write_batch(self._flushing)
+                for key, record in self._flushing.items():
+                    self._remember(key, record)
+            except Exception as e:
+                logging.error(f"Ошибка при записи FSM-хранилища, запись будет повторена: {e}")
+                # Более свежие изменения из _pending имеют приоритет
+                self._pending = {**self._flushing, **self._pending}
+            finally:
+                self._flushing = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._get_record(key)
+        self._put_record(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._get_record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _ = await self._get_record(key)
+        self._put_record(key, state, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._get_record(key)
+        return data.copy()
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        state, current_data = await self._get_record(key)
+        current_data = {**current_data, **data}
+        self._put_record(key, state, current_data)
+        return current_data.copy()
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self._close()
+
+
+# Отсутствующее поле в компактной записи анкеты
+_MISSING = object()
+
+
+# Анкета одного пользователя в CompactMemoryStorage: ответы на известные поля — кортежем
+# в порядке полей (без хвоста из незаполненных), прочие ключи — словарём extra
+class _Session:
+    __slots__ = ("state", "values", "extra", "touched")
+
+    def __init__(self, state: Optional[str], values: tuple, extra: Optional[Dict[str, Any]], touched: float):
+        self.state = state
+        self.values = values
+        self.extra = extra
+        self.touched = touched
+
+
+# Хранилище в памяти с ограниченным объёмом (замена MemoryStorage aiogram).
+# MemoryStorage держит запись каждого, кто хоть раз написал боту, вечно; здесь анкета,
+# к которой не обращались ttl секунд (для состояния — state_ttl[состояние]), удаляется.
+# Записи с одинаковым сроком лежат в OrderedDict в порядке последнего обращения, поэтому
+# просроченные всегда в начале: фоновая чистка просматривает только их, пачками по
+# sweep_chunk, отдавая управление event loop между пачками.
+# Ответы хранятся компактно: кортеж по известным полям fields вместо словаря, а строки
+# из constants (варианты на кнопках) — одним общим объектом вместо копии у каждого.
+# Ключ личного чата — сам chat_id, а не объект StorageKey.
+class CompactMemoryStorage(BaseStorage):
+    def __init__(
+        self,
+        fields: Sequence[str] = (),
+        constants: Iterable[str] = (),
+        ttl: float = FSM_TTL,
+        state_ttl: Optional[Dict[str, float]] = None,
+        sweep_interval: float = FSM_SWEEP_INTERVAL,
+        sweep_chunk: int = FSM_SWEEP_CHUNK,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.fields = tuple(fields)
+        self.ttl = ttl
+        self.state_ttl = FSM_STATE_TTL if state_ttl is None else state_ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_chunk = sweep_chunk
+        self.clock = clock
+        self._positions = {name: index for index, name in enumerate(self.fields)}
+        self._constants = {value: value for value in constants}
+        # bot_id -> срок хранения -> анкеты в порядке последнего обращения
+        self._bots: Dict[int, Dict[float, "OrderedDict[Hashable, _Session]"]] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for buckets in self._bots.values() for bucket in buckets.values())
+
+    @staticmethod
+    def _key(key: StorageKey) -> Hashable:
+        if (
+            key.chat_id == key.user_id
+            and key.thread_id is None
+            and key.business_connection_id is None
+            and key.destiny == "default"
+        ):
+            return key.chat_id
+        return key
+
+    def _find(self, key: StorageKey) -> Tuple[Hashable, Optional["OrderedDict[Hashable, _Session]"], Optional[_Session]]:
+        compact = self._key(key)
+        for bucket in self._bots.get(key.bot_id, {}).values():
+            session = bucket.get(compact)
+            if session is not None:
+                return compact, bucket, session
+        return compact, None, None
+
+    # Анкета по ключу; обращение продлевает срок её хранения
+    def _get(self, key: StorageKey) -> Optional[_Session]:
+        compact, bucket, session = self._find(key)
+        if session is not None:
+            session.touched = self.clock()
+            bucket.move_to_end(compact)
+        return session
+
+    def _put(self, key: StorageKey, state: Optional[str], values: tuple, extra: Optional[Dict[str, Any]]):
+        compact, bucket, session = self._find(key)
+        if bucket is not None:
+            del bucket[compact]
+        if state is None and not values and not extra:
+            return
+        if session is None:
+            session = _Session(state, values, extra, self.clock())
+        else:
+            session.state, session.values, session.extra, session.touched = state, values, extra, self.clock()
+        buckets = self._bots.setdefault(key.bot_id, {})
+        ttl = self.state_ttl.get(state, self.ttl)
+        target = buckets.get(ttl)
+        if target is None:
+            target = buckets[ttl] = OrderedDict()
+        target[compact] = session
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    def _encode(self, data: Dict[str, Any]) -> Tuple[tuple, Optional[Dict[str, Any]]]:
+        values = [_MISSING] * len(self.fields)
+        extra = None
+        last = -1
+        for name, value in data.items():
+            if isinstance(value, str):
+                value = self._constants.get(value, value)
+            position = self._positions.get(name)
+            if position is None:
+                if extra is None:
+                    extra = {}
+                extra[name] = value
+            else:
+                values[position] = value
+                last = max(last, position)
+        return tuple(values[:last + 1]), extra
+
+    def _decode(self, session: _Session) -> Dict[str, Any]:
+        data = {name: value for name, value in zip(self.fields, session.values) if value is not _MISSING}
+        if session.extra:
+            data.update(session.extra)
+        return data
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        session = self._get(key)
+        if session is None:
+            self._put(key, state, (), None)
+        else:
+            self._put(key, state, session.values, session.extra)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        session = self._get(key)
+        return session.state if session is not None else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        session = self._get(key)
+        self._put(key, session.state if session is not None else None, *self._encode(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        session = self._get(key)
+        return self._decode(session) if session is not None else {}
+
+    # Удаление анкет, к которым не обращались дольше срока хранения; возвращает их число
+    async def sweep(self) -> int:
+        removed = 0
+        for buckets in list(self._bots.values()):
+            for ttl, bucket in list(buckets.items()):
+                if not ttl:
+                    continue
+                while True:
+                    expired = self._expire(bucket, self.clock() - ttl)
+                    removed += expired
+                    if expired < self.sweep_chunk:
+                        break
+                    await asyncio.sleep(0)
+        return removed
+
+    def _expire(self, bucket: "OrderedDict[Hashable, _Session]", deadline: float) -> int:
+        count = 0
+        while bucket and count < self.sweep_chunk:
+            if bucket[next(iter(bucket))].touched > deadline:
+                break
+            bucket.popitem(last=False)
+            count += 1
+        return count
+
+    async def _sweep_loop(self):
+        while len(self):
+            await asyncio.sleep(self.sweep_interval)
+            removed = await self.sweep()
+            if removed:
+                logging.info(f"Удалено незаконченных анкет по сроку хранения: {removed}, осталось {len(self)}")
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        self._bots.clear()
+
+
+# Хранилище в SQLite (режим WAL) для запуска на одном сервере.
+# Запросы выполняются в отдельном потоке, чтобы не блокировать event loop.
+class SQLiteStorage(BufferedStorage):
+    def __init__(self, path: str = FSM_SQLITE_PATH, cache_size: int = FSM_CACHE_SIZE, **kwargs: Any):
+        super().__init__(cache_size=cache_size, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-sqlite")
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _select(self, key: str) -> Record:
+        row = self._db.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def _write(self, batch: Dict[str, Record]):
+        upserts = []
+        deletes = []
+        for key, (state, data) in batch.items():
+            if state is None and not data:
+                deletes.append((key,))
+            else:
+                upserts.append((key, state, json.dumps(data, ensure_ascii=False)))
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO fsm (key, state, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data",
+                upserts,
+            )
+            self._db.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+
+    async def _load(self, key: str) -> Record:
+        return await self._run(self._select, key)
+
+    async def _write_batch(self, batch: Dict[str, Record]) -> None:
+        await self._run(self._write, batch)
+
+    async def _close(self) -> None:
+        await self._run(self._db.close)
+        self._executor.shutdown(wait=False)
+
+
+# Хранилище в Redis (или любом сервере с протоколом Redis) для нескольких реплик.
+# Пакет изменений отправляется одним pipeline без транзакции; анкета хранится ttl
+# секунд (state_ttl — для отдельных состояний) с последнего изменения.
+class RedisStorage(BufferedStorage):
+    def __init__(
+        self,
+        url: str = REDIS_URL,
+        max_connections: int = REDIS_MAX_CONNECTIONS,
+        ttl: float = FSM_TTL,
+        state_ttl: Optional[Dict[str, float]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.ttl = ttl
+        self.state_ttl = FSM_STATE_TTL if state_ttl is None else state_ttl
+        # redis — необязательная зависимость, нужна только для этого хранилища
+        from redis.asyncio import BlockingConnectionPool, Redis
+
+        self.redis = Redis(connection_pool=BlockingConnectionPool.from_url(url, max_connections=max_connections))
+
+    async def _load(self, key: str) -> Record:
+        raw = await self.redis.get(key)
+        if raw is None:
+            return None, {}
+        record = json.loads(raw)
+        return record["state"], record["data"]
+
+    async def _write_batch(self, batch: Dict[str, Record]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, (state, data) in batch.items():
+                if state is None and not data:
+                    pipe.delete(key)
+                else:
+                    ttl = int(self.state_ttl.get(state, self.ttl))
+                    pipe.set(key, json.dumps({"state": state, "data": data}, ensure_ascii=False), ex=ttl or None)
+            await pipe.execute()
+
+    async def _close(self) -> None:
+        await self.redis.aclose()
+
+
+# Компактное хранилище в памяти для анкеты бота: поля — шаги анкеты и версия данных,
+# общие строки — варианты ответов на кнопках и названия состояний
+def create_memory_storage(**kwargs: Any) -> CompactMemoryStorage:
+    constants = [option for options, _ in REPLY_LAYOUTS.values() for option in options]
+    constants += [BACK_BUTTON, *(state.state for state in Form.__all_states__)]
+    return CompactMemoryStorage(
+        fields=[step.name for step in QUESTIONNAIRE] + [DATA_VERSION],
+        constants=constants,
+        **kwargs,
+    )
+
+
+# Обёртка над другим хранилищем: все операции передаются ему как есть. Наследники
+# (метрики, напоминания, воронка) переопределяют только нужные им методы
+class StorageProxy(BaseStorage):
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.storage.set_state(key, state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.storage.get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.storage.set_data(key, data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.storage.get_data(key)
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.storage.update_data(key, data)
+
+    async def close(self) -> None:
+        await self.storage.close()
+
+
+# Создание хранилища по переменной окружения FSM_STORAGE
+def create_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return create_memory_storage()
+    if FSM_STORAGE == "sqlite":
+        return SQLiteStorage(FSM_SQLITE_PATH)
+    if FSM_STORAGE == "redis":
+        return RedisStorage(REDIS_URL)
+    raise ValueError(f"Неизвестное хранилище FSM_STORAGE={FSM_STORAGE!r}: ожидается memory, sqlite или redis")
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Модули бота лежат в корне репозитория; benchmarks — эталонные старые реализации
+# и генераторы ввода, общие для тестов и замеров
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
@@ -0,0 +1,31 @@
+import asyncio
+
+from dedup import DuplicateIndex
+from leads import LeadStore
+
+
+# Две заявки с одним телефоном из разных чатов, которые попали к разным процессам
+# кластера: каждый процесс видит в фильтре только свои заявки
+async def resubmit_on_other_process(path, bloom):
+    first_store, second_store = LeadStore(path), LeadStore(path)
+    first = DuplicateIndex(first_store, bloom=bloom)
+    second = DuplicateIndex(second_store, bloom=bloom)
+    try:
+        await first.load()
+        await second.load()
+        lead_id = await first_store.add({"phone": "79991234567"}, user_id=1)
+        first.add("79991234567", 1)
+        return lead_id, await second.find("79991234567", 2)
+    finally:
+        await first_store.close()
+        await second_store.close()
+
+
+def test_worker_finds_lead_saved_by_other_worker(tmp_path):
+    lead_id, found = asyncio.run(resubmit_on_other_process(str(tmp_path / "leads.sqlite3"), bloom=False))
+    assert found == lead_id
+
+
+def test_process_local_filter_misses_other_process(tmp_path):
+    _, found = asyncio.run(resubmit_on_other_process(str(tmp_path / "leads.sqlite3"), bloom=True))
+    assert found is None
@@ -0,0 +1,43 @@
+import asyncio
+from types import SimpleNamespace
+
+from flood import FloodControlMiddleware
+
+
+class ExpiredCallback:
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=1)
+        self.message = SimpleNamespace(message_id=10)
+        self.inline_message_id = None
+        self.data = "✅ Подтвердить"
+
+    async def answer(self, *args, **kwargs):
+        raise RuntimeError("Bad Request: query is too old and response timeout expired")
+
+
+async def press(middleware, event, data, times):
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event)
+
+    for _ in range(times):
+        await middleware(handler, event, data)
+    return calls
+
+
+# Ошибка ответа на отброшенное повторное нажатие не выходит из middleware
+def test_duplicate_callback_answer_error_is_swallowed():
+    middleware = FloodControlMiddleware(rate=1000, burst=1000, dedup_window=10)
+    event = SimpleNamespace(message=None, callback_query=ExpiredCallback())
+    calls = asyncio.run(press(middleware, event, {}, 2))
+    assert len(calls) == 1 and middleware.duplicates == 1
+
+
+# То же для нажатия сверх лимита, когда пользователь уже предупреждён
+def test_throttled_callback_answer_error_is_swallowed():
+    middleware = FloodControlMiddleware(rate=0.001, burst=1, dedup_window=0)
+    event = SimpleNamespace(message=None, callback_query=ExpiredCallback())
+    data = {"event_from_user": SimpleNamespace(id=1)}
+    calls = asyncio.run(press(middleware, event, data, 3))
+    assert len(calls) == 1 and middleware.throttled == 2
@@ -0,0 +1,95 @@
+from datetime import datetime
+from html.parser import HTMLParser
+
+import pytest
+
+from bench_render import FORM_DATA, before
+from messages import DATA_VERSION, SECTIONS, SummaryRenderer, new_version
+
+FIELDS = [field for _, items in SECTIONS for field, _ in items]
+
+# Ввод, который ломает HTML-разметку без экранирования
+HOSTILE = [
+    "<b>Иван</b>",
+    "Tom & Jerry",
+    "<script>alert(1)</script>",
+    "a < b > c",
+    "</code><i>",
+    '"кавычки" и \'апострофы\'',
+    "&amp; &lt;",
+    "{name} {0} {}",
+    "<a href=\"https://example.com\">ссылка</a>",
+    "Иван 🏠\n<b>",
+]
+
+
+# Разбор HTML так же строго, как Telegram: теги и текст без сущностей
+class TagCollector(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags = []
+        self.text = ""
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.append(tag)
+
+    def handle_endtag(self, tag):
+        self.tags.append("/" + tag)
+
+    def handle_data(self, data):
+        self.text += data
+
+
+def parse(html):
+    collector = TagCollector()
+    collector.feed(html)
+    collector.close()
+    return collector
+
+
+# Шаблон даёт тот же текст, что и старая сборка через +=
+def test_confirmation_matches_old_rendering():
+    assert SummaryRenderer().confirmation(1, FORM_DATA) == before(FORM_DATA)
+
+
+def test_empty_form_is_not_specified():
+    text = SummaryRenderer().confirmation(None, {})
+    assert text.count("Не указано") == len(FIELDS)
+
+
+# Ввод пользователя не превращается в теги и виден дословно во всех трёх сообщениях
+@pytest.mark.parametrize("value", HOSTILE)
+def test_user_input_is_escaped(value):
+    renderer = SummaryRenderer()
+    when = datetime(2024, 3, 1, 12, 0)
+    for field in FIELDS:
+        data = dict(FORM_DATA, **{field: value})
+        for text in (
+            renderer.confirmation(None, data),
+            renderer.admin(None, data, username=value, created_at=when),
+            renderer.sos(42, data, created_at=when),
+        ):
+            parsed = parse(text)
+            assert set(parsed.tags) <= {"b", "/b"}, (field, parsed.tags)
+            assert parsed.tags.count("b") == parsed.tags.count("/b"), field
+            if field in ("name", "phone") or "SOS" not in text:
+                assert value in parsed.text, (field, text)
+
+
+# Кэш: та же версия — тот же объект, новая версия — новый текст
+def test_summary_cache_by_version():
+    renderer = SummaryRenderer()
+    data = dict(FORM_DATA, **{DATA_VERSION: new_version()})
+    first = renderer.summary(7, data)
+    assert renderer.summary(7, data) is first
+    changed = dict(data, name="Пётр", **{DATA_VERSION: new_version()})
+    assert "Пётр" in renderer.summary(7, changed)
+    assert renderer.summary(7, data) is first
+
+
+def test_summary_cache_is_bounded():
+    renderer = SummaryRenderer(cache_size=2)
+    data = dict(FORM_DATA, **{DATA_VERSION: new_version()})
+    for chat_id in range(5):
+        renderer.summary(chat_id, data)
+    assert len(renderer._cache) == 2
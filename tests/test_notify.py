@@ -0,0 +1,29 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from notify import AdminNotifier
+
+
+class FlakyBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        raise TelegramRetryAfter(method=SendMessage(chat_id=chat_id, text=text), message="Too Many Requests", retry_after=30)
+
+
+# Доставка из outbox: одна попытка, RetryAfter уходит очереди, а лимиты встают на паузу
+def test_single_attempt_returns_retry_after_to_caller():
+    bot = FlakyBot()
+    notifier = AdminNotifier(bot)
+    started = time.monotonic()
+    with pytest.raises(TelegramRetryAfter):
+        asyncio.run(notifier.send_message(1, "Заявка", retry=False))
+    assert time.monotonic() - started < 1
+    assert bot.calls == 1
+    assert not notifier.global_bucket.try_acquire()
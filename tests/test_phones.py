@@ -0,0 +1,66 @@
+import random
+import re
+
+import pytest
+
+from bench_phones import before, invalid, random_national, written
+from phones import SEPARATORS, normalize_phone
+
+CASES = 2000
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1)
+
+
+# Любое написание номера зоны +7 даёт один и тот же номер E.164, нормализация идемпотентна
+def test_any_spelling_gives_e164(rng):
+    for _ in range(CASES):
+        national = random_national(rng)
+        expected = "7" + national
+        for _ in range(5):
+            text = written(rng, national)
+            assert normalize_phone(text) == expected, text
+            assert normalize_phone(text, international=True) == expected, text
+        assert normalize_phone(expected) == expected
+        assert normalize_phone("+" + expected) == expected
+
+
+# Код на 0/1/2/5, не та длина, буквы, не ASCII-цифры, «+8» при ручном вводе
+def test_impossible_numbers_are_rejected(rng):
+    for _ in range(CASES):
+        text = invalid(rng)
+        assert normalize_phone(text) is None, text
+
+
+# Всё, что принимал старый путь, принимается так же. Исключение — ошибка старого пути:
+# номер из 10 цифр сохранялся без кода страны, а код 8xx ещё и превращался в 7xx
+def test_old_path_results_are_kept(rng):
+    for _ in range(CASES):
+        for text in (written(rng, random_national(rng, "489")), invalid(rng)):
+            old = before(text)
+            if old is not None:
+                old = old if len(old) == 11 else "7" + re.sub(r'\D', '', text)
+                assert normalize_phone(text) == old, (text, old)
+
+
+# Контакты других стран (код страны и 8..15 цифр) принимаются только с international=True
+def test_foreign_numbers_need_international(rng):
+    for _ in range(CASES):
+        foreign = rng.choice(["375", "380", "44", "49", "1", "998"]) + "".join(rng.choice("0123456789") for _ in range(9))
+        assert normalize_phone(foreign) is None
+        assert normalize_phone(foreign, international=True) == foreign
+        assert normalize_phone("+" + foreign, international=True) == foreign
+
+
+@pytest.mark.parametrize("text", ["", " ", "+", "()", "+7", "+7 (999) 123-45-6", "8-800-555-35-35 доб. 1", "0" * 8])
+def test_garbage_is_rejected(text):
+    assert normalize_phone(text) is None
+    assert normalize_phone(text, international=True) is None
+
+
+@pytest.mark.parametrize("separator", list(SEPARATORS))
+def test_separators(separator):
+    text = f"8{separator}999{separator}123{separator}45{separator}67"
+    assert normalize_phone(text) == "79991234567"
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import signal
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    HANDOVER_CHECK_INTERVAL,
+    WEBHOOK_HANDOVER,
+    WEBHOOK_HOST,
+    WEBHOOK_INSTANCE,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+)
+from shutdown import GracefulDispatcher
+
+
+# Регистрация webhook у Telegram; возвращает адрес или None, если WEBHOOK_URL не задан.
+# При WEBHOOK_HANDOVER к адресу добавляется метка экземпляра: экземпляры за одним прокси
+# регистрируют один и тот же WEBHOOK_URL, и только по метке видно, чья регистрация действует.
+# Маршрут aiohttp сопоставляется по пути, поэтому параметр запроса приёму не мешает
+async def register_webhook(dispatcher: GracefulDispatcher, bot: Bot):
+    if not WEBHOOK_URL:
+        logging.warning("WEBHOOK_URL не задан, webhook не будет зарегистрирован")
+        return None
+
+    url = f"{WEBHOOK_URL}{WEBHOOK_PATH}"
+    if WEBHOOK_HANDOVER:
+        url += f"{'&' if '?' in url else '?'}instance={WEBHOOK_INSTANCE}"
+    await bot.set_webhook(
+        url=url,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+    logging.info(f"Webhook зарегистрирован: {url}")
+    return url
+
+
+# Передача webhook: когда новый экземпляр регистрирует свой адрес (с другой меткой
+# экземпляра), Telegram начинает слать обновления ему, а этот экземпляр дорабатывает
+# начатое и останавливается
+async def watch_handover(bot: Bot, url: str, stop: asyncio.Event):
+    while not stop.is_set():
+        await asyncio.sleep(HANDOVER_CHECK_INTERVAL)
+        try:
+            info = await bot.get_webhook_info()
+        except Exception as e:
+            logging.warning(f"Не удалось проверить webhook: {e}")
+            continue
+        if info.url != url:
+            logging.warning(f"Webhook перешёл к другому экземпляру ({info.url or 'не задан'}), останавливаемся")
+            stop.set()
+
+
+# Создание aiohttp-приложения, которое принимает обновления от Telegram
+def create_app(dispatcher: GracefulDispatcher, bot: Bot) -> web.Application:
+    app = web.Application()
+    # handle_in_background=True: Telegram сразу получает ответ 200,
+    # а обработчики выполняются в фоновой задаче
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+
+    # При остановке приём уже закрыт; фоновые обработчики дорабатывают до того,
+    # как aiogram закроет сессию бота
+    async def drain(app: web.Application):
+        await dispatcher.drain()
+
+    app.on_shutdown.insert(0, drain)
+    return app
+
+
+# Запуск webhook-сервера до SIGTERM/SIGINT (или до передачи webhook другому экземпляру).
+# Webhook регистрируется, когда сервер уже принимает соединения, чтобы первые
+# обновления не ушли в никуда. register=False — webhook регистрирует кто-то другой
+# (супервизор cluster.py)
+async def serve_webhook(dispatcher: GracefulDispatcher, bot: Bot, host: str, port: int, register: bool):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(create_app(dispatcher, bot))
+    await runner.setup()
+    watcher = None
+    try:
+        await web.TCPSite(runner, host, port).start()
+        logging.info(f"Webhook-сервер слушает {host}:{port}")
+        url = await register_webhook(dispatcher, bot) if register else None
+        if url and WEBHOOK_HANDOVER:
+            watcher = asyncio.create_task(watch_handover(bot, url, stop))
+        await stop.wait()
+        logging.info("Остановка: закрываем приём обновлений")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        # Сначала закрывается порт, затем дорабатывают обработчики и закрываются ресурсы
+        await runner.cleanup()
+
+
+# Запуск бота в webhook-режиме (блокирующий вызов)
+def run_webhook(dispatcher: GracefulDispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, register: bool = True):
+    asyncio.run(serve_webhook(dispatcher, bot, host, port, register))